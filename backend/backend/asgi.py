@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Construir o índice espacial de POIs no arranque do worker
+from routes.lifespan import with_lifespan  # noqa: E402
+from routes.services.spatial_index import warm_poi_index  # noqa: E402
+
+warm_poi_index()
+
+# Lifespan: fecha os clientes HTTP assíncronos quando o worker termina
+application = with_lifespan(django_application)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 application = get_wsgi_application()
+
+# Construir o índice espacial de POIs no arranque do worker
+from routes.services.spatial_index import warm_poi_index  # noqa: E402
+
+warm_poi_index()
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class RoutesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "routes"
+
+    def ready(self):
+        from django.db.models.signals import post_save
+        from .models import SimpleTouristPoint
+        from .services.spatial_index import invalidate_poi_index
+
+        # Alterações feitas neste processo (admin, testes) invalidam o índice de imediato.
+        # Sem receiver de post_delete: desligaria o fast delete (o queryset.delete() do load_points
+        # passaria a carregar todas as linhas); os apagamentos invalidam em SimpleTouristPoint.delete()
+        # e o load_points chama bump_dataset_version() no fim da importação.
+        post_save.connect(invalidate_poi_index, sender=SimpleTouristPoint, dispatch_uid="poi_index_save")
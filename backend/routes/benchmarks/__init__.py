@@ -0,0 +1,3 @@
+"""
+Benchmarks offline dos caminhos críticos do serviço de rotas (python manage.py bench).
+"""
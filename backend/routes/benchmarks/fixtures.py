@@ -0,0 +1,178 @@
+"""
+Respostas gravadas do OSRM, Open-Meteo e Nominatim para correr sem rede.
+
+Cada pedido é guardado em FIXTURES_DIR/<host>/<hash do URL>.json. Em modo de gravação
+os pedidos vão aos servidores reais e a resposta é guardada; em modo de reprodução
+pedidos sem gravação recebem uma resposta sintética determinística com o mesmo formato.
+"""
+import hashlib
+import json
+import math
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import unquote
+
+import httpx
+
+from ..services.utils import haversine_distance
+from ..services.nominatim_dispatcher import nominatim_dispatcher
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# Vértices sintéticos: um a cada ~25m, como o overview=full do OSRM em estrada
+SYNTHETIC_STEP = 25.0
+SYNTHETIC_SPEED = {'driving': 13.9, 'cycling': 4.5, 'walking': 1.4}  # m/s
+WEATHER_CODES = (0, 1, 2, 3, 45, 61, 63, 80, 95)
+OSRM_PATH = re.compile(r"/(route|trip|nearest|table)/v1/(\w+)/([^/]+?)(?:\.json)?$")
+
+
+def fixture_path(request, directory=FIXTURES_DIR):
+    digest = hashlib.sha1(str(request.url).encode('utf-8')).hexdigest()[:20]
+    return Path(directory) / request.url.host / f"{digest}.json"
+
+
+def parse_coords(coords_str):
+    return [[float(v) for v in pair.split(',')] for pair in unquote(coords_str).split(';')]
+
+
+def synthetic_line(a, b):
+    """Linha de a para b com um vértice a cada SYNTHETIC_STEP metros e um ligeiro zigue-zague."""
+    n = max(1, int(haversine_distance(a, b) / SYNTHETIC_STEP))
+    line = []
+    for i in range(n):
+        t = i / n
+        wobble = 0.0002 * math.sin(i / 7.0)
+        line.append([round(a[0] + (b[0] - a[0]) * t + wobble, 6), round(a[1] + (b[1] - a[1]) * t, 6)])
+    return line
+
+
+def synthetic_route(coords, profile):
+    geometry, legs, total = [], [], 0.0
+    speed = SYNTHETIC_SPEED.get(profile, SYNTHETIC_SPEED['driving'])
+    for a, b in zip(coords, coords[1:]):
+        leg = synthetic_line(a, b) + [b]
+        distance = haversine_distance(a, b) * 1.3  # estradas não são retas
+        total += distance
+        legs.append({'distance': distance, 'duration': distance / speed, 'summary': '',
+                     'steps': [{'distance': distance, 'duration': distance / speed, 'name': '',
+                                'geometry': {'type': 'LineString', 'coordinates': leg},
+                                'maneuver': {'type': 'depart', 'location': a}}]})
+        geometry.extend(leg if not geometry else leg[1:])
+    return {'distance': total, 'duration': total / speed, 'weight': total / speed,
+            'geometry': {'type': 'LineString', 'coordinates': geometry}, 'legs': legs}
+
+
+def synthetic_osrm(request):
+    match = OSRM_PATH.search(request.url.path)
+    if not match:
+        return 400, {'code': 'InvalidUrl'}
+    service, profile, coords = match.group(1), match.group(2), parse_coords(match.group(3))
+    waypoints = [{'location': c, 'name': '', 'distance': 0.0} for c in coords]
+    if service == 'nearest':
+        return 200, {'code': 'Ok', 'waypoints': waypoints}
+    if service == 'table':
+        params = request.url.params
+        sources = [int(i) for i in params['sources'].split(';')] if 'sources' in params else range(len(coords))
+        dests = [int(i) for i in params['destinations'].split(';')] if 'destinations' in params else range(len(coords))
+        distances = [[haversine_distance(coords[s], coords[d]) * 1.3 for d in dests] for s in sources]
+        return 200, {'code': 'Ok', 'distances': distances,
+                     'durations': [[d / SYNTHETIC_SPEED['driving'] for d in row] for row in distances]}
+    route = synthetic_route(coords, profile)
+    key = 'trips' if service == 'trip' else 'routes'
+    return 200, {'code': 'Ok', key: [route], 'waypoints': waypoints}
+
+
+def synthetic_weather(request):
+    lats = request.url.params['latitude'].split(',')
+    lons = request.url.params['longitude'].split(',')
+    results = []
+    for lat, lon in zip(lats, lons):
+        code = WEATHER_CODES[int(hashlib.md5(f"{lat},{lon}".encode()).hexdigest(), 16) % len(WEATHER_CODES)]
+        results.append({'latitude': float(lat), 'longitude': float(lon),
+                        'current': {'weather_code': code, 'temperature_2m': 18.0}})
+    return 200, results if len(results) > 1 else results[0]
+
+
+def synthetic_nominatim(request):
+    params = request.url.params
+    if request.url.path.rstrip('/').endswith('reverse'):
+        return 200, {'lat': params.get('lat'), 'lon': params.get('lon'),
+                     'display_name': f"{params.get('lat')}, {params.get('lon')}", 'address': {}}
+    query = params.get('q', '')
+    digest = int(hashlib.md5(query.encode('utf-8')).hexdigest(), 16)
+    lat, lon = 37.0 + (digest % 4000) / 1000, -9.5 + (digest // 4000 % 3000) / 1000
+    return 200, [{'lat': f"{lat:.7f}", 'lon': f"{lon:.7f}", 'display_name': query, 'importance': 0.5}]
+
+
+def synthetic_response(request):
+    host = request.url.host
+    if 'open-meteo' in host:
+        return synthetic_weather(request)
+    if 'nominatim' in host:
+        return synthetic_nominatim(request)
+    return synthetic_osrm(request)
+
+
+class FixtureStore:
+    """
+    Handler para httpx.MockTransport: responde com a gravação do pedido, se existir,
+    senão com uma resposta sintética. Com `record`, faz o pedido real e grava-o.
+    """
+
+    def __init__(self, directory=FIXTURES_DIR, record=False):
+        self.directory = Path(directory)
+        self.record = record
+        self.recorded = self.synthetic = 0
+        self._memory = {}
+        self._real = httpx.Client(timeout=30) if record else None
+
+    def load(self, request):
+        path = fixture_path(request, self.directory)
+        if path not in self._memory:
+            try:
+                self._memory[path] = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self._memory[path] = None
+        return self._memory[path]
+
+    def save(self, request, status, data):
+        path = fixture_path(request, self.directory)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({'url': str(request.url), 'status': status, 'json': data}), encoding='utf-8')
+        self._memory[path] = {'status': status, 'json': data}
+
+    def respond(self, request):
+        """(status, json) para o pedido, sem latência nem rede (exceto ao gravar)."""
+        if self.record:
+            real = self._real.send(httpx.Request(request.method, request.url, headers=request.headers))
+            self.save(request, real.status_code, real.json())
+        fixture = self.load(request)
+        if fixture is not None:
+            self.recorded += 1
+            return fixture['status'], fixture['json']
+        self.synthetic += 1
+        return synthetic_response(request)
+
+    def __call__(self, request):
+        status, data = self.respond(request)
+        return httpx.Response(status, json=data)
+
+
+@contextmanager
+def replay_upstreams(directory=FIXTURES_DIR, record=False):
+    """
+    Durante o bloco, todos os http_get (OSRM, Open-Meteo, Nominatim) são servidos pelo FixtureStore.
+    Respostas gravadas não contam para o limite do Nominatim (a gravar continua a contar).
+    """
+    store = FixtureStore(directory, record)
+    client = httpx.Client(transport=httpx.MockTransport(store))
+    try:
+        with patch('routes.services.http_client.get_client', return_value=client), \
+             patch.object(nominatim_dispatcher.bucket, 'rate', nominatim_dispatcher.bucket.rate if record else None):
+            yield store
+    finally:
+        client.close()
+        if store._real is not None:
+            store._real.close()
@@ -0,0 +1,134 @@
+"""
+Gerador de carga para /api/osrm/route/: mistura de pedidos normais, turísticos e climáticos
+com um número fixo de clientes concorrentes (ciclo fechado). Mede latência (p50/p95/p99)
+e débito, no total e por tipo de pedido.
+"""
+import asyncio
+import math
+import random
+import time
+
+import httpx
+
+ROUTE_PATH = '/api/osrm/route/'
+
+# Tipo de pedido -> parâmetros extra; pesos por omissão (mistura realista: a maioria são rotas simples)
+REQUEST_KINDS = {
+    'normal': {},
+    'tourist': {'tourist': 'true'},
+    'climatic': {'climatic': 'true'},
+    'tourist_climatic': {'tourist': 'true', 'climatic': 'true'},
+}
+DEFAULT_MIX = {'normal': 60, 'tourist': 20, 'climatic': 15, 'tourist_climatic': 5}
+
+# (lon, lat) de cidades portuguesas para origens/destinos
+PLACES = [
+    (-9.1393, 38.7223), (-8.6291, 41.1579), (-8.4196, 40.2033), (-7.9304, 37.0194),
+    (-8.4265, 41.5454), (-7.9135, 38.5714), (-8.6538, 40.6405), (-8.8070, 39.7436),
+    (-7.5080, 40.2781), (-9.3817, 38.6979), (-8.8932, 38.5244), (-7.8632, 38.0151),
+]
+# Fração de pedidos dentro de uma cidade (a pé, de bicicleta ou de carro); o resto é entre cidades
+LOCAL_FRACTION = 0.4
+LOCAL_SPREAD = 0.03  # graus à volta do centro
+
+
+def parse_mix(text):
+    """"normal=70,tourist=20,climatic=10" -> {'normal': 70, ...}"""
+    mix = {}
+    for part in filter(None, text.split(',')):
+        kind, _, weight = part.partition('=')
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"Tipo de pedido desconhecido '{kind}' (esperado: {', '.join(REQUEST_KINDS)})")
+        mix[kind] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("A mistura precisa de pelo menos um peso positivo")
+    return mix
+
+
+def random_route_params(rng, kind):
+    if rng.random() < LOCAL_FRACTION:
+        lng, lat = rng.choice(PLACES)
+        origin = (lng + rng.uniform(-LOCAL_SPREAD, LOCAL_SPREAD), lat + rng.uniform(-LOCAL_SPREAD, LOCAL_SPREAD))
+        dest = (lng + rng.uniform(-LOCAL_SPREAD, LOCAL_SPREAD), lat + rng.uniform(-LOCAL_SPREAD, LOCAL_SPREAD))
+        profile = rng.choice(('walking', 'cycling', 'driving'))
+    else:
+        origin, dest = rng.sample(PLACES, 2)
+        profile = 'driving'
+    return {
+        'origin_lng': f"{origin[0]:.5f}", 'origin_lat': f"{origin[1]:.5f}",
+        'dest_lng': f"{dest[0]:.5f}", 'dest_lat': f"{dest[1]:.5f}",
+        'profile': profile, **REQUEST_KINDS[kind],
+    }
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank sobre uma lista já ordenada
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """samples: [(tipo, status ou None, latência ms)] -> estatísticas no total e por tipo."""
+    def stats(items):
+        latencies = sorted(ms for _, _, ms in items)
+        errors = sum(1 for _, status, _ in items if status is None or status >= 400)
+        return {
+            'requests': len(items),
+            'errors': errors,
+            'error_rate': round(errors / len(items), 4) if items else 0.0,
+            'throughput_rps': round(len(items) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else None,
+        }
+
+    by_kind = {}
+    for sample in samples:
+        by_kind.setdefault(sample[0], []).append(sample)
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'total': stats(samples),
+        'by_kind': {kind: stats(items) for kind, items in sorted(by_kind.items())},
+    }
+
+
+async def run_load(base_url, duration=30.0, concurrency=16, mix=None, warmup=0.0, seed=0,
+                   timeout=60.0, max_requests=None, transport=None):
+    """
+    `concurrency` clientes fazem pedidos seguidos durante `warmup` + `duration` segundos
+    (ou até `max_requests`); os pedidos do aquecimento não contam para as estatísticas.
+    """
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    samples = []
+    sent = 0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as client:
+        async def worker(i):
+            nonlocal sent
+            rng = random.Random(seed * 1000 + i)
+            while loop.time() < deadline and (max_requests is None or sent < max_requests):
+                sent += 1
+                kind = rng.choices(kinds, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await client.get(ROUTE_PATH, params=random_route_params(rng, kind))
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = None
+                if loop.time() >= measure_from:
+                    samples.append((kind, status, round((time.perf_counter() - start) * 1000, 3)))
+
+        await asyncio.gather(*[worker(i) for i in range(concurrency)])
+
+    return summarize(samples, max(1e-9, loop.time() - max(measure_from, started)))
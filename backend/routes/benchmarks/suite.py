@@ -0,0 +1,265 @@
+"""
+Microbenchmarks dos caminhos críticos: get_route (todos os modos), pesquisa de POIs por
+densidade, segmentação climática por tamanho de geometria e débito do load_points.
+Os pedidos externos são servidos pelas gravações (ver fixtures.py), por isso os tempos
+medem só o nosso código. As gravações não vêm no repositório: `manage.py bench --record`
+(com rede) cria-as em routes/benchmarks/fixtures/; sem elas tudo é sintético e o bench avisa.
+"""
+import contextlib
+import io
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from django.core.management import call_command
+
+from ..models import SimpleTouristPoint
+from ..services.cache import clear_caches
+from ..services.geocoding_service import get_geocode
+from ..services.osrm_service import build_climatic_segments, get_route
+from ..services.spatial_index import PoiGridIndex, get_poi_index, invalidate_poi_index
+from ..services.tourism_service import find_pois_near_point_local
+from .fixtures import FIXTURES_DIR, replay_upstreams, synthetic_line
+
+REPORT_VERSION = 1
+
+PRESETS = {
+    'full': {
+        'repeat': 15,
+        'poi_density': (1000, 10000, 100000),
+        'geometry_length': (1000, 10000, 100000),
+        'load_rows': (10000, 50000),
+    },
+    'quick': {
+        'repeat': 3,
+        'poi_density': (100, 1000),
+        'geometry_length': (100, 1000),
+        'load_rows': (500,),
+    },
+}
+
+# (perfil, origem, destino) em (lon, lat)
+ROUTES = {
+    'lisboa_porto': ('driving', (-9.1393, 38.7223), (-8.6291, 41.1579)),
+    'lisboa_centro': ('walking', (-9.2160, 38.6916), (-9.1335, 38.7139)),
+}
+ROUTE_MODES = {
+    'plain': {},
+    'tourist': {'is_tourist': True},
+    'climatic': {'is_climatic': True},
+    'tourist_climatic': {'is_tourist': True, 'is_climatic': True},
+}
+POI_QUERIES = 200
+POI_RADIUS = 500
+# Caixa à volta de Lisboa onde são espalhados os POIs sintéticos
+POI_BBOX = (38.60, -9.30, 38.85, -9.05)
+LOAD_HEADER = "@type\t@id\t@lat\t@lon\tname\ttourism\thistoric\n"
+
+
+def measure(fn, repeat, setup=None):
+    """Corre `fn` `repeat` vezes (com `setup` antes de cada uma, fora do tempo) e devolve estatísticas em ms."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'runs': len(times),
+        'min_ms': round(times[0], 4),
+        'median_ms': round(statistics.median(times), 4),
+        'mean_ms': round(statistics.fmean(times), 4),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 4),
+        'max_ms': round(times[-1], 4),
+    }
+
+
+def result(name, params, stats, **extra):
+    return {'name': name, 'params': params, **stats, **extra}
+
+
+def random_points(n, seed=0):
+    rng = random.Random(seed)
+    min_lat, min_lng, max_lat, max_lng = POI_BBOX
+    return [(rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)) for _ in range(n)]
+
+
+def seed_route_pois(per_route=300):
+    """POIs sintéticos ao longo das rotas de teste (para o modo turístico ter desvios)."""
+    rng = random.Random(1)
+    objs = []
+    for name, (_, origin, dest) in ROUTES.items():
+        for i in range(per_route):
+            t = rng.random()
+            lng = origin[0] + (dest[0] - origin[0]) * t + rng.uniform(-0.01, 0.01)
+            lat = origin[1] + (dest[1] - origin[1]) * t + rng.uniform(-0.01, 0.01)
+            objs.append(SimpleTouristPoint(source_key=f"bench/{name}/{i}", name=f"{name} {i}",
+                                           category='attraction', lat=lat, lng=lng))
+    SimpleTouristPoint.objects.all().delete()
+    SimpleTouristPoint.objects.bulk_create(objs)
+    invalidate_poi_index()
+    get_poi_index()
+
+
+def bench_get_route(repeat):
+    seed_route_pois()
+    results = []
+    for route_name, (profile, origin, dest) in ROUTES.items():
+        for mode, flags in ROUTE_MODES.items():
+            params = {'route': route_name, 'profile': profile, 'mode': mode}
+            run = lambda: get_route(profile, origin, dest, **flags)
+            # Frio: caches vazias (custo de CPU de tudo o que vem depois dos pedidos)
+            results.append(result('get_route', {**params, 'cache': 'cold'}, measure(run, repeat, clear_caches)))
+            run()
+            results.append(result('get_route', {**params, 'cache': 'warm'}, measure(run, repeat)))
+    return results
+
+
+def bench_poi_lookup(densities, repeat):
+    results = []
+    queries = random_points(POI_QUERIES, seed=42)
+    for n in densities:
+        points = [{'id': i, 'lat': lat, 'lon': lng, 'name': f"P{i}", 'category': 'x'}
+                  for i, (lat, lng) in enumerate(random_points(n))]
+        build = measure(lambda: PoiGridIndex(points), max(1, repeat // 3))
+        index = PoiGridIndex(points)
+
+        def run():
+            for lat, lng in queries:
+                find_pois_near_point_local(lat, lng, POI_RADIUS)
+
+        with patch('routes.services.tourism_service.get_poi_index', return_value=index):
+            stats = measure(run, repeat)
+        params = {'points': n, 'queries': POI_QUERIES, 'radius': POI_RADIUS}
+        results.append(result('find_pois_near_point_local', params, stats,
+                              per_query_us=round(stats['median_ms'] * 1000 / POI_QUERIES, 3)))
+        results.append(result('poi_index_build', {'points': n}, build))
+    return results
+
+
+def bench_segmentation(lengths, repeat):
+    results = []
+    for n in lengths:
+        # Linha com n vértices (um a cada ~25m), como a geometria de uma rota real
+        geometry = synthetic_line((-9.14, 38.72), (-9.14 + n * 25 / 87000, 38.72 + n * 25 / 111320 * 0.2))[:n]
+        total = n * 25.0
+        stats = measure(lambda: build_climatic_segments(geometry, total), repeat)
+        results.append(result('build_climatic_segments', {'vertices': len(geometry), 'distance_m': total}, stats))
+    return results
+
+
+def bench_load_points(row_counts, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch('routes.management.commands.load_points.bump_dataset_version', invalidate_poi_index):
+        for n in row_counts:
+            path = os.path.join(tmp, f"pois_{n}.csv")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(LOAD_HEADER)
+                for i, (lat, lng) in enumerate(random_points(n, seed=n)):
+                    f.write(f"node\t{i}\t{lat:.7f}\t{lng:.7f}\tPonto {i}\tattraction\t\n")
+
+            for mode, args in (('full', ()), ('incremental_unchanged', ('--incremental',))):
+                if mode == 'incremental_unchanged':
+                    call_command('load_points', path, stdout=io.StringIO())
+                run = lambda: call_command('load_points', path, *args, stdout=io.StringIO())
+                stats = measure(run, max(1, repeat // 3))
+                results.append(result('load_points', {'rows': n, 'mode': mode}, stats,
+                                      rows_per_s=round(n / (stats['median_ms'] / 1000))))
+    return results
+
+
+def bench_geocode(repeat):
+    addresses = [f"Rua {i}, Lisboa" for i in range(100)]
+
+    def run():
+        for address in addresses:
+            get_geocode(address)
+
+    return [
+        result('get_geocode', {'addresses': len(addresses), 'cache': 'cold'}, measure(run, repeat, clear_caches)),
+        result('get_geocode', {'addresses': len(addresses), 'cache': 'warm'}, measure(run, repeat)),
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(preset='full', fixtures_dir=FIXTURES_DIR, record=False, only=None, sizes=None):
+    """
+    Corre os benchmarks e devolve o relatório (dict serializável em JSON).
+    `only` limita a grupos ('route', 'poi', 'segments', 'load', 'geocode'); `sizes` sobrepõe-se ao preset.
+    Escreve na BD (POIs sintéticos): correr numa BD de teste.
+    """
+    config = {**PRESETS[preset], **(sizes or {})}
+    repeat = config['repeat']
+    groups = {
+        'segments': lambda: bench_segmentation(config['geometry_length'], repeat),
+        'poi': lambda: bench_poi_lookup(config['poi_density'], repeat),
+        'load': lambda: bench_load_points(config['load_rows'], repeat),
+        'route': lambda: bench_get_route(repeat),
+        'geocode': lambda: bench_geocode(repeat),
+    }
+
+    results = []
+    started = time.perf_counter()
+    # Os prints dos serviços (ex: "Pintura Climática") não interessam aqui
+    with replay_upstreams(fixtures_dir, record) as store, contextlib.redirect_stdout(io.StringIO()):
+        for name, bench in groups.items():
+            if only and name not in only:
+                continue
+            results.extend(bench())
+    clear_caches()
+    invalidate_poi_index()
+
+    return {
+        'version': REPORT_VERSION,
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'preset': preset,
+            'elapsed_s': round(time.perf_counter() - started, 2),
+            'upstream_responses': {'recorded': store.recorded, 'synthetic': store.synthetic},
+            # Sem gravações os casos de rota/geocode medem respostas sintéticas (ver fixtures.py)
+            'synthetic_only': store.synthetic > 0 and store.recorded == 0,
+        },
+        'results': results,
+    }
+
+
+def result_key(item):
+    return item['name'], tuple(sorted(item['params'].items()))
+
+
+def compare_reports(baseline, current, threshold=1.2):
+    """
+    Compara as medianas com um relatório anterior. Devolve [(nome, params, antes, depois, rácio), ...]
+    dos casos em que o rácio depois/antes passa `threshold`.
+    """
+    before = {result_key(item): item for item in baseline.get('results', [])}
+    regressions = []
+    for item in current['results']:
+        old = before.get(result_key(item))
+        if not old or not old['median_ms']:
+            continue
+        ratio = item['median_ms'] / old['median_ms']
+        if ratio > threshold:
+            regressions.append((item['name'], item['params'], old['median_ms'], item['median_ms'], round(ratio, 2)))
+    return regressions
@@ -0,0 +1,149 @@
+"""
+Servidor HTTP local que substitui o OSRM, o Open-Meteo e o Nominatim nos testes de carga.
+
+Responde com as gravações de fixtures.py (ou respostas sintéticas) nos caminhos de
+config.STANDIN_PATHS, com latência e erros injetados configuráveis por serviço.
+A aplicação aponta para ele com BETTERMAPS_UPSTREAM_URL=http://127.0.0.1:<porta>.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..services.config import STANDIN_PATHS
+from ..services.osrm_service import osrm_base_url
+from ..services.utils import base_url
+from .fixtures import FIXTURES_DIR, FixtureStore
+
+SERVICES = ('osrm', 'nominatim', 'open-meteo')
+
+
+def public_base_url(server):
+    # O URL que a aplicação usaria sem o servidor local (é a chave das gravações)
+    if STANDIN_PATHS[server].startswith('/osrm/'):
+        return osrm_base_url(server)
+    return base_url(server, 'https')
+
+
+# Caminho local -> (serviço, URL público), do prefixo mais longo para o mais curto
+UPSTREAMS = sorted(
+    ((path, path.strip('/').split('/')[0], public_base_url(server)) for server, path in STANDIN_PATHS.items()),
+    key=lambda item: -len(item[0]),
+)
+
+
+@dataclass(frozen=True)
+class Faults:
+    """Latência e erros injetados num serviço."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0  # desvio padrão (normal, truncada em 0)
+    error_rate: float = 0.0  # fração de pedidos com `error_status`
+    error_status: int = 503
+    slow_rate: float = 0.0  # fração de pedidos com mais `slow_ms` (caudas longas / timeouts)
+    slow_ms: float = 0.0
+
+    def delay(self, rng):
+        ms = max(0.0, rng.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms)
+        if self.slow_rate and rng.random() < self.slow_rate:
+            ms += self.slow_ms
+        return ms / 1000
+
+
+def resolve(path):
+    """Caminho local -> (serviço, URL público equivalente) ou None."""
+    for prefix, service, public in UPSTREAMS:
+        if path == prefix or path.startswith(prefix + '/'):
+            return service, public + path[len(prefix):]
+    return None
+
+
+class UpstreamStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store=None, faults=Faults(), service_faults=None, seed=None, verbose=False):
+        super().__init__(address, StandInHandler)
+        self.store = store or FixtureStore(FIXTURES_DIR)
+        self.faults = {name: (service_faults or {}).get(name, faults) for name in SERVICES}
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {name: {'requests': 0, 'injected_errors': 0} for name in SERVICES}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self, service):
+        # random.Random não é seguro entre threads
+        faults = self.faults[service]
+        with self.lock:
+            delay = faults.delay(self.rng)
+            fail = faults.error_rate and self.rng.random() < faults.error_rate
+            counters = self.counters[service]
+            counters['requests'] += 1
+            counters['injected_errors'] += bool(fail)
+        return delay, faults.error_status if fail else None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como os servidores reais
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == '/__stats':
+            return self.send_json(200, {'services': self.server.counters,
+                                        'recorded': self.server.store.recorded,
+                                        'synthetic': self.server.store.synthetic})
+        target = resolve(parts.path)
+        if target is None:
+            return self.send_json(404, {'error': f'Unknown upstream path {parts.path}'})
+
+        service, public_url = target
+        delay, error_status = self.server.draw(service)
+        if delay:
+            time.sleep(delay)
+        if error_status:
+            return self.send_json(error_status, {'error': 'Injected error'})
+
+        url = public_url + (f"?{parts.query}" if parts.query else "")
+        try:
+            status, data = self.server.store.respond(httpx.Request('GET', url))
+        except Exception as e:
+            return self.send_json(500, {'error': str(e)})
+        self.send_json(status, data)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def parse_service_faults(specs, base):
+    """["open-meteo:latency_ms=300,error_rate=0.1", ...] -> {serviço: Faults}"""
+    result = {}
+    for spec in specs or ():
+        service, _, options = spec.partition(':')
+        if service not in SERVICES:
+            raise ValueError(f"Serviço desconhecido '{service}' (esperado: {', '.join(SERVICES)})")
+        values = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            field = Faults.__dataclass_fields__.get(key)
+            if field is None:
+                raise ValueError(f"Opção desconhecida '{key}'")
+            values[key] = int(value) if field.type in (int, 'int') else float(value)
+        result[service] = replace(result.get(service, base), **values)
+    return result
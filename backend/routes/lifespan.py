@@ -0,0 +1,22 @@
+from .services.http_client import aclose_clients, register_server_loop
+
+
+def with_lifespan(application):
+    """
+    O ASGIHandler do Django não trata o protocolo lifespan: este invólucro regista no arranque
+    o event loop do servidor (os seus pedidos usam AsyncClients partilhados) e, no fim do
+    worker, fecha esses httpx.AsyncClient.
+    """
+    async def app(scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                register_server_loop()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await aclose_clients()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    return app
@@ -0,0 +1,78 @@
+import json
+import tempfile
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from routes.benchmarks.fixtures import FIXTURES_DIR
+from routes.benchmarks.suite import PRESETS, compare_reports, run_suite
+from routes.services.persistent_cache import PersistentStore, get_store, use_store
+
+GROUPS = ('route', 'poi', 'segments', 'load', 'geocode')
+
+
+class Command(BaseCommand):
+    help = 'Corre os microbenchmarks offline (OSRM/Open-Meteo/Nominatim gravados) e grava um relatório JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(PRESETS), default='full')
+        parser.add_argument('--quick', action='store_const', const='quick', dest='preset',
+                            help='Tamanhos pequenos (equivale a --preset quick)')
+        parser.add_argument('--only', nargs='+', choices=GROUPS, help='Só estes grupos de benchmarks')
+        parser.add_argument('--output', default='benchmark-report.json', help='Ficheiro do relatório JSON')
+        parser.add_argument('--compare', help='Relatório anterior para comparar as medianas')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Rácio da mediana acima do qual um caso conta como regressão')
+        parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Pasta das respostas gravadas')
+        parser.add_argument('--record', action='store_true',
+                            help='Faz os pedidos aos servidores reais e grava as respostas')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Erro ao ler o relatório '{options['compare']}': {e}")
+
+        # Os benchmarks escrevem POIs sintéticos e esvaziam as caches: BD de teste e cache
+        # persistente descartáveis, nunca as reais
+        old_name, old_store = connection.settings_dict['NAME'], get_store()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            use_store(PersistentStore(Path(tmp) / 'cache.sqlite3'))
+            try:
+                report = run_suite(options['preset'], options['fixtures'], options['record'], options['only'])
+            finally:
+                use_store(old_store)
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        for item in report['results']:
+            params = ", ".join(f"{k}={v}" for k, v in item['params'].items())
+            self.stdout.write(f"{item['name']:<28} {params:<80} mediana {item['median_ms']:>10.3f} ms")
+        upstream = report['meta']['upstream_responses']
+        self.stdout.write(self.style.SUCCESS(
+            f"Relatório em {options['output']} ({len(report['results'])} casos, "
+            f"{upstream['recorded']} respostas gravadas, {upstream['synthetic']} sintéticas)."
+        ))
+
+        if report['meta']['synthetic_only']:
+            self.stderr.write(self.style.WARNING(
+                f"AVISO: nenhuma resposta gravada em {options['fixtures']}: todos os pedidos ao OSRM, "
+                "Open-Meteo e Nominatim foram respondidos com dados sintéticos. Os tempos de rota e geocode "
+                "não refletem respostas reais; grave-as com --record (precisa de rede)."
+            ))
+        if baseline is not None:
+            if baseline.get('meta', {}).get('synthetic_only') != report['meta']['synthetic_only']:
+                self.stderr.write(self.style.WARNING(
+                    f"AVISO: {options['compare']} e este relatório não usam as mesmas respostas (gravadas vs sintéticas)."
+                ))
+            regressions = compare_reports(baseline, report, options['threshold'])
+            for name, params, before, after, ratio in regressions:
+                self.stdout.write(self.style.ERROR(f"REGRESSÃO {name} {params}: {before:.3f} -> {after:.3f} ms (x{ratio})"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressões acima de x{options['threshold']}")
+            self.stdout.write(self.style.SUCCESS(f"Sem regressões face a {options['compare']}."))
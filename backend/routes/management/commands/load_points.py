@@ -1,86 +1,145 @@
-import csv
 import os
-import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from routes.models import SimpleTouristPoint
+from routes.services.poi_import import iter_points, parse_file
+from routes.services.spatial_index import bump_dataset_version
 
-# Aumentar o limite de tamanho de campo do CSV para evitar erros em linhas gigantes
-csv.field_size_limit(sys.maxsize)
+BATCH_SIZE = 10000
+UPDATE_FIELDS = ['name', 'category', 'lat', 'lng']
 
 
 class Command(BaseCommand):
-    help = 'Carrega pontos turísticos de um CSV localizado na pasta /data'
+    help = 'Carrega pontos turísticos de um ou mais CSVs localizados na pasta /data'
 
     def add_arguments(self, parser):
-        parser.add_argument('filename', type=str, help='O nome do ficheiro CSV dentro da pasta data/')
+        parser.add_argument('filenames', nargs='+', type=str,
+                            help='O(s) nome(s) do(s) ficheiro(s) CSV dentro da pasta data/')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Só insere/atualiza as linhas que mudaram (pela identidade OSM) em vez de apagar tudo')
+        parser.add_argument('--prune', action='store_true',
+                            help='Com --incremental, apaga os pontos que já não existem nos ficheiros')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processos para ler vários ficheiros em paralelo')
 
     def handle(self, *args, **kwargs):
-        filename = kwargs['filename']
         data_dir = os.path.join(settings.BASE_DIR, 'data')
-        file_path = os.path.join(data_dir, filename)
+        file_paths = []
+        for filename in kwargs['filenames']:
+            file_path = os.path.join(data_dir, filename)
+            if not os.path.exists(file_path):
+                raise CommandError(f"Ficheiro '{filename}' não encontrado em {data_dir}.")
+            file_paths.append(file_path)
 
-        if not os.path.exists(file_path):
-            raise CommandError(f"Ficheiro '{filename}' não encontrado em {data_dir}.")
-
-        self.stdout.write(self.style.WARNING(f"A ler ficheiro: {file_path}"))
+        self.stdout.write(self.style.WARNING(f"A ler ficheiro(s): {', '.join(file_paths)}"))
+        start = time.perf_counter()
 
+        try:
+            tune_sqlite_for_bulk_writes()
+            # Uma só transação: os leitores continuam a ver os dados antigos até ao fim
+            with transaction.atomic():
+                if kwargs['incremental']:
+                    stats = self.load_incremental(self.read_points(file_paths, kwargs['workers']), kwargs['prune'])
+                else:
+                    stats = self.load_full(self.read_points(file_paths, kwargs['workers']))
+        except Exception as e:
+            raise CommandError(f"Erro ao processar o ficheiro: {e}")
+
+        if stats['inserted'] or stats['updated'] or stats['deleted']:
+            # Avisar os workers para reconstruírem o índice espacial
+            bump_dataset_version()
+
+        elapsed = time.perf_counter() - start
+        rate = stats['read'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"CONCLUÍDO! {stats['read']} pontos lidos em {elapsed:.1f}s ({rate:,.0f} linhas/s): "
+            f"{stats['inserted']} novos, {stats['updated']} atualizados, "
+            f"{stats['unchanged']} sem alterações, {stats['deleted']} apagados."
+        ))
+
+    def read_points(self, file_paths, workers):
+        """Gera os pontos de todos os ficheiros; com vários ficheiros e workers > 1 lê-os em paralelo."""
+        if workers > 1 and len(file_paths) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as pool:
+                for points in pool.map(parse_file, file_paths):
+                    yield from points
+        else:
+            for file_path in file_paths:
+                yield from iter_points(file_path)
+
+    def load_full(self, points):
         print("A apagar dados antigos da BD...")
-        SimpleTouristPoint.objects.all().delete()
+        deleted, _ = SimpleTouristPoint.objects.all().delete()
 
         print("A carregar novos dados (isto pode demorar um pouco)...")
-        points_to_create = []
-        count = 0
-
-        try:
-            with open(file_path, 'r', encoding='utf-8') as csvfile:
-                # O Overpass Turbo configurámos para usar TAB (\t)
-                reader = csv.DictReader(csvfile, delimiter='\t')
-
-                for row in reader:
-                    try:
-                        name = row.get('name')
-                        if not name: continue
-
-                        # Tentar descobrir a categoria olhando para todas as colunas possíveis
-                        cat = (
-                                row.get('tourism') or
-                                row.get('historic') or
-                                row.get('amenity') or
-                                row.get('natural') or
-                                row.get('leisure') or
-                                'ponto de interesse'
-                        )
-
-                        if not row.get('@lat') or not row.get('@lon'):
-                            continue
-
-                        points_to_create.append(SimpleTouristPoint(
-                            name=name,
-                            category=cat,
-                            lat=float(row['@lat']),
-                            lng=float(row['@lon'])
-                        ))
-
-                        count += 1
-
-                        # Salvar em blocos de 10.000 para não encher a memória do PC
-                        if len(points_to_create) >= 10000:
-                            SimpleTouristPoint.objects.bulk_create(points_to_create)
-                            points_to_create = []
-                            print(f"Processados {count} pontos...")
-
-                    except ValueError:
-                        continue
-                    except Exception as e:
-                        # print(f"Erro na linha: {e}") # Comentado para não poluir o terminal
-                        pass
-
-            # Salvar os restantes
-            if points_to_create:
-                SimpleTouristPoint.objects.bulk_create(points_to_create)
-
-            self.stdout.write(self.style.SUCCESS(f"CONCLUÍDO! Total de {count} pontos de Portugal carregados."))
-
-        except Exception as e:
-            raise CommandError(f"Erro ao processar o ficheiro: {e}")
\ No newline at end of file
+        stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': deleted}
+        batch = {}
+        for key, name, cat, lat, lng in points:
+            stats['read'] += 1
+            batch[key] = SimpleTouristPoint(source_key=key, name=name, category=cat, lat=lat, lng=lng)
+
+            # Salvar em blocos de 10.000 para não encher a memória do PC
+            if len(batch) >= BATCH_SIZE:
+                self.upsert(batch.values())
+                stats['inserted'] += len(batch)
+                batch = {}
+                print(f"Processados {stats['read']} pontos...")
+
+        # Salvar os restantes
+        self.upsert(batch.values())
+        stats['inserted'] += len(batch)
+        return stats
+
+    def load_incremental(self, points, prune):
+        existing = {
+            key: (name, cat, lat, lng)
+            for key, name, cat, lat, lng in SimpleTouristPoint.objects.values_list(
+                'source_key', 'name', 'category', 'lat', 'lng').iterator(chunk_size=BATCH_SIZE)
+        }
+        stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        seen = set()
+        batch = {}
+        for key, name, cat, lat, lng in points:
+            stats['read'] += 1
+            seen.add(key)
+            current = existing.get(key)
+            if current == (name, cat, lat, lng):
+                stats['unchanged'] += 1
+                continue
+            stats['inserted' if current is None else 'updated'] += 1
+            batch[key] = SimpleTouristPoint(source_key=key, name=name, category=cat, lat=lat, lng=lng)
+            if len(batch) >= BATCH_SIZE:
+                self.upsert(batch.values())
+                batch = {}
+                print(f"Processados {stats['read']} pontos...")
+        self.upsert(batch.values())
+
+        if prune:
+            stale = [key for key in existing if key not in seen]
+            for i in range(0, len(stale), BATCH_SIZE):
+                deleted, _ = SimpleTouristPoint.objects.filter(source_key__in=stale[i:i + BATCH_SIZE]).delete()
+                stats['deleted'] += deleted
+        return stats
+
+    def upsert(self, objs):
+        objs = list(objs)
+        if objs:
+            SimpleTouristPoint.objects.bulk_create(
+                objs, batch_size=BATCH_SIZE // 10, update_conflicts=True,
+                unique_fields=['source_key'], update_fields=UPDATE_FIELDS,
+            )
+
+
+def tune_sqlite_for_bulk_writes():
+    """WAL (leitores não bloqueiam durante a importação) e menos fsyncs; só em SQLite."""
+    # Os PRAGMAs não podem mudar dentro de uma transação já aberta (ex: testes)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-65536")  # 64MB
@@ -0,0 +1,47 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from routes.benchmarks.loadgen import DEFAULT_MIX, parse_mix, run_load
+
+
+class Command(BaseCommand):
+    help = 'Gera carga em /api/osrm/route/ (mistura normal/turística/climática) e mede p50/p95/p99 e débito'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL base da aplicação')
+        parser.add_argument('--duration', type=float, default=30.0, help='Segundos de medição')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Segundos iniciais que não contam')
+        parser.add_argument('--concurrency', type=int, default=16, help='Clientes em simultâneo')
+        parser.add_argument('--mix', default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                            help='Pesos por tipo de pedido, ex: "normal=70,tourist=20,climatic=10"')
+        parser.add_argument('--requests', type=int, help='Parar ao fim de N pedidos')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Timeout por pedido (s)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ficheiro JSON com o relatório')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.WARNING(
+            f"A gerar carga em {options['url']} ({options['concurrency']} clientes, {options['duration']}s)..."))
+        report = asyncio.run(run_load(
+            options['url'], options['duration'], options['concurrency'], mix, options['warmup'],
+            options['seed'], options['timeout'], options['requests'],
+        ))
+        report['config'] = {key: options[key] for key in ('url', 'duration', 'warmup', 'concurrency', 'seed')}
+        report['config']['mix'] = mix
+
+        rows = [('total', report['total'])] + list(report['by_kind'].items())
+        self.stdout.write(f"{'tipo':<18}{'pedidos':>9}{'erros':>7}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for kind, s in rows:
+            p = [f"{s[k]:.1f}" if s[k] is not None else '-' for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+            self.stdout.write(f"{kind:<18}{s['requests']:>9}{s['errors']:>7}{s['throughput_rps']:>9}"
+                              f"{p[0]:>10}{p[1]:>10}{p[2]:>10}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Relatório em {options['output']}"))
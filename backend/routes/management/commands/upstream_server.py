@@ -0,0 +1,46 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from routes.benchmarks.fixtures import FIXTURES_DIR, FixtureStore
+from routes.benchmarks.upstream_server import Faults, UpstreamStandIn, parse_service_faults
+
+
+class Command(BaseCommand):
+    help = ('Servidor local que substitui o OSRM, Open-Meteo e Nominatim (respostas gravadas, '
+            'latência e erros injetados). Usar com BETTERMAPS_UPSTREAM_URL=http://<host>:<porta>')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Pasta das respostas gravadas')
+        parser.add_argument('--latency', type=float, default=0.0, help='Latência média (ms)')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Desvio padrão da latência (ms)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fração de pedidos com erro')
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--slow-rate', type=float, default=0.0, help='Fração de pedidos muito lentos')
+        parser.add_argument('--slow-ms', type=float, default=0.0, help='Latência extra dos pedidos lentos (ms)')
+        parser.add_argument('--service', action='append', default=[],
+                            help='Por serviço, ex: "open-meteo:latency_ms=300,error_rate=0.05" (repetível)')
+        parser.add_argument('--seed', type=int, help='Semente da injeção de latência/erros')
+        parser.add_argument('--verbose', action='store_true', help='Registar cada pedido')
+
+    def handle(self, *args, **options):
+        faults = Faults(options['latency'], options['jitter'], options['error_rate'],
+                        options['error_status'], options['slow_rate'], options['slow_ms'])
+        try:
+            service_faults = parse_service_faults(options['service'], faults)
+            server = UpstreamStandIn((options['host'], options['port']), FixtureStore(options['fixtures']),
+                                     faults, service_faults, options['seed'], options['verbose'])
+        except (ValueError, OSError) as e:
+            raise CommandError(f"Erro ao iniciar o servidor: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Servidor de substituição em {server.url}"))
+        for service, service_faults in server.faults.items():
+            self.stdout.write(f"  {service}: {service_faults}")
+        self.stdout.write(f"Apontar a aplicação com: BETTERMAPS_UPSTREAM_URL={server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(json.dumps(server.counters))
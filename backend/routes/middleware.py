@@ -0,0 +1,83 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .services.config import REQUEST_BUDGET_DEFAULT, REQUEST_BUDGET_MAX
+from .services.resilience import deadline
+from .services.metrics import (
+    http_responses, http_seconds, server_timing_header, start_request_timings, stop_request_timings
+)
+
+
+class ServerTimingMiddleware:
+    """
+    Mede cada pedido (histograma por rota) e devolve os tempos das etapas
+    (osrm_base, pois, osrm_final, segmentation, weather, ...) no cabeçalho Server-Timing.
+    Nas respostas em streaming só entram as etapas anteriores ao primeiro evento.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = start_request_timings()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings, token = start_request_timings()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request_timings(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        http_seconds.observe(elapsed, route, request.method)
+        http_responses.inc(route, str(response.status_code))
+        response['Server-Timing'] = server_timing_header(timings, elapsed)
+        return response
+
+
+def request_budget(request):
+    """Segundos disponíveis para o pedido: X-Request-Budget (ms) do cliente, limitado a REQUEST_BUDGET_MAX."""
+    try:
+        budget = float(request.headers['X-Request-Budget']) / 1000
+    except (KeyError, ValueError):
+        return REQUEST_BUDGET_DEFAULT
+    return min(max(budget, 0.0), REQUEST_BUDGET_MAX)
+
+
+class DeadlineMiddleware:
+    """
+    Define o prazo do pedido: os pedidos às APIs externas feitos durante a view encurtam o
+    timeout para o tempo que resta e falham logo (DeadlineExceeded) quando já não há tempo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with deadline(request_budget(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with deadline(request_budget(request)):
+            return await self.get_response(request)
@@ -0,0 +1,51 @@
+import hashlib
+from collections import Counter
+
+from django.db import migrations, models
+
+
+# Cópia congelada de poi_import.source_key/dedupe_key (sem @type/@id): as migrações não
+# importam código da app, que pode mudar depois de a migração ter corrido.
+def source_key(name, lat, lng):
+    digest = hashlib.sha1(f"{name}|{float(lat):.7f}|{float(lng):.7f}".encode('utf-8')).hexdigest()
+    return f"h:{digest[:24]}"
+
+
+def dedupe_key(key, seen):
+    seen[key] += 1
+    return key if seen[key] == 1 else f"{key}#{seen[key]}"
+
+
+def backfill_source_key(apps, schema_editor):
+    SimpleTouristPoint = apps.get_model('routes', 'SimpleTouristPoint')
+    seen = Counter()
+    batch = []
+    for poi in SimpleTouristPoint.objects.order_by('id').iterator(chunk_size=10000):
+        poi.source_key = dedupe_key(source_key(poi.name, poi.lat, poi.lng), seen)
+        batch.append(poi)
+        if len(batch) >= 10000:
+            SimpleTouristPoint.objects.bulk_update(batch, ['source_key'])
+            batch = []
+    if batch:
+        SimpleTouristPoint.objects.bulk_update(batch, ['source_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simpletouristpoint',
+            name='source_key',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_source_key, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='simpletouristpoint',
+            name='source_key',
+            field=models.CharField(max_length=64, null=True, unique=True),
+        ),
+    ]
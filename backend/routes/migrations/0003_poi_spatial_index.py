@@ -0,0 +1,60 @@
+from django.db import migrations, models
+
+RTREE_TABLE = 'routes_poi_rtree'
+POI_TABLE = 'routes_simpletouristpoint'
+
+
+def sqlite_has_rtree(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any('ENABLE_RTREE' in row[0] for row in cursor.fetchall())
+
+
+def create_rtree(apps, schema_editor):
+    # Só em SQLite com o módulo R*Tree; nos outros motores fica o índice B-tree (lat, lng).
+    # DELETE + INSERT nos triggers: um upsert (ON CONFLICT DO UPDATE) dispara o de insert e o de
+    # update, e o INSERT OR REPLACE seria ignorado pela política de conflito do comando exterior
+    if not sqlite_has_rtree(schema_editor):
+        return
+    statements = [
+        f"CREATE VIRTUAL TABLE {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+        f"INSERT INTO {RTREE_TABLE} SELECT id, lat, lat, lng, lng FROM {POI_TABLE}",
+        f"""CREATE TRIGGER {RTREE_TABLE}_insert AFTER INSERT ON {POI_TABLE} BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = new.id;
+            INSERT INTO {RTREE_TABLE} VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+        END""",
+        f"""CREATE TRIGGER {RTREE_TABLE}_update AFTER UPDATE OF lat, lng ON {POI_TABLE} BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = new.id;
+            INSERT INTO {RTREE_TABLE} VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+        END""",
+        f"""CREATE TRIGGER {RTREE_TABLE}_delete AFTER DELETE ON {POI_TABLE} BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+        END""",
+    ]
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'update', 'delete'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {RTREE_TABLE}_{trigger}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0002_simpletouristpoint_source_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='simpletouristpoint',
+            index=models.Index(fields=['lat', 'lng'], name='routes_poi_lat_lng_idx'),
+        ),
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -1,10 +1,74 @@
-from django.db import models
+import math
+
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .services.spatial_index import METERS_PER_DEG_LAT, invalidate_poi_index
+from .services.utils import haversine_distance
+
+RTREE_TABLE = 'routes_poi_rtree'  # criada pela migração 0003 (só SQLite)
+_rtree_available = {}
+
+
+def rtree_available(alias):
+    # Verificado uma vez por ligação: a tabela R*Tree só existe em SQLite com o módulo rtree
+    if alias not in _rtree_available:
+        connection = connections[alias]
+        _rtree_available[alias] = (
+            connection.vendor == 'sqlite' and RTREE_TABLE in connection.introspection.table_names()
+        )
+    return _rtree_available[alias]
+
+
+class SimpleTouristPointQuerySet(models.QuerySet):
+
+    def in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """POIs dentro da caixa; em SQLite passa pela R*Tree, nos outros motores pelo índice (lat, lng)."""
+        qs = self
+        if rtree_available(self.db):
+            # A R*Tree guarda float32: serve de pré-filtro, o filtro exato é feito a seguir
+            qs = qs.filter(id__in=RawSQL(
+                f"SELECT id FROM {RTREE_TABLE} WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s",
+                (min_lat, max_lat, min_lng, max_lng),
+            ))
+        return qs.filter(lat__gte=min_lat, lat__lte=max_lat, lng__gte=min_lng, lng__lte=max_lng)
+
+    def within_radius(self, lat, lng, radius):
+        """[(distância, poi), ...] a menos de `radius` metros, ordenado por distância."""
+        dlat = radius / METERS_PER_DEG_LAT
+        dlng = radius / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        found = []
+        for poi in self.in_bbox(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+            d = haversine_distance((lng, lat), (poi.lng, poi.lat))
+            if d <= radius:
+                found.append((d, poi))
+        found.sort(key=lambda item: item[0])
+        return found
+
 
 class SimpleTouristPoint(models.Model):
     name = models.CharField(max_length=255)
     category = models.CharField(max_length=100) # ex: museum, castle
     lat = models.FloatField()  # Latitude normal
     lng = models.FloatField()  # Longitude normal
+    source_key = models.CharField(max_length=64, unique=True, null=True)  # ex: node/123 (ver poi_import)
+
+    objects = SimpleTouristPointQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Fallback para bbox em motores sem R*Tree (em SQLite as pesquisas usam a R*Tree)
+            models.Index(fields=['lat', 'lng'], name='routes_poi_lat_lng_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.lat}, {self.lng})"
+
+    def delete(self, *args, **kwargs):
+        # Em vez de um post_delete (ver RoutesConfig.ready): só os apagamentos de instâncias
+        result = super().delete(*args, **kwargs)
+        invalidate_poi_index()
+        return result
+
+    def as_dict(self):
+        return {'id': self.id, 'lat': self.lat, 'lon': self.lng, 'name': self.name, 'category': self.category}
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from .persistent_cache import get_store
+
+_MISSING = object()
+_registry = {}
+
+
+class TTLCache:
+    """
+    Cache LRU em memória com TTL por entrada e contadores de hits/misses.
+    Seguro para threads; partilhado por todos os pedidos do worker.
+    Com `stale_ttl`, as entradas expiradas ficam mais esse tempo disponíveis para
+    get_stale (resposta de recurso quando o servidor externo falha).
+    Com `persistent`, as escritas vão também para a cache persistente (namespace = nome)
+    e os misses em memória são procurados lá antes de contarem como miss. O código async
+    usa as versões a* (aget, aget_stale, aset, ...), que fazem o acesso ao SQLite numa thread.
+    """
+
+    def __init__(self, name, maxsize, ttl, stale_ttl=0, persistent=False):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.persistent = persistent
+        self._data = OrderedDict()  # key -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.persistent_hits = 0
+        _registry[name] = self
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_stale(self, key, default=None):
+        """Último valor guardado, mesmo expirado (até `stale_ttl` depois de expirar)."""
+        return self.get_many([key], stale=True).get(key, default)
+
+    def get_many(self, keys, stale=False):
+        """{chave: valor} das chaves em cache; com `stale` também as expiradas ainda no período stale."""
+        found, missing = self._lookup(keys, stale)
+        store = self._store() if missing else None
+        # Fora do lock: a leitura do SQLite não deve bloquear as outras threads
+        loaded = self._load(store, missing, stale) if store is not None else {}
+        return self._record(found, loaded, len(keys), stale)
+
+    async def aget(self, key, default=None):
+        return (await self.aget_many([key])).get(key, default)
+
+    async def aget_stale(self, key, default=None):
+        return (await self.aget_many([key], stale=True)).get(key, default)
+
+    async def aget_many(self, keys, stale=False):
+        """Como get_many; a leitura do SQLite (e o json.loads) corre numa thread, fora do event loop."""
+        found, missing = self._lookup(keys, stale)
+        store = self._store() if missing else None
+        loaded = await asyncio.to_thread(self._load, store, missing, stale) if store is not None else {}
+        return self._record(found, loaded, len(keys), stale)
+
+    def _lookup(self, keys, stale):
+        # Só a memória: ({chave: valor} encontradas, chaves em falta)
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key, _MISSING)
+                if entry is not _MISSING and entry[0] > now:
+                    self._data.move_to_end(key)
+                    found[key] = entry[1]
+                elif entry is not _MISSING and entry[0] + self.stale_ttl > now:
+                    if stale:
+                        found[key] = entry[1]
+                    else:
+                        missing.append(key)
+                else:
+                    if entry is not _MISSING:
+                        del self._data[key]
+                    missing.append(key)
+        return found, missing
+
+    def _load(self, store, keys, stale):
+        # As chaves em falta numa só consulta ao SQLite; as ainda válidas são promovidas para a memória
+        loaded = {}
+        for key, (value, ttl_left) in store.get_many(self.name, keys, stale).items():
+            if ttl_left > 0:
+                self._put(key, value, ttl_left)
+            loaded[key] = value
+        return loaded
+
+    def _record(self, found, loaded, total, stale):
+        with self._lock:
+            if stale:
+                self.stale_hits += len(found) + len(loaded)
+            else:
+                self.hits += len(found) + len(loaded)
+                self.persistent_hits += len(loaded)
+                self.misses += total - len(found) - len(loaded)
+        found.update(loaded)
+        return found
+
+    def _store(self):
+        return get_store() if self.persistent else None
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        for key, value in items.items():
+            self._put(key, value, ttl)
+        store = self._store()
+        if store is not None and items:
+            store.set_many(self.name, items, ttl, self.stale_ttl)
+
+    async def aset(self, key, value, ttl=None):
+        await self.aset_many({key: value}, ttl)
+
+    async def aset_many(self, items, ttl=None):
+        """Como set_many; a escrita no SQLite corre numa thread, fora do event loop."""
+        ttl = self.ttl if ttl is None else ttl
+        for key, value in items.items():
+            self._put(key, value, ttl)
+        store = self._store()
+        if store is not None and items:
+            await asyncio.to_thread(store.set_many, self.name, items, ttl, self.stale_ttl)
+
+    def _put(self, key, value, ttl):
+        expires = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.stale_hits = self.persistent_hits = 0
+        store = self._store()
+        if store is not None:
+            store.clear(self.name)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'stale_hits': self.stale_hits,
+            'persistent_hits': self.persistent_hits,
+        }
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def clear_caches():
+    for cache in _registry.values():
+        cache.clear()
+
+
+def quantize_coords(coords_str, precision):
+    # "lng,lat;lng,lat" -> tuplo arredondado (pedidos a poucos metros partilham entrada)
+    return tuple(
+        tuple(round(float(v), precision) for v in pair.split(','))
+        for pair in coords_str.split(';')
+    )
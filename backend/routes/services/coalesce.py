@@ -0,0 +1,129 @@
+"""
+Junção de pedidos iguais em curso (single-flight): chamadas concorrentes com a mesma chave
+esperam pela primeira e recebem o mesmo resultado (ou a mesma exceção), em vez de repetirem
+o pedido externo. Funciona entre threads (workers WSGI) e entre tarefas assíncronas, também
+de event loops diferentes.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from .config import REQUEST_BUDGET_MAX
+from .metrics import Counter
+from .resilience import DeadlineExceeded, detached_deadline, remaining_time
+
+coalesced_calls = Counter('bettermaps_coalesced_calls_total', 'Chamadas servidas por um pedido igual já em curso',
+                          ['flight'])
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Um grupo de pedidos (osrm, weather, geocode). Os pedidos das threads e os das tarefas
+    assíncronas juntam-se separadamente. O trabalho partilhado não herda o prazo de quem chegou
+    primeiro (um prazo curto faria falhar todos os outros): corre com REQUEST_BUDGET_MAX e cada
+    um só aplica o seu prazo à espera. Nas threads quem chegou primeiro faz o trabalho, por isso
+    pode passar do seu prazo até ao fim do pedido partilhado.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # chave -> _Call (threads)
+        self._futures = {}  # chave -> concurrent.futures.Future (tarefas assíncronas, de qualquer loop)
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """fn() uma só vez por chave entre as threads que a pedem ao mesmo tempo."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            coalesced_calls.inc(self.name)
+            # Quem espera respeita o seu próprio prazo, não o de quem fez o pedido
+            if not call.done.wait(remaining_time()):
+                raise DeadlineExceeded("Prazo do pedido esgotado à espera de um pedido igual")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with detached_deadline(REQUEST_BUDGET_MAX):
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @staticmethod
+    async def _shared(coro_fn):
+        with detached_deadline(REQUEST_BUDGET_MAX):
+            return await coro_fn()
+
+    async def ado(self, key, coro_fn):
+        """
+        Versão assíncrona: coro_fn() corre numa tarefa partilhada pelas corrotinas com a mesma chave,
+        mesmo em event loops diferentes (em WSGI/runserver cada pedido async tem o seu loop).
+        """
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                leader = future is None
+                if leader:
+                    future = self._futures[key] = Future()
+            if leader:
+                self._start(key, future, coro_fn)
+            else:
+                coalesced_calls.inc(self.name)
+            try:
+                return await self._wait(future)
+            except asyncio.CancelledError:
+                # O loop de quem começou o pedido terminou e cancelou-o: quem ainda espera tenta de novo
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+    def _start(self, key, future, coro_fn):
+        task = asyncio.get_running_loop().create_task(self._shared(coro_fn))
+        self._running.add(task)  # o asyncio só guarda referências fracas das tarefas
+
+        def finish(t):
+            self._running.discard(t)
+            with self._lock:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+            if t.cancelled():
+                future.cancel()
+            elif t.exception() is not None:
+                future.set_exception(t.exception())
+            else:
+                future.set_result(t.result())
+
+        task.add_done_callback(finish)
+
+    @staticmethod
+    async def _wait(future):
+        # shield: cancelar quem espera (ex: cliente desligou) não cancela o pedido dos outros
+        waiter = asyncio.shield(asyncio.wrap_future(future))
+        timeout = remaining_time()
+        if timeout is None:
+            return await waiter
+        try:
+            return await asyncio.wait_for(waiter, max(0.0, timeout))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Prazo do pedido esgotado à espera de um pedido igual")
@@ -1,11 +1,125 @@
+import os
+from pathlib import Path
+
+# Caminho de cada servidor público no servidor local de substituição
+# (python manage.py upstream_server), usado com BETTERMAPS_UPSTREAM_URL
+STANDIN_PATHS = {
+    "router.project-osrm.org": "/osrm/driving",
+    "routing.openstreetmap.de/routed-bike": "/osrm/bike",
+    "routing.openstreetmap.de/routed-foot": "/osrm/foot",
+    "nominatim.openstreetmap.org": "/nominatim",
+    "https://api.open-meteo.com/v1/forecast": "/open-meteo/v1/forecast",
+}
+
+
+# Nome -> servidor configurado; os disjuntores e as métricas são por nome (ver http_client.upstream_name),
+# porque com o servidor de substituição todos partilham o mesmo host:porta
+UPSTREAMS = {}
+
+
+def upstream(name, default):
+    """
+    Servidor externo: BETTERMAPS_<name> se definida; senão o servidor local em
+    BETTERMAPS_UPSTREAM_URL (ex: "http://127.0.0.1:8090") se definido; senão o público.
+    Valores com esquema ("http://...") são usados tal como estão.
+    """
+    if os.environ.get(f"BETTERMAPS_{name}"):
+        value = os.environ[f"BETTERMAPS_{name}"]
+    elif os.environ.get("BETTERMAPS_UPSTREAM_URL"):
+        value = os.environ["BETTERMAPS_UPSTREAM_URL"].rstrip("/") + STANDIN_PATHS[default]
+    else:
+        value = default
+    UPSTREAMS[name] = value
+    return value
+
+
 # Servidores
-SERVER_DRIVING = "router.project-osrm.org"
-SERVER_BIKE = "routing.openstreetmap.de/routed-bike"
-SERVER_FOOT = "routing.openstreetmap.de/routed-foot"
-NOMINATIM_SERVER = "nominatim.openstreetmap.org"
+SERVER_DRIVING = upstream("SERVER_DRIVING", "router.project-osrm.org")
+SERVER_BIKE = upstream("SERVER_BIKE", "routing.openstreetmap.de/routed-bike")
+SERVER_FOOT = upstream("SERVER_FOOT", "routing.openstreetmap.de/routed-foot")
+NOMINATIM_SERVER = upstream("NOMINATIM_SERVER", "nominatim.openstreetmap.org")
 
 # API Open-Meteo
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+OPEN_METEO_URL = upstream("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
 
 DEFAULT_DETOUR_RADIUS = 50
 
+# Índice espacial de POIs (em memória)
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+POI_DATASET_STAMP = DATA_DIR / ".pois_version"  # tocado pelo load_points
+POI_INDEX_CELL_SIZE = 0.01  # graus (~1.1km de latitude)
+POI_INDEX_CHECK_INTERVAL = 5  # segundos entre verificações do carimbo
+POI_INDEX_ENABLED = True  # False (ou índice a ser reconstruído): pesquisas vão à BD (R*Tree em SQLite, índice (lat, lng) nos outros)
+
+# Cache de respostas OSRM (route/nearest)
+OSRM_CACHE_SIZE = 1024  # entradas
+OSRM_CACHE_TTL = 3600  # segundos
+OSRM_CACHE_PRECISION = 5  # casas decimais das coordenadas na chave (~1m)
+
+# Cache de meteorologia (Open-Meteo "current")
+WEATHER_GRID_SIZE = 0.05  # graus (~5km, da ordem da grelha do modelo)
+WEATHER_UPDATE_INTERVAL = 900  # segundos; o "current" é atualizado a cada 15 min
+WEATHER_CACHE_SIZE = 20000  # células
+WEATHER_MAX_PARALLEL = 4  # lotes pedidos em simultâneo por rota
+
+# Clientes HTTP partilhados (um pool por servidor)
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_KEEPALIVE_EXPIRY = 30  # segundos
+HTTP2_ENABLED = False  # requer httpx[http2]
+
+# Cache de geocoding (Nominatim)
+GEOCODE_CACHE_SIZE = 5000
+GEOCODE_CACHE_TTL = 86400  # 1 dia; moradas e coordenadas raramente mudam
+GEOCODE_REVERSE_PRECISION = 4  # casas decimais no reverse (~11m)
+
+# Rotas em lote (/osrm/route/batch/)
+ROUTE_BATCH_MAX_ITEMS = 500
+ROUTE_BATCH_MAX_PARALLEL = 8  # rotas calculadas em simultâneo
+
+# Matrizes distância/duração (serviço table do OSRM)
+MATRIX_TILE_SIZE = 50  # origens e destinos por tile (<= 100 coordenadas por pedido)
+MATRIX_MAX_PARALLEL = 4  # tiles pedidos em simultâneo
+MATRIX_MAX_CELLS = 250000
+MATRIX_CACHE_SIZE = 200000  # pares origem/destino em cache
+
+# Tiles de POIs (/pois/tiles/{z}/{x}/{y}/)
+POI_TILE_MAX_ZOOM = 20
+POI_TILE_CLUSTER_MAX_ZOOM = 13  # até este zoom os POIs próximos são agrupados
+POI_TILE_CLUSTER_RADIUS = 32  # píxeis (tile de 256px) por célula de agrupamento
+POI_TILE_CACHE_SIZE = 4096  # tiles já serializados
+POI_TILE_CACHE_TTL = 86400  # segundos; o load_points invalida antes disso
+POI_TILE_MAX_AGE = 300  # Cache-Control para browsers/proxies (depois revalidam com ETag)
+
+# Desvio turístico (raio do corredor = DEFAULT_DETOUR_RADIUS x fator do perfil)
+TOURIST_RADIUS_FACTOR = {'walking': 1, 'cycling': 4, 'driving': 10}
+TOURIST_MAX_WAYPOINTS = 15
+TOURIST_DETOUR_BUDGET = 10  # desvio total (ida e volta aos POIs) em múltiplos do raio do corredor
+
+# Métricas (/api/metrics/): limites dos baldes dos histogramas de latência, em segundos
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Resiliência dos pedidos externos (disjuntor por servidor, prazo do pedido e GETs em duplicado)
+BREAKER_FAILURE_THRESHOLD = 5  # falhas seguidas até o disjuntor abrir
+BREAKER_RESET_TIMEOUT = 30  # segundos aberto antes de deixar passar um pedido de teste
+REQUEST_BUDGET_DEFAULT = 25  # segundos por pedido à API (o cliente pode pedir menos com X-Request-Budget, em ms)
+REQUEST_BUDGET_MAX = 60
+UPSTREAM_HEDGE_DELAY = None  # segundos até repetir um GET lento ao OSRM/Open-Meteo; None desliga
+# Quanto tempo depois de expirar um valor ainda serve de recurso (disjuntor aberto / falha)
+OSRM_CACHE_STALE_TTL = 86400
+WEATHER_CACHE_STALE_TTL = 3 * 3600  # meteorologia mais antiga já engana mais do que ajuda
+GEOCODE_CACHE_STALE_TTL = 7 * 86400
+
+# Nominatim: todos os pedidos passam por um despachante com balde de fichas (política do servidor
+# público: no máximo 1 pedido/s). Um servidor próprio pode subir o ritmo com BETTERMAPS_NOMINATIM_RATE.
+# O ritmo é partilhado pelos processos através da cache persistente; sem ela é por processo.
+NOMINATIM_RATE = float(os.environ.get("BETTERMAPS_NOMINATIM_RATE", 1.0))  # pedidos por segundo; 0 desliga
+NOMINATIM_BURST = 1  # fichas acumuladas no máximo
+
+# Cache persistente das respostas externas (SQLite em WAL, partilhada pelos workers; ver persistent_cache.py).
+# Cada cache em memória (osrm, geocode, weather) é um namespace com o TTL dela; "" desliga.
+PERSISTENT_CACHE_PATH = os.environ.get(
+    "BETTERMAPS_CACHE_PATH", str(Path(__file__).resolve().parents[2] / "upstream_cache.sqlite3"))
+PERSISTENT_CACHE_MAX_BYTES = {'osrm': 512 * 2**20, 'geocode': 64 * 2**20, 'weather': 64 * 2**20}
+PERSISTENT_CACHE_BUSY_TIMEOUT = 0.25  # segundos à espera de outro processo antes de desistir (conta como miss)
+PERSISTENT_CACHE_EVICT_INTERVAL = 300  # segundos entre limpezas (thread de cada processo, fora dos pedidos)
@@ -1,19 +1,131 @@
-import httpx
-from .config import NOMINATIM_SERVER
+from .config import NOMINATIM_SERVER, GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL, GEOCODE_CACHE_STALE_TTL
+from .config import GEOCODE_REVERSE_PRECISION
+from .http_client import http_get
+from .cache import TTLCache
+from .coalesce import SingleFlight
+from .metrics import stage
+from .nominatim_dispatcher import nominatim_dispatcher, PRIORITY_REVERSE, PRIORITY_SEARCH, PRIORITY_BACKGROUND
+from .poi_search import autocomplete
+from .resilience import DeadlineExceeded
+from .utils import base_url, db_sync_to_async, normalize_text
+
+
+NOMINATIM_HEADERS = {'User-Agent': 'BetterMaps-App/1.0'}
+
+geocode_cache = TTLCache('geocode', GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL, GEOCODE_CACHE_STALE_TTL,
+                         persistent=True)
+geocode_flight = SingleFlight('geocode')
+
+
+def geocode_key(address):
+    return ('search', normalize_text(address))
+
+
+def reverse_geocode_key(lat, lng):
+    return ('reverse', round(float(lat), GEOCODE_REVERSE_PRECISION), round(float(lng), GEOCODE_REVERSE_PRECISION))
 
 
 def get_nominatim_request(endpoint, params):
-    url = f"https://{NOMINATIM_SERVER}/{endpoint}"
-    headers = {'User-Agent': 'BetterMaps-App/1.0'}
+    # Só deve ser chamado pelo despachante (ritmo imposto pela política do Nominatim)
+    url = f"{base_url(NOMINATIM_SERVER, 'https')}/{endpoint}"
     params['format'] = 'json'
-    response = httpx.get(url, params=params, headers=headers, timeout=10)
+    response = http_get(url, params=params, headers=NOMINATIM_HEADERS, timeout=10)
     return response.json()
 
 
-def get_geocode(address):
-    return get_nominatim_request("search", {"q": address, "limit": 1})
+def fallback_answer(key, endpoint, params):
+    """Resposta sem o Nominatim: a última guardada (mesmo expirada) ou, nas pesquisas, os POIs locais."""
+    result = geocode_cache.get_stale(key)
+    if result is None and endpoint == 'search':
+        result = autocomplete(params['q'], params.get('limit', 1)) or None
+    return result
+
+
+def cached_nominatim_request(key, endpoint, params, priority=PRIORITY_SEARCH):
+    try:
+        result = geocode_cache.get(key)
+        if result is not None:
+            return result
+        # A fila é avaliada aqui, com o prazo de quem pede (o trabalho partilhado corre com outro)
+        nominatim_dispatcher.check_wait(priority)
+        return geocode_flight.do(key, lambda: load_nominatim(key, endpoint, params, priority))
+    except DeadlineExceeded:
+        # Fila mais longa que o prazo ou prazo esgotado à espera de um pedido igual
+        result = fallback_answer(key, endpoint, params)
+        if result is None: raise
+        return result
+
+
+def load_nominatim(key, endpoint, params, priority):
+    result = geocode_cache.get(key)
+    if result is None:
+        try:
+            with stage('geocode'):
+                result = nominatim_dispatcher.call(key, lambda: get_nominatim_request(endpoint, params), priority)
+        except Exception:
+            # Nominatim em baixo, disjuntor aberto ou fila maior que o prazo do pedido
+            result = fallback_answer(key, endpoint, params)
+            if result is None: raise
+            return result
+        if not (isinstance(result, dict) and 'error' in result):
+            geocode_cache.set(key, result)
+    return result
+
+
+async def acached_nominatim_request(key, endpoint, params, priority=PRIORITY_SEARCH):
+    try:
+        result = await geocode_cache.aget(key)
+        if result is not None:
+            return result
+        nominatim_dispatcher.check_wait(priority)
+        return await geocode_flight.ado(key, lambda: aload_nominatim(key, endpoint, params, priority))
+    except DeadlineExceeded:
+        result = await db_sync_to_async(fallback_answer)(key, endpoint, params)
+        if result is None: raise
+        return result
+
+
+async def aload_nominatim(key, endpoint, params, priority):
+    result = await geocode_cache.aget(key)
+    if result is None:
+        try:
+            with stage('geocode'):
+                result = await nominatim_dispatcher.acall(
+                    key, lambda: get_nominatim_request(endpoint, params), priority)
+        except Exception:
+            # O autocomplete pode ler a BD (índice desatualizado)
+            result = await db_sync_to_async(fallback_answer)(key, endpoint, params)
+            if result is None: raise
+            return result
+        if not (isinstance(result, dict) and 'error' in result):
+            await geocode_cache.aset(key, result)
+    return result
+
+
+def search_priority(background):
+    return PRIORITY_BACKGROUND if background else PRIORITY_SEARCH
+
+
+def reverse_priority(background):
+    return PRIORITY_BACKGROUND if background else PRIORITY_REVERSE
+
+
+# `background=True` para trabalho sem utilizador à espera: passa para o fim da fila do Nominatim
+def get_geocode(address, background=False):
+    return cached_nominatim_request(geocode_key(address), "search", {"q": address, "limit": 1},
+                                    search_priority(background))
+
+
+def get_reverse_geocode(lat, lng, background=False):
+    return cached_nominatim_request(reverse_geocode_key(lat, lng), "reverse", {"lat": lat, "lon": lng},
+                                    reverse_priority(background))
+
 
+async def aget_geocode(address, background=False):
+    return await acached_nominatim_request(geocode_key(address), "search", {"q": address, "limit": 1},
+                                           search_priority(background))
 
-def get_reverse_geocode(lat, lng):
-    return get_nominatim_request("reverse", {"lat": lat, "lon": lng})
 
+async def aget_reverse_geocode(lat, lng, background=False):
+    return await acached_nominatim_request(reverse_geocode_key(lat, lng), "reverse", {"lat": lat, "lon": lng},
+                                           reverse_priority(background))
@@ -0,0 +1,143 @@
+import numpy as np
+
+EARTH_RADIUS = 6371000
+
+
+def as_array(geometry):
+    # [[lon, lat], ...] -> array (n, 2) de float64
+    return np.asarray(geometry, dtype=np.float64).reshape(-1, 2)
+
+
+def haversine_array(lon1, lat1, lon2, lat2):
+    """Versão vetorizada de utils.haversine_distance (mesma fórmula, em metros)."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
+
+def cumulative_distances(geometry):
+    """Distância acumulada (m) desde o primeiro vértice até cada vértice, numa só passagem."""
+    pts = as_array(geometry)
+    cum = np.zeros(len(pts))
+    if len(pts) > 1:
+        steps = haversine_array(pts[:-1, 0], pts[:-1, 1], pts[1:, 0], pts[1:, 1])
+        np.cumsum(steps, out=cum[1:])
+    return cum
+
+
+def split_by_distance(cum, resolution):
+    """
+    Índices (início, fim) inclusivos de cada segmento: corta no primeiro vértice em que a
+    distância desde o último corte atinge `resolution`, ou no último vértice.
+    Segmentos consecutivos partilham o vértice de corte.
+    """
+    n = len(cum)
+    if n == 0:
+        return []
+    last = n - 1
+    bounds = []
+    start = 0
+    while True:
+        end = int(np.searchsorted(cum, cum[start] + resolution, side='left'))
+        end = min(max(end, start + 1), last)
+        bounds.append((start, end))
+        if end == last:
+            return bounds
+        start = end
+
+
+def to_local_meters(pts):
+    # Projeção equirectangular centrada na latitude média (suficiente para tolerâncias de metros)
+    k = np.pi / 180 * EARTH_RADIUS
+    x = pts[:, 0] * k * np.cos(np.radians(pts[:, 1].mean()))
+    y = pts[:, 1] * k
+    return x, y
+
+
+def douglas_peucker_mask(geometry, tolerance):
+    """Máscara booleana dos vértices mantidos pelo Douglas-Peucker (tolerância em metros)."""
+    pts = as_array(geometry)
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3 or tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    x, y = to_local_meters(pts)
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        seg_len2 = dx * dx + dy * dy
+        if seg_len2 == 0:
+            dist = np.hypot(px, py)
+        else:
+            # Distância ao segmento (não à reta), para rotas que voltam para trás
+            t = np.clip((px * dx + py * dy) / seg_len2, 0, 1)
+            dist = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify(geometry, tolerance):
+    """Subconjunto dos vértices de [[lon, lat], ...]; o primeiro e o último mantêm-se sempre."""
+    if not tolerance or len(geometry) < 3:
+        return geometry
+    keep = douglas_peucker_mask(geometry, tolerance)
+    return [pt for pt, k in zip(geometry, keep) if k]
+
+
+def zoom_to_tolerance(zoom, lat):
+    """Tolerância (m) equivalente a ~1 pixel num mapa web Mercator ao nível de zoom dado."""
+    return 156543.03392 * np.cos(np.radians(lat)) / (2 ** zoom)
+
+
+def encode_polyline(geometry, precision=6):
+    """Codifica [[lon, lat], ...] no formato polyline do Google (polyline6 por omissão, ordem lat,lon)."""
+    if len(geometry) == 0:
+        return ""
+    pts = np.round(as_array(geometry)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(pts, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded, precision=6):
+    """Inverso de encode_polyline: devolve [[lon, lat], ...]."""
+    coords, values, index = [], [], 0
+    while index < len(encoded):
+        result, shift = 0, 0
+        while True:
+            b = ord(encoded[index]) - 63
+            index += 1
+            result |= (b & 0x1f) << shift
+            shift += 5
+            if b < 0x20:
+                break
+        values.append(~(result >> 1) if result & 1 else result >> 1)
+    factor = 10 ** precision
+    lat = lon = 0
+    for dlat, dlon in zip(values[0::2], values[1::2]):
+        lat += dlat
+        lon += dlon
+        coords.append([lon / factor, lat / factor])
+    return coords
@@ -0,0 +1,152 @@
+import asyncio
+import atexit
+import contextvars
+import functools
+import importlib.util
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+from .config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED, UPSTREAM_HEDGE_DELAY
+from .config import UPSTREAMS
+from .metrics import observe_upstream
+from .resilience import aguarded_get, guarded_get
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {host: httpx.AsyncClient}
+_server_loops = weakref.WeakSet()  # loops do servidor ASGI (ver register_server_loop)
+# Threads para os GETs assíncronos feitos fora do loop do servidor (com o httpx.Client do processo)
+_sync_executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONNECTIONS, thread_name_prefix='http-client')
+_lock = threading.Lock()
+
+
+def _client_options():
+    return {
+        'limits': httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        # HTTP/2 precisa do pacote opcional h2 (pip install "httpx[http2]")
+        'http2': HTTP2_ENABLED and importlib.util.find_spec('h2') is not None,
+    }
+
+
+def strip_scheme(url):
+    return url.split('://', 1)[-1]
+
+
+def upstream_name(url):
+    """
+    Nome (em minúsculas) do servidor configurado em config.upstream a que o URL pertence, ou o
+    host se não for nenhum: chave do disjuntor e etiqueta das métricas.
+    """
+    bare = strip_scheme(url)
+    best = None
+    for name, base in UPSTREAMS.items():
+        prefix = strip_scheme(base).rstrip('/')
+        if bare == prefix or bare.startswith((prefix + '/', prefix + '?')):
+            if best is None or len(prefix) > best[0]:
+                best = (len(prefix), name)
+    return best[1].lower() if best else urlsplit(url).netloc
+
+
+def get_client(host):
+    """Um httpx.Client por servidor, partilhado por todos os pedidos do worker (keep-alive)."""
+    client = _clients.get(host)
+    if client is None:
+        with _lock:
+            client = _clients.get(host)
+            if client is None:
+                client = httpx.Client(**_client_options())
+                _clients[host] = client
+    return client
+
+
+def http_get(url, **kwargs):
+    """GET com o cliente do host, o disjuntor do servidor (CircuitOpenError) e o prazo do pedido atual."""
+    host, name = urlsplit(url).netloc, upstream_name(url)
+    start = time.perf_counter()
+    try:
+        response = guarded_get(name, get_client(host).get, url, kwargs)
+    except Exception as e:
+        observe_upstream(name, time.perf_counter() - start, error=type(e).__name__)
+        raise
+    observe_upstream(name, time.perf_counter() - start, response.status_code)
+    return response
+
+
+def register_server_loop():
+    """
+    Marca o event loop atual como o do servidor ASGI (chamado no arranque do lifespan): só
+    esses loops, que duram tanto como o worker, têm AsyncClients próprios.
+    """
+    _server_loops.add(asyncio.get_running_loop())
+
+
+def get_async_send(host):
+    """
+    O GET assíncrono para `host`. No loop do servidor ASGI usa o AsyncClient do loop; nos loops
+    de um só pedido (views async em WSGI/runserver) um AsyncClient novo por pedido perdia o
+    keep-alive e nunca era fechado, por isso usa o httpx.Client do processo numa thread.
+    """
+    if asyncio.get_running_loop() in _server_loops:
+        return get_async_client(host).get
+    client = get_client(host)
+
+    async def send(url, **kwargs):
+        call = functools.partial(contextvars.copy_context().run, client.get, url, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_sync_executor, call)
+    return send
+
+
+def get_async_client(host):
+    """
+    Um httpx.AsyncClient por servidor e por event loop (um AsyncClient não pode
+    ser usado fora do loop onde foi criado).
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+    client = clients.get(host)
+    if client is None:
+        client = clients[host] = httpx.AsyncClient(**_client_options())
+    return client
+
+
+async def ahttp_get(url, hedge=True, **kwargs):
+    """
+    Como http_get; com UPSTREAM_HEDGE_DELAY definido repete o GET se a resposta demorar
+    mais do que isso (`hedge=False` para servidores que limitam o número de pedidos).
+    """
+    host, name = urlsplit(url).netloc, upstream_name(url)
+    start = time.perf_counter()
+    hedge_delay = UPSTREAM_HEDGE_DELAY if hedge else None
+    try:
+        response = await aguarded_get(name, get_async_send(host), url, kwargs, hedge_delay)
+    except Exception as e:
+        observe_upstream(name, time.perf_counter() - start, error=type(e).__name__)
+        raise
+    observe_upstream(name, time.perf_counter() - start, response.status_code)
+    return response
+
+
+async def aclose_clients():
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_clients():
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+# Fechar as ligações quando o worker termina
+atexit.register(close_clients)
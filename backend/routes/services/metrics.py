@@ -0,0 +1,185 @@
+"""
+Métricas do processo (histogramas e contadores) em formato Prometheus e tempos por etapa
+de cada pedido para o cabeçalho Server-Timing.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .cache import cache_stats
+from .config import METRICS_BUCKETS
+
+_registry = {}
+
+# Tempos das etapas do pedido atual: [(etapa, segundos), ...] (ver ServerTimingMiddleware)
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=METRICS_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [contagens por balde..., +Inf], soma
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def observe(self, seconds, *label_values):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += seconds
+
+    def count(self, *label_values):
+        entry = self._values.get(label_values)
+        return sum(entry[0]) if entry else 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = format_labels(self.labels, label_values, [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram('bettermaps_stage_seconds', 'Duração de cada etapa do cálculo', ['stage'])
+stage_errors = Counter('bettermaps_stage_errors_total', 'Etapas que terminaram com exceção', ['stage'])
+upstream_seconds = Histogram('bettermaps_upstream_request_seconds', 'Latência dos pedidos às APIs externas',
+                             ['upstream'])
+upstream_requests = Counter('bettermaps_upstream_requests_total', 'Pedidos às APIs externas por estado HTTP',
+                            ['upstream', 'status'])
+upstream_errors = Counter('bettermaps_upstream_errors_total', 'Pedidos às APIs externas sem resposta',
+                          ['upstream', 'error'])
+http_seconds = Histogram('bettermaps_http_request_seconds', 'Duração dos pedidos à API', ['route', 'method'])
+http_responses = Counter('bettermaps_http_responses_total', 'Respostas da API por estado', ['route', 'status'])
+
+
+@contextmanager
+def stage(name):
+    """Mede uma etapa: alimenta o histograma e, dentro de um pedido, o Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def observe_upstream(host, seconds, status=None, error=None):
+    upstream_seconds.observe(seconds, host)
+    if error is None:
+        upstream_requests.inc(host, str(status))
+    else:
+        upstream_errors.inc(host, error)
+
+
+def start_request_timings():
+    """Começa a recolher os tempos das etapas no contexto atual; devolve (lista, token)."""
+    timings = []
+    return timings, _request_timings.set(timings)
+
+
+def stop_request_timings(token):
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    """[(etapa, s), ...] -> 'etapa;dur=12.3, ...' (ms; etapas repetidas somadas, com o nº de chamadas)."""
+    merged = {}
+    for name, seconds in timings:
+        entry = merged.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = [
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="x{calls}"' if calls > 1 else '')
+        for name, (seconds, calls) in merged.items()
+    ]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def render_cache_metrics():
+    # As caches já contam hits/misses: lidos no momento da recolha
+    stats = cache_stats()
+    lines = []
+    for metric, key, kind, help in (
+        ('bettermaps_cache_hits_total', 'hits', 'counter', 'Leituras de cache com sucesso'),
+        ('bettermaps_cache_misses_total', 'misses', 'counter', 'Leituras de cache sem entrada válida'),
+        ('bettermaps_cache_evictions_total', 'evictions', 'counter', 'Entradas removidas por falta de espaço'),
+        ('bettermaps_cache_stale_hits_total', 'stale_hits', 'counter', 'Valores expirados servidos por falha externa'),
+        ('bettermaps_cache_persistent_hits_total', 'persistent_hits', 'counter', 'Hits vindos da cache persistente'),
+        ('bettermaps_cache_entries', 'size', 'gauge', 'Entradas em cache'),
+    ):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{cache="{escape(name)}"}} {s[key]}' for name, s in sorted(stats.items())]
+    return lines
+
+
+def render_metrics():
+    """Todas as métricas do processo no formato de texto do Prometheus (0.0.4)."""
+    lines = []
+    for metric in _registry.values():
+        lines += metric.render()
+    lines += render_cache_metrics()
+    return "\n".join(lines) + "\n"
+
+
+def clear_metrics():
+    for metric in _registry.values():
+        metric.clear()
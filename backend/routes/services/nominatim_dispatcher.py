@@ -0,0 +1,239 @@
+"""
+Despachante dos pedidos ao Nominatim: uma única thread faz todos os pedidos, ao ritmo de um
+balde de fichas (NOMINATIM_RATE), servindo primeiro os reverse interativos, depois as pesquisas
+e por fim o trabalho de fundo. Pedidos iguais em fila juntam-se num só; quem não pode esperar
+pela sua vez (prazo do pedido) recebe logo NominatimBusy em vez de entrar na fila.
+
+O balde do despachante do processo está na cache persistente (SharedTokenBucket), por isso o
+ritmo vale para todos os workers que partilham o ficheiro. Sem cache persistente (ou se o SQLite
+falhar) cada processo usa o seu balde: com N workers saem até N x NOMINATIM_RATE pedidos/s e o
+BETTERMAPS_NOMINATIM_RATE deve ser dividido pelo número de workers.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from .config import NOMINATIM_BURST, NOMINATIM_RATE
+from .metrics import Counter
+from .persistent_cache import get_store
+from .resilience import DeadlineExceeded, remaining_time
+
+# Prioridades (menor = primeiro)
+PRIORITY_REVERSE = 0
+PRIORITY_SEARCH = 1
+PRIORITY_BACKGROUND = 2
+
+dispatched = Counter('bettermaps_nominatim_dispatched_total', 'Pedidos feitos pelo despachante do Nominatim',
+                     ['priority'])
+collapsed = Counter('bettermaps_nominatim_collapsed_total', 'Pedidos juntos a um pedido igual já em fila',
+                    ['priority'])
+rejected = Counter('bettermaps_nominatim_rejected_total', 'Pedidos recusados por a espera exceder o prazo',
+                   ['priority'])
+
+
+class NominatimBusy(DeadlineExceeded):
+    """A espera na fila do Nominatim passaria do prazo do pedido."""
+
+
+class TokenBucket:
+    """Balde de fichas: `rate` fichas/s, no máximo `burst` acumuladas. Sem `rate` não limita."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # O despachante tira fichas sem o seu lock: este protege só as contas do balde
+        self._lock = threading.RLock()
+
+    def refill(self, now):
+        with self._lock:
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now, ahead=0):
+        """Segundos até haver ficha para quem tem `ahead` pedidos à frente."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self.refill(now)
+            return max(0.0, (ahead + 1 - self.tokens) / self.rate)
+
+    def take(self, now):
+        with self._lock:
+            self.refill(now)
+            if self.rate:
+                self.tokens -= 1
+
+    def try_take(self, now):
+        """Tira uma ficha se houver (devolve 0); senão devolve os segundos até haver."""
+        with self._lock:
+            wait = self.wait_time(now)
+            if wait == 0:
+                self.take(now)
+            return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Balde `name` guardado na cache persistente, partilhado pelos processos que usam o mesmo ficheiro.
+    Só try_take (a thread do despachante) vai ao SQLite; as fichas locais guardam o último nível lido
+    e é com elas que wait_time estima a espera, sem I/O. Sem cache persistente, ou se o SQLite falhar,
+    as fichas locais são o balde.
+    """
+
+    def __init__(self, name, rate, burst):
+        super().__init__(rate, burst)
+        self.name = name
+
+    def try_take(self, now):
+        store = get_store()
+        if self.rate and store is not None:
+            taken = store.take_token(self.name, self.rate, self.burst)
+            if taken is not None:
+                wait, tokens = taken
+                with self._lock:
+                    self.tokens, self.updated = tokens, now
+                return wait
+        return super().try_take(now)
+
+
+class _Job:
+    __slots__ = ('key', 'fn', 'priority', 'future', 'context', 'running')
+
+    def __init__(self, key, fn, priority):
+        self.key, self.fn, self.priority = key, fn, priority
+        self.future = Future()
+        # O pedido corre com o contexto (prazo, tempos das etapas) de quem o pôs na fila
+        self.context = contextvars.copy_context()
+        self.running = False
+
+
+class NominatimDispatcher:
+
+    def __init__(self, rate=NOMINATIM_RATE, burst=NOMINATIM_BURST, bucket=None):
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self._heap = []  # (prioridade, ordem de chegada, chave); entradas antigas são ignoradas
+        self._jobs = {}  # chave -> _Job (em fila ou em curso)
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Arranque preguiçoso: depois de um fork (gunicorn --preload) a thread do pai não existe
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='nominatim-dispatcher', daemon=True)
+            self._thread.start()
+
+    def expected_wait(self, priority):
+        """Estimativa da espera de um pedido novo com esta prioridade (chamar com o lock)."""
+        ahead = sum(1 for job in self._jobs.values() if not job.running and job.priority <= priority)
+        return self.bucket.wait_time(time.monotonic(), ahead)
+
+    def _reject_if_late(self, priority):
+        # Chamar com o lock
+        left = remaining_time()
+        if left is not None and self.expected_wait(priority) > left:
+            rejected.inc(str(priority))
+            raise NominatimBusy("Fila do Nominatim mais longa que o prazo do pedido")
+
+    def check_wait(self, priority=PRIORITY_SEARCH):
+        """
+        NominatimBusy se um pedido novo não sair da fila dentro do prazo atual. Para quem entra
+        num SingleFlight antes do submit: lá dentro o prazo já não é o de quem pediu.
+        """
+        with self._cond:
+            self._reject_if_late(priority)
+
+    def submit(self, key, fn, priority=PRIORITY_SEARCH):
+        """Põe fn() na fila (ou junta-se ao pedido igual já em fila); devolve um Future."""
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None:
+                collapsed.inc(str(priority))
+                if priority < job.priority and not job.running:
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._order), key))
+                    self._cond.notify()
+                return job.future
+
+            self._reject_if_late(priority)
+            job = self._jobs[key] = _Job(key, fn, priority)
+            heapq.heappush(self._heap, (priority, next(self._order), key))
+            self._ensure_thread()
+            self._cond.notify()
+        return job.future
+
+    def call(self, key, fn, priority=PRIORITY_SEARCH):
+        future = self.submit(key, fn, priority)
+        try:
+            return future.result(timeout=remaining_time())
+        except TimeoutError:
+            raise NominatimBusy("Prazo do pedido esgotado na fila do Nominatim")
+
+    async def acall(self, key, fn, priority=PRIORITY_SEARCH):
+        # shield: desistir de esperar não cancela o pedido partilhado por outros
+        future = asyncio.shield(asyncio.wrap_future(self.submit(key, fn, priority)))
+        left = remaining_time()
+        if left is None:
+            return await future
+        try:
+            return await asyncio.wait_for(future, max(0.0, left))
+        except asyncio.TimeoutError:
+            raise NominatimBusy("Prazo do pedido esgotado na fila do Nominatim")
+
+    def _peek(self):
+        # Com o lock: o pedido de maior prioridade em fila, ou None
+        while self._heap:
+            priority, _, key = self._heap[0]
+            job = self._jobs.get(key)
+            if job is not None and not job.running and job.priority == priority:
+                return job
+            heapq.heappop(self._heap)  # entrada antiga (pedido já feito ou reprioritizado)
+        return None
+
+    def _next_job(self):
+        # Com o lock: espera por um pedido e por uma ficha; devolve o pedido de maior prioridade
+        while True:
+            while self._peek() is None:
+                self._cond.wait()
+            # A ficha tira-se sem o lock (o balde partilhado vai ao SQLite): submit() não espera pelo disco
+            self._cond.release()
+            try:
+                wait = self.bucket.try_take(time.monotonic())
+            finally:
+                self._cond.acquire()
+            if wait > 0:
+                # Acorda antes se chegar um pedido mais prioritário
+                self._cond.wait(wait)
+                continue
+            # Entretanto pode ter chegado um pedido mais prioritário: a ficha é dele
+            job = self._peek()
+            heapq.heappop(self._heap)
+            job.running = True
+            return job
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            dispatched.inc(str(job.priority))
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.context.run(job.fn))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            with self._cond:
+                del self._jobs[job.key]
+
+    def queued(self):
+        with self._cond:
+            return sum(1 for job in self._jobs.values() if not job.running)
+
+
+nominatim_dispatcher = NominatimDispatcher(bucket=SharedTokenBucket('nominatim', NOMINATIM_RATE, NOMINATIM_BURST))
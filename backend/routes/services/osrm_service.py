@@ -1,8 +1,17 @@
-import httpx
+import asyncio
+import math
 from .config import SERVER_DRIVING, SERVER_BIKE, SERVER_FOOT
-from .utils import haversine_distance
-from .weather_service import get_weather_batch, get_weather_color_and_desc
-from .tourism_service import find_pois_near_point_local
+from .config import OSRM_CACHE_SIZE, OSRM_CACHE_TTL, OSRM_CACHE_STALE_TTL, OSRM_CACHE_PRECISION, ROUTE_BATCH_MAX_PARALLEL
+from .config import MATRIX_TILE_SIZE, MATRIX_MAX_PARALLEL, MATRIX_CACHE_SIZE
+from .config import DEFAULT_DETOUR_RADIUS, TOURIST_RADIUS_FACTOR, TOURIST_MAX_WAYPOINTS, TOURIST_DETOUR_BUDGET
+from .http_client import http_get, ahttp_get
+from .cache import TTLCache, quantize_coords
+from .coalesce import SingleFlight
+from .utils import base_url, chunk_list, db_sync_to_async
+from .geometry import cumulative_distances, split_by_distance, simplify
+from .weather_service import get_weather_batch, aget_weather_batch, aiter_weather_batches, get_weather_color_and_desc
+from .tourism_service import find_pois_along_route
+from .metrics import stage
 
 
 def get_osrm_config(profile):
@@ -14,135 +23,590 @@ def get_osrm_config(profile):
         return SERVER_DRIVING, 'driving'
 
 
+osrm_cache = TTLCache('osrm', OSRM_CACHE_SIZE, OSRM_CACHE_TTL, OSRM_CACHE_STALE_TTL, persistent=True)
+osrm_flight = SingleFlight('osrm')
+
+FINAL_ROUTE_OPTIONS = ["steps=true", "geometries=geojson", "overview=full"]
+# Serviço trip com extremos fixos: o OSRM só decide a ordem dos waypoints intermédios
+TRIP_OPTIONS = ["source=first", "destination=last", "roundtrip=false"]
+
+
+def osrm_cache_key(service, version, profile, coords_str, options):
+    return (service, version, profile,
+            quantize_coords(coords_str, OSRM_CACHE_PRECISION),
+            tuple(sorted(options or ())))
+
+
 # --- OSRM CORE ---
 def get_osrm_request(service, version, profile, coords_str, options):
+    # Pedidos iguais em simultâneo partilham um só load_osrm (cache incluída)
+    key = osrm_cache_key(service, version, profile, coords_str, options)
+    data = osrm_flight.do(key, lambda: load_osrm(key, service, version, profile, coords_str, options))
+    # Cópia rasa: o get_route acrescenta chaves ao dicionário de topo
+    return dict(data)
+
+
+def load_osrm(key, *args):
+    cached = osrm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        data = fetch_osrm(*args)
+    except Exception:
+        # OSRM em baixo ou disjuntor aberto: a última resposta boa, mesmo expirada, é melhor que nada
+        stale = osrm_cache.get_stale(key)
+        if stale is None: raise
+        return stale
+    osrm_cache.set(key, data)
+    return data
+
+
+def osrm_base_url(server):
+    return base_url(server, "https" if "openstreetmap.de" in server else "http")
+
+
+def osrm_url(service, version, profile, coords_str, options):
     server, internal_profile = get_osrm_config(profile)
-    protocol = "https" if "openstreetmap.de" in server else "http"
-    url = f"{protocol}://{server}/{service}/{version}/{internal_profile}/{coords_str}.json"
+    url = f"{osrm_base_url(server)}/{service}/{version}/{internal_profile}/{coords_str}.json"
     if options: url += "?" + "&".join(options)
-    response = httpx.get(url, timeout=30)
+    return url
+
+
+def fetch_osrm(service, version, profile, coords_str, options):
+    response = http_get(osrm_url(service, version, profile, coords_str, options), timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+async def aget_osrm_request(service, version, profile, coords_str, options):
+    key = osrm_cache_key(service, version, profile, coords_str, options)
+    data = await osrm_flight.ado(key, lambda: aload_osrm(key, service, version, profile, coords_str, options))
+    return dict(data)
+
+
+async def aload_osrm(key, *args):
+    cached = await osrm_cache.aget(key)
+    if cached is not None:
+        return cached
+
+    try:
+        data = await afetch_osrm(*args)
+    except Exception:
+        stale = await osrm_cache.aget_stale(key)
+        if stale is None: raise
+        return stale
+    await osrm_cache.aset(key, data)
+    return data
+
+
+async def afetch_osrm(service, version, profile, coords_str, options):
+    response = await ahttp_get(osrm_url(service, version, profile, coords_str, options), timeout=30)
     response.raise_for_status()
     return response.json()
 
 
+# --- ETAPAS DA ROTA (partilhadas pela versão síncrona e assíncrona) ---
+def tourist_radius(profile):
+    return DEFAULT_DETOUR_RADIUS * TOURIST_RADIUS_FACTOR.get(profile, TOURIST_RADIUS_FACTOR['driving'])
+
+
+def select_tourist_waypoints(markers, profile):
+    """
+    Escolhe os POIs a visitar entre os `markers` do corredor: primeiro os mais próximos da rota
+    (cada um custa ~2x o afastamento em desvio), até TOURIST_MAX_WAYPOINTS ou esgotar o orçamento,
+    com pelo menos um raio de corredor entre eles ao longo da rota.
+    Devolve (POIs pela ordem da projeção na rota base, ordem ambígua?). A ordem é ambígua quando
+    dois POIs seguidos estão mais perto ao longo da rota do que a soma dos afastamentos.
+    """
+    radius = tourist_radius(profile)
+    budget = radius * TOURIST_DETOUR_BUDGET
+    chosen = []
+    for poi in sorted(markers, key=lambda p: p['offset']):
+        if len(chosen) >= TOURIST_MAX_WAYPOINTS or 2 * poi['offset'] > budget:
+            break
+        if any(abs(poi['along_route'] - c['along_route']) < radius for c in chosen):
+            continue
+        budget -= 2 * poi['offset']
+        chosen.append(poi)
+
+    chosen.sort(key=lambda p: p['along_route'])
+    ambiguous = any(b['along_route'] - a['along_route'] < a['offset'] + b['offset']
+                    for a, b in zip(chosen, chosen[1:]))
+    return chosen, ambiguous
+
+
+def plan_tourist_waypoints(base_route, profile):
+    """
+    Devolve (marcadores turísticos, waypoints "lon,lat;...", serviço OSRM da rota final).
+    O serviço é "trip" quando a ordem pela projeção na rota base é ambígua.
+    """
+    if not base_route.get('routes'):
+        return [], "", "route"
+    geo = base_route['routes'][0]['geometry']['coordinates']
+
+    # Uma só pesquisa no corredor da rota base (já ordenada e sem duplicados)
+    markers = find_pois_along_route(geo, tourist_radius(profile))
+    waypoints, ambiguous = select_tourist_waypoints(markers, profile)
+    waypoints_str = ";".join(f"{p['lon']},{p['lat']}" for p in waypoints)
+    return markers, waypoints_str, "trip" if ambiguous else "route"
+
+
+def route_coords(origin, dest, waypoints_str=""):
+    if waypoints_str:
+        return f"{origin[0]},{origin[1]};{waypoints_str};{dest[0]},{dest[1]}"
+    return f"{origin[0]},{origin[1]};{dest[0]},{dest[1]}"
+
+
+def final_route_args(profile, origin, dest, waypoints_str="", service="route"):
+    # Argumentos do get_osrm_request/aget_osrm_request para a rota final
+    options = FINAL_ROUTE_OPTIONS + TRIP_OPTIONS if service == "trip" else FINAL_ROUTE_OPTIONS
+    return service, "v1", profile, route_coords(origin, dest, waypoints_str), options
+
+
+def as_route_response(route_data):
+    # O trip devolve 'trips' em vez de 'routes' (cada trip tem o formato de uma rota)
+    if 'trips' in route_data:
+        route_data['routes'] = route_data.pop('trips')
+    return route_data
+
+
+def build_climatic_segments(geometry, total_distance):
+    """Parte a geometria em segmentos de distância fixa; cada um com o seu ponto médio (lat, lon)."""
+    # Resolução dinâmica para garantir que não geramos 5000 pontos
+    # Mas mantemos bom detalhe
+    if total_distance > 500000:
+        SEGMENT_RESOLUTION = 10000  # 10km (rotas > 500km)
+    elif total_distance > 100000:
+        SEGMENT_RESOLUTION = 5000  # 5km (rotas > 100km)
+    else:
+        SEGMENT_RESOLUTION = 2000  # 2km (rotas curtas)
+
+    # Distâncias acumuladas numa só passagem vetorizada; cortes por pesquisa binária
+    with stage('segmentation'):
+        cum = cumulative_distances(geometry)
+        segments_to_process = []
+        for start, end in split_by_distance(cum, SEGMENT_RESOLUTION):
+            current_segment = geometry[start:end + 1]
+            mid_pt = current_segment[len(current_segment) // 2]
+            segments_to_process.append({
+                'coords': current_segment,
+                'midpoint': (mid_pt[1], mid_pt[0])
+            })
+
+    return segments_to_process
+
+
+def paint_climatic_segments(segments_to_process, weather_results):
+    weather_segments = []
+    for i, seg in enumerate(segments_to_process):
+        weather = weather_results[i] if i < len(weather_results) else None
+        color = '#8c03fc'
+        desc = 'Desconhecido'
+
+        if weather:
+            code = weather.get('weather_code', 0)
+            color, desc = get_weather_color_and_desc(code)
+
+        weather_segments.append({
+            'coordinates': seg['coords'],
+            'color': color,
+            'description': desc
+        })
+    return weather_segments
+
+
+def single_segment(geometry, is_tourist):
+    if is_tourist:
+        return [{'coordinates': geometry, 'color': '#f97316', 'description': 'Rota Turística'}]
+    return [{'coordinates': geometry, 'color': '#8c03fc', 'description': 'Rota Normal'}]
+
+
+def segments_tile_geometry(weather_segments, geometry):
+    # Os segmentos são fatias contíguas da geometria que partilham o vértice de fronteira
+    return bool(weather_segments) and \
+        sum(len(seg['coordinates']) - 1 for seg in weather_segments) + 1 == len(geometry)
+
+
+def simplify_route(route_data, weather_segments, tolerance):
+    """
+    Simplifica (Douglas-Peucker, tolerância em metros) cada segmento à parte, para as
+    fronteiras se manterem, e reconstrói a geometria principal como a sua concatenação.
+    A geometria de cada step (steps=true) é simplificada com a mesma tolerância.
+    """
+    if not tolerance or not route_data.get('routes'):
+        return
+    # Não alterar o dicionário da rota em si: é partilhado com a cache OSRM
+    main_route = dict(route_data['routes'][0])
+    original = main_route['geometry']['coordinates']
+
+    if segments_tile_geometry(weather_segments, original):
+        simplified = []
+        for seg in weather_segments:
+            seg['coordinates'] = simplify(seg['coordinates'], tolerance)
+            simplified.extend(seg['coordinates'][1:] if simplified else seg['coordinates'])
+    else:
+        simplified = simplify(original, tolerance)
+
+    main_route['geometry'] = {**main_route['geometry'], 'coordinates': simplified}
+    if 'legs' in main_route:
+        main_route['legs'] = [{**leg, 'steps': [simplify_step(step, tolerance) for step in leg.get('steps', [])]}
+                              for leg in main_route['legs']]
+    route_data['routes'] = [main_route] + route_data['routes'][1:]
+
+
+def simplify_step(step, tolerance):
+    # Cópia: o step original é o da cache OSRM
+    geometry = step.get('geometry')
+    if not isinstance(geometry, dict) or 'coordinates' not in geometry:
+        return step
+    return {**step, 'geometry': {**geometry, 'coordinates': simplify(geometry['coordinates'], tolerance)}}
+
+
+def climatic_segments(route_data):
+    if not route_data.get('routes'):
+        return []
+    main_route = route_data['routes'][0]
+    return build_climatic_segments(main_route['geometry']['coordinates'], main_route['distance'])
+
+
+def finish_route(route_data, extra_info_markers, is_tourist, is_climatic,
+                 segments_to_process, weather_results, tolerance):
+    """Pinta os segmentos, simplifica e junta os campos normalizados à resposta do OSRM."""
+    weather_segments = []
+
+    with stage('finish'):
+        if route_data.get('routes'):
+            if is_climatic:
+                weather_segments = paint_climatic_segments(segments_to_process, weather_results)
+            else:
+                weather_segments = single_segment(route_data['routes'][0]['geometry']['coordinates'], is_tourist)
+
+        simplify_route(route_data, weather_segments, tolerance)
+    route_data['weather_segments'] = weather_segments
+    route_data['tourist_spots'] = extra_info_markers
+
+    return route_data
+
+
 # --- FUNÇÃO PRINCIPAL ---
-def get_route(profile, origin, dest, is_tourist=False, is_climatic=False):
+def get_route(profile, origin, dest, is_tourist=False, is_climatic=False, tolerance=None):
     """
     Combina Turística (Desvio) e Climática (Batch Request Paginado)
+    `tolerance` (metros) ativa a simplificação das geometrias devolvidas
     """
     waypoints_str = ""
+    service = "route"
     extra_info_markers = []
+    base_route = None
 
     # 1. PROCESSAR TURISMO
     if is_tourist:
-        base_coords = f"{origin[0]},{origin[1]};{dest[0]},{dest[1]}"
         try:
-            base_route = get_osrm_request("route", "v1", profile, base_coords, ["geometries=geojson"])
-            if base_route.get('routes'):
-                geo = base_route['routes'][0]['geometry']['coordinates']
-                step = max(1, int(len(geo) * 0.03))
-                seen = set()
-                route_waypoints = []
-                radius = 50 if profile == 'walking' else (200 if profile == 'cycling' else 500)
-
-                for i in range(0, len(geo), step):
-                    pt = geo[i]
-                    pois = find_pois_near_point_local(pt[1], pt[0], radius, list(seen))
-                    if pois:
-                        for p in pois:
-                            if p['name'] not in seen:
-                                extra_info_markers.append(p)
-                                if len(route_waypoints) < 15:
-                                    route_waypoints.append(f"{p['lon']},{p['lat']}")
-                                seen.add(p['name'])
-                if route_waypoints:
-                    waypoints_str = ";".join(route_waypoints)
+            # A rota base já vem completa: se não houver desvio é ela a rota final
+            with stage('osrm_base'):
+                base_route = get_osrm_request(*final_route_args(profile, origin, dest))
+            extra_info_markers, waypoints_str, service = plan_tourist_waypoints(base_route, profile)
         except Exception as e:
             print(f"Erro Turismo: {e}")
 
     # 2. CONSTRUIR ROTA FINAL
-    if waypoints_str:
-        final_coords = f"{origin[0]},{origin[1]};{waypoints_str};{dest[0]},{dest[1]}"
-    else:
-        final_coords = f"{origin[0]},{origin[1]};{dest[0]},{dest[1]}"
-
     try:
-        route_data = get_osrm_request("route", "v1", profile, final_coords,
-                                      ["steps=true", "geometries=geojson", "overview=full"])
+        if base_route is not None and not waypoints_str:
+            route_data = base_route
+        else:
+            with stage('osrm_final'):
+                route_data = as_route_response(get_osrm_request(
+                    *final_route_args(profile, origin, dest, waypoints_str, service)))
     except:
         return {'error': 'Falha na rota final'}
 
     # 3. PROCESSAR SEGMENTOS DE COR
-    weather_segments = []
+    segments_to_process, weather_results = [], []
+    if is_climatic and route_data.get('routes'):
+        print("--- Pintura Climática (Batch 150) ---")
+        segments_to_process = climatic_segments(route_data)
+        weather_results = get_weather_batch([seg['midpoint'] for seg in segments_to_process])
+
+    return finish_route(route_data, extra_info_markers, is_tourist, is_climatic,
+                        segments_to_process, weather_results, tolerance)
+
+
+async def aplan_route(profile, origin, dest, is_tourist=False, prefetch_weather=False):
+    """
+    Rota final (com desvio turístico, se pedido) sem meteorologia: devolve (route_data, marcadores).
+    Com `prefetch_weather`, a meteorologia da rota base é pedida enquanto se espera pela rota final.
+    Lança exceção se a rota final falhar.
+    """
+    waypoints_str = ""
+    service = "route"
+    extra_info_markers = []
+    base_route = None
+    prefetch = None
+
+    if is_tourist:
+        try:
+            with stage('osrm_base'):
+                base_route = await aget_osrm_request(*final_route_args(profile, origin, dest))
+            # Pesquisa de POIs é CPU (e pode reconstruir o índice a partir da BD): fora do event loop
+            extra_info_markers, waypoints_str, service = await db_sync_to_async(
+                plan_tourist_waypoints)(base_route, profile)
+            if prefetch_weather and waypoints_str and base_route.get('routes'):
+                # A rota final passa perto da base: aquece a cache de meteorologia em paralelo
+                midpoints = [seg['midpoint'] for seg in climatic_segments(base_route)]
+                prefetch = asyncio.ensure_future(aget_weather_batch(midpoints))
+        except Exception as e:
+            print(f"Erro Turismo: {e}")
+
+    if base_route is not None and not waypoints_str:
+        return base_route, extra_info_markers
+
+    try:
+        with stage('osrm_final'):
+            route_data = as_route_response(await aget_osrm_request(
+                *final_route_args(profile, origin, dest, waypoints_str, service)))
+    except Exception:
+        if prefetch: prefetch.cancel()
+        raise
+
+    if prefetch:
+        await asyncio.gather(prefetch, return_exceptions=True)
+    return route_data, extra_info_markers
+
 
+async def aget_route(profile, origin, dest, is_tourist=False, is_climatic=False, tolerance=None):
+    """
+    Versão assíncrona do get_route: os pedidos independentes correm em simultâneo
+    (ex: meteorologia da rota base enquanto se pede a rota final).
+    """
+    try:
+        route_data, extra_info_markers = await aplan_route(profile, origin, dest, is_tourist,
+                                                           prefetch_weather=is_climatic)
+    except Exception:
+        return {'error': 'Falha na rota final'}
+
+    segments_to_process, weather_results = [], []
+    if is_climatic:
+        segments_to_process = climatic_segments(route_data)
+        weather_results = await aget_weather_batch([seg['midpoint'] for seg in segments_to_process])
+
+    return finish_route(route_data, extra_info_markers, is_tourist, is_climatic,
+                        segments_to_process, weather_results, tolerance)
+
+
+async def aget_routes_batch(requests):
+    """
+    Várias rotas num só pedido. `requests` é uma lista de dicts com os argumentos do aget_route.
+    Pedidos repetidos são calculados uma vez, as rotas são pedidas em paralelo (até
+    ROUTE_BATCH_MAX_PARALLEL) e a meteorologia de todas as rotas climáticas é pedida de uma
+    só vez, para segmentos de rotas diferentes na mesma célula partilharem o pedido.
+    Devolve os resultados pela ordem de entrada, com {'error': ...} nos itens que falharem.
+    """
+    unique = {}
+    keys = []
+    for params in requests:
+        key = (params['profile'], quantize_coords(route_coords(params['origin'], params['dest']), OSRM_CACHE_PRECISION),
+               params['is_tourist'], params['is_climatic'], params.get('tolerance'))
+        unique.setdefault(key, params)
+        keys.append(key)
+
+    semaphore = asyncio.Semaphore(max(1, ROUTE_BATCH_MAX_PARALLEL))
+
+    async def plan(params):
+        async with semaphore:
+            try:
+                return await aplan_route(params['profile'], params['origin'], params['dest'], params['is_tourist'])
+            except Exception:
+                return None
+
+    planned = dict(zip(unique, await asyncio.gather(*[plan(p) for p in unique.values()])))
+
+    # Meteorologia partilhada: um único aget_weather_batch com os pontos médios de todas as rotas
+    segments = {}
+    midpoints = []
+    for key, params in unique.items():
+        if params['is_climatic'] and planned[key]:
+            segments[key] = climatic_segments(planned[key][0])
+            midpoints.extend(seg['midpoint'] for seg in segments[key])
+    weather = iter(await aget_weather_batch(midpoints))
+
+    results = {}
+    for key, params in unique.items():
+        if planned[key] is None:
+            results[key] = {'error': 'Falha na rota final'}
+            continue
+        route_data, extra_info_markers = planned[key]
+        segments_to_process = segments.get(key, [])
+        weather_results = [next(weather) for _ in segments_to_process]
+        results[key] = finish_route(route_data, extra_info_markers, params['is_tourist'], params['is_climatic'],
+                                    segments_to_process, weather_results, params.get('tolerance'))
+
+    return [results[key] for key in keys]
+
+
+async def astream_route(profile, origin, dest, is_tourist=False, is_climatic=False, tolerance=None):
+    """
+    Variante em streaming do aget_route: gera eventos (dicts) à medida que cada etapa termina.
+      base_route      -> geometria da rota base (só turística), logo após o 1º pedido OSRM
+      tourist_spots   -> POIs encontrados no corredor da rota base
+      route           -> rota final (sem meteorologia) e segmentos sem cor
+      weather         -> segmentos coloridos, um evento por lote de meteorologia
+      done | error
+    """
+    waypoints_str = ""
+    service = "route"
+    base_route = None
+
+    if is_tourist:
+        try:
+            with stage('osrm_base'):
+                base_route = await aget_osrm_request(*final_route_args(profile, origin, dest))
+            if base_route.get('routes'):
+                base_geometry = base_route['routes'][0]['geometry']['coordinates']
+                yield {'type': 'base_route', 'geometry': simplify(base_geometry, tolerance)}
+            extra_info_markers, waypoints_str, service = await db_sync_to_async(
+                plan_tourist_waypoints)(base_route, profile)
+            yield {'type': 'tourist_spots', 'tourist_spots': extra_info_markers}
+        except Exception as e:
+            print(f"Erro Turismo: {e}")
+
+    try:
+        if base_route is not None and not waypoints_str:
+            route_data = base_route
+        else:
+            with stage('osrm_final'):
+                route_data = as_route_response(await aget_osrm_request(
+                    *final_route_args(profile, origin, dest, waypoints_str, service)))
+    except Exception:
+        yield {'type': 'error', 'error': 'Falha na rota final'}
+        return
+
+    segments_to_process = []
+    weather_segments = []
     if route_data.get('routes'):
         main_route = route_data['routes'][0]
         geometry = main_route['geometry']['coordinates']
-        total_distance = main_route['distance']
-
         if is_climatic:
-            print("--- Pintura Climática (Batch 150) ---")
-
-            # Resolução dinâmica para garantir que não geramos 5000 pontos
-            # Mas mantemos bom detalhe
-            if total_distance > 500000:
-                SEGMENT_RESOLUTION = 10000  # 10km (rotas > 500km)
-            elif total_distance > 100000:
-                SEGMENT_RESOLUTION = 5000  # 5km (rotas > 100km)
-            else:
-                SEGMENT_RESOLUTION = 2000  # 2km (rotas curtas)
-
-            # Passo A: Criar segmentos
-            segments_to_process = []
-            current_segment = []
-            accumulated_dist = 0
-            last_pt = None
-
-            for i, pt in enumerate(geometry):
-                current_segment.append(pt)
-                if last_pt: accumulated_dist += haversine_distance(last_pt, pt)
-
-                # Corta segmento quando atinge resolução ou é o fim
-                if accumulated_dist >= SEGMENT_RESOLUTION or i == len(geometry) - 1:
-                    mid_pt = current_segment[len(current_segment) // 2]
-                    segments_to_process.append({
-                        'coords': current_segment,
-                        'midpoint': (mid_pt[1], mid_pt[0])
-                    })
-                    current_segment = [pt]
-                    accumulated_dist = 0
-                last_pt = pt
-
-            # Passo B: Batch Request Super Rápido
-            midpoints = [seg['midpoint'] for seg in segments_to_process]
-            weather_results = get_weather_batch(midpoints)
-
-            # Passo C: Colorir
-            for i, seg in enumerate(segments_to_process):
-                weather = weather_results[i] if i < len(weather_results) else None
-                color = '#8c03fc'
-                desc = 'Desconhecido'
-
-                if weather:
-                    code = weather.get('weather_code', 0)
-                    color, desc = get_weather_color_and_desc(code)
-
-                weather_segments.append({
-                    'coordinates': seg['coords'],
-                    'color': color,
-                    'description': desc
-                })
-
-        elif is_tourist:
-            weather_segments = [{'coordinates': geometry, 'color': '#f97316', 'description': 'Rota Turística'}]
+            segments_to_process = build_climatic_segments(geometry, main_route['distance'])
+            weather_segments = paint_climatic_segments(segments_to_process, [])
         else:
-            weather_segments = [{'coordinates': geometry, 'color': '#8c03fc', 'description': 'Rota Normal'}]
+            weather_segments = single_segment(geometry, is_tourist)
 
-    route_data['weather_segments'] = weather_segments
-    route_data['tourist_spots'] = extra_info_markers
+    simplify_route(route_data, weather_segments, tolerance)
+    yield {'type': 'route', 'route': route_data, 'weather_segments': weather_segments}
 
-    return route_data
+    if segments_to_process:
+        midpoints = [seg['midpoint'] for seg in segments_to_process]
+        async for indices, batch_results in aiter_weather_batches(midpoints):
+            # As coordenadas já foram enviadas no evento 'route': aqui só índice e cor
+            painted = paint_climatic_segments([{'coords': None}] * len(indices), batch_results)
+            yield {'type': 'weather',
+                   'segments': [{'index': i, 'color': seg['color'], 'description': seg['description']}
+                                for i, seg in zip(indices, painted)]}
+
+    yield {'type': 'done'}
 
 
 def get_nearest_service(profile, coordinates_str, number):
-    return get_osrm_request("nearest", "v1", profile, coordinates_str, ["number=" + str(number)])
+    with stage('osrm_nearest'):
+        return get_osrm_request("nearest", "v1", profile, coordinates_str, ["number=" + str(number)])
+
+
+async def aget_nearest_service(profile, coordinates_str, number):
+    with stage('osrm_nearest'):
+        return await aget_osrm_request("nearest", "v1", profile, coordinates_str, ["number=" + str(number)])
+
+
+# --- MATRIZES (serviço table) ---
+matrix_cache = TTLCache('matrix', MATRIX_CACHE_SIZE, OSRM_CACHE_TTL)
+
+
+def coords_key(coord):
+    return tuple(round(float(v), OSRM_CACHE_PRECISION) for v in coord)
+
+
+async def afetch_table_tile(profile, sources, destinations):
+    """Um pedido table ao OSRM; devolve {(origem, destino): (duração, distância)}."""
+    coords = sources + destinations
+    coords_str = ";".join(f"{lng},{lat}" for lng, lat in coords)
+    options = [
+        "sources=" + ";".join(str(i) for i in range(len(sources))),
+        "destinations=" + ";".join(str(len(sources) + j) for j in range(len(destinations))),
+        "annotations=duration,distance",
+    ]
+    data = await afetch_osrm("table", "v1", profile, coords_str, options)
+    durations = data.get('durations') or []
+    distances = data.get('distances') or []
+    cells = {}
+    for i, src in enumerate(sources):
+        for j, dst in enumerate(destinations):
+            duration = durations[i][j] if i < len(durations) else None
+            distance = distances[i][j] if i < len(distances) else None
+            cells[(src, dst)] = (duration, distance)
+    return cells
+
+
+def tile_block(block_sources, block_destinations):
+    return [(src_chunk, dst_chunk)
+            for src_chunk in chunk_list(block_sources, MATRIX_TILE_SIZE)
+            for dst_chunk in chunk_list(block_destinations, MATRIX_TILE_SIZE)]
+
+
+def missing_tiles(missing):
+    """
+    Tiles a pedir para os pares em falta ({origem: [destinos]}). As origens com os mesmos destinos
+    em falta formam um bloco: uma origem e um destino novos numa matriz em cache dão uma linha
+    (origem nova x todos os destinos) e uma coluna (origens em cache x destino novo), não a matriz
+    inteira. Só se os blocos precisarem de mais rondas de MATRIX_MAX_PARALLEL pedidos que o produto
+    cruzado (muitas origens com destinos em falta diferentes) é que se pede o produto.
+    """
+    blocks = {}
+    for src, dsts in missing.items():
+        blocks.setdefault(tuple(dsts), []).append(src)
+    tiles = [tile for dsts, srcs in blocks.items() for tile in tile_block(srcs, list(dsts))]
+    cross = tile_block(list(missing), list(dict.fromkeys(d for dsts in missing.values() for d in dsts)))
+    parallel = max(1, MATRIX_MAX_PARALLEL)
+    return tiles if math.ceil(len(tiles) / parallel) <= math.ceil(len(cross) / parallel) else cross
+
+
+async def aget_table(profile, sources, destinations):
+    """
+    Matriz NxM de durações (s) e distâncias (m) pelo serviço table do OSRM.
+    Os pares já calculados vêm da cache (por par origem/destino, por isso matrizes que partilham
+    origens ou destinos reaproveitam trabalho); os restantes são pedidos em tiles de no máximo
+    MATRIX_TILE_SIZE x MATRIX_TILE_SIZE, em paralelo, e cosidos de volta na matriz.
+    """
+    sources = [coords_key(c) for c in sources]
+    destinations = [coords_key(c) for c in destinations]
+
+    cells = {}
+    missing = {}  # origem -> destinos em falta
+    for src in dict.fromkeys(sources):
+        for dst in dict.fromkeys(destinations):
+            cached = matrix_cache.get((profile, src, dst))
+            if cached is None:
+                missing.setdefault(src, []).append(dst)
+            else:
+                cells[(src, dst)] = cached
+
+    tiles = missing_tiles(missing)
+    semaphore = asyncio.Semaphore(max(1, MATRIX_MAX_PARALLEL))
+
+    async def fetch(tile):
+        async with semaphore:
+            return await afetch_table_tile(profile, *tile)
+
+    with stage('osrm_table'):
+        fetched = await asyncio.gather(*[fetch(tile) for tile in tiles])
+    for tile_cells in fetched:
+        for (src, dst), value in tile_cells.items():
+            matrix_cache.set((profile, src, dst), value)
+            cells.setdefault((src, dst), value)
+
+    return {
+        'code': 'Ok',
+        'durations': [[cells[(src, dst)][0] for dst in destinations] for src in sources],
+        'distances': [[cells[(src, dst)][1] for dst in destinations] for src in sources],
+        'sources': [list(c) for c in sources],
+        'destinations': [list(c) for c in destinations],
+    }
@@ -0,0 +1,239 @@
+"""
+Cache persistente (SQLite num ficheiro próprio, em modo WAL) por trás das caches em memória
+do OSRM, do Nominatim e da meteorologia: sobrevive a reinícios e é partilhada por todos os
+processos do gunicorn, por isso um worker novo já arranca com as respostas dos outros.
+
+Cada cache é um namespace com o seu TTL (o da TTLCache) e um limite de bytes; acima do limite
+saem primeiro as entradas que expiram mais cedo. A limpeza corre numa thread de cada processo
+(PERSISTENT_CACHE_EVICT_INTERVAL), nunca durante um pedido. Erros do SQLite (ficheiro ocupado,
+disco cheio) nunca chegam ao pedido: contam como miss.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .config import PERSISTENT_CACHE_BUSY_TIMEOUT, PERSISTENT_CACHE_EVICT_INTERVAL, PERSISTENT_CACHE_MAX_BYTES
+from .config import PERSISTENT_CACHE_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (namespace, expires);
+CREATE TABLE IF NOT EXISTS token_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Mantém as entradas que expiram mais tarde até somarem `max_bytes`; apaga as restantes
+EVICT_SQL = """
+DELETE FROM entries WHERE namespace = ? AND key IN (
+    SELECT key FROM (
+        SELECT key, SUM(size) OVER (ORDER BY expires DESC ROWS UNBOUNDED PRECEDING) AS kept
+        FROM entries WHERE namespace = ?
+    ) WHERE kept > ?
+)
+"""
+
+# Chaves por consulta no get_many (o SQLite limita o número de parâmetros por instrução)
+GET_MANY_CHUNK = 500
+
+
+def refill_tokens(row, now, rate, burst):
+    # Fichas do balde `row` (tokens, updated) no instante `now`; um balde novo começa cheio
+    if row is None:
+        return float(burst)
+    tokens, updated = row
+    return min(float(burst), tokens + max(0.0, now - updated) * rate)
+
+
+def encode_key(key):
+    # As chaves das caches são tuplos de str/int/float: o repr é estável entre processos
+    return repr(key)
+
+
+class PersistentStore:
+
+    def __init__(self, path, max_bytes=None, busy_timeout=PERSISTENT_CACHE_BUSY_TIMEOUT,
+                 evict_interval=PERSISTENT_CACHE_EVICT_INTERVAL):
+        self.path = str(path)
+        self.max_bytes = PERSISTENT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.busy_timeout = busy_timeout
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._evictor = None
+        self._closed = threading.Event()
+        self.errors = 0
+
+    def connection(self):
+        # Uma ligação por thread e por processo (as ligações não atravessam um fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # em WAL só perde as últimas escritas numa falha de energia
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _error(self, e):
+        self.errors += 1
+        print(f"Erro na cache persistente ({self.path}): {e}")
+
+    def _execute(self, sql, params=()):
+        try:
+            return self.connection().execute(sql, params)
+        except sqlite3.Error as e:
+            self._error(e)
+            return None
+
+    def _executemany(self, sql, rows):
+        # Uma só transação para todas as linhas (em autocommit cada INSERT seria um commit)
+        try:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self._error(e)
+
+    def get(self, namespace, key, stale=False):
+        """(valor, segundos até expirar) ou None. Com `stale` aceita entradas expiradas ainda no período stale."""
+        return self.get_many(namespace, [key], stale).get(key)
+
+    def get_many(self, namespace, keys, stale=False):
+        """{chave: (valor, segundos até expirar)} das chaves encontradas, com uma consulta por GET_MANY_CHUNK chaves."""
+        now = time.time()
+        column = 'stale_until' if stale else 'expires'
+        encoded = {encode_key(key): key for key in keys}
+        names = list(encoded)
+        found = {}
+        for i in range(0, len(names), GET_MANY_CHUNK):
+            chunk = names[i:i + GET_MANY_CHUNK]
+            cursor = self._execute(
+                f"SELECT key, value, expires FROM entries WHERE namespace = ? AND {column} > ? "
+                f"AND key IN ({','.join('?' * len(chunk))})",
+                (namespace, now, *chunk))
+            for name, value, expires in (cursor.fetchall() if cursor else ()):
+                found[encoded[name]] = (json.loads(value), expires - now)
+        return found
+
+    def set(self, namespace, key, value, ttl, stale_ttl=0):
+        self.set_many(namespace, {key: value}, ttl, stale_ttl)
+
+    def set_many(self, namespace, items, ttl, stale_ttl=0):
+        """Guarda {chave: valor} numa só transação; todos com o mesmo TTL."""
+        expires = time.time() + ttl
+        rows = []
+        for key, value in items.items():
+            try:
+                data = json.dumps(value, separators=(',', ':'))
+            except (TypeError, ValueError):
+                continue  # só valores JSON (todas as respostas externas o são)
+            rows.append((namespace, encode_key(key), data, expires, expires + stale_ttl, len(data)))
+        if rows:
+            self._executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._ensure_evictor()
+
+    def _ensure_evictor(self):
+        # Arranque preguiçoso (na primeira escrita): depois de um fork a thread do pai não existe
+        if not self.evict_interval or (self._evictor is not None and self._evictor.is_alive()):
+            return
+        with self._lock:
+            if self._closed.is_set() or (self._evictor is not None and self._evictor.is_alive()):
+                return
+            self._evictor = threading.Thread(target=self._evict_loop, name='persistent-cache-evictor', daemon=True)
+            self._evictor.start()
+
+    def _evict_loop(self):
+        while not self._closed.wait(self.evict_interval):
+            self.evict_all()
+
+    def close(self):
+        """Para a thread de limpeza (o ficheiro continua utilizável)."""
+        self._closed.set()
+
+    def evict_all(self):
+        cursor = self._execute("SELECT DISTINCT namespace FROM entries")
+        for (namespace,) in (cursor.fetchall() if cursor else ()):
+            self.evict(namespace)
+
+    def evict(self, namespace):
+        """Apaga as entradas fora do período stale e, acima do limite de bytes, as que expiram mais cedo."""
+        self._execute("DELETE FROM entries WHERE namespace = ? AND stale_until <= ?", (namespace, time.time()))
+        limit = self.max_bytes.get(namespace)
+        if limit is not None:
+            self._execute(EVICT_SQL, (namespace, namespace, limit))
+
+    def clear(self, namespace):
+        self._execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def take_token(self, name, rate, burst):
+        """
+        Tira uma ficha do balde `name` partilhado por todos os processos (transação BEGIN IMMEDIATE).
+        Devolve (espera, fichas que ficaram): espera 0 se tirou, os segundos até haver ficha se não
+        tirou; None se o SQLite falhou.
+        """
+        try:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (name,)).fetchone()
+                tokens = refill_tokens(row, now, rate, burst)
+                wait = max(0.0, (1 - tokens) / rate)
+                if wait == 0:
+                    tokens -= 1
+                conn.execute("INSERT OR REPLACE INTO token_buckets VALUES (?, ?, ?)", (name, tokens, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return wait, tokens
+        except sqlite3.Error as e:
+            self._error(e)
+            return None
+
+    def stats(self, namespace):
+        cursor = self._execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?",
+                               (namespace,))
+        count, size = cursor.fetchone() if cursor else (0, 0)
+        return {'entries': count, 'bytes': size}
+
+
+_UNSET = object()
+_store = _UNSET
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """O PersistentStore do processo, ou None se PERSISTENT_CACHE_PATH estiver vazio."""
+    global _store
+    if _store is _UNSET:
+        with _store_lock:
+            if _store is _UNSET:
+                _store = PersistentStore(PERSISTENT_CACHE_PATH) if PERSISTENT_CACHE_PATH else None
+    return _store
+
+
+def use_store(store):
+    """Troca o store usado pelas caches (None desliga); testes e benchmarks não tocam no do servidor."""
+    global _store
+    with _store_lock:
+        _store = store
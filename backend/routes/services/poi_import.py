@@ -0,0 +1,57 @@
+import csv
+import hashlib
+import sys
+from collections import Counter
+
+# Aumentar o limite de tamanho de campo do CSV para evitar erros em linhas gigantes
+csv.field_size_limit(sys.maxsize)
+
+CATEGORY_COLUMNS = ('tourism', 'historic', 'amenity', 'natural', 'leisure')
+
+
+def source_key(name, lat, lng, osm_type=None, osm_id=None):
+    """
+    Identidade estável de um POI entre importações: "node/123" quando o export do Overpass
+    traz @type/@id; senão um hash do nome e das coordenadas (um POI que mude de sítio
+    conta como removido + novo).
+    """
+    if osm_type and osm_id:
+        return f"{osm_type}/{osm_id}"
+    digest = hashlib.sha1(f"{name}|{float(lat):.7f}|{float(lng):.7f}".encode('utf-8')).hexdigest()
+    return f"h:{digest[:24]}"
+
+
+def dedupe_key(key, seen):
+    # Pontos repetidos (mesmo nome e coordenadas) recebem sufixo pela ordem em que aparecem
+    seen[key] += 1
+    return key if seen[key] == 1 else f"{key}#{seen[key]}"
+
+
+def iter_points(file_path):
+    """Lê o TSV do Overpass Turbo em streaming: gera (source_key, name, category, lat, lng)."""
+    seen = Counter()
+    with open(file_path, 'r', encoding='utf-8') as csvfile:
+        # O Overpass Turbo configurámos para usar TAB (\t)
+        reader = csv.DictReader(csvfile, delimiter='\t')
+
+        for row in reader:
+            name = row.get('name')
+            if not name: continue
+
+            # Tentar descobrir a categoria olhando para todas as colunas possíveis
+            cat = next((row[c] for c in CATEGORY_COLUMNS if row.get(c)), 'ponto de interesse')
+
+            if not row.get('@lat') or not row.get('@lon'):
+                continue
+            try:
+                lat, lng = float(row['@lat']), float(row['@lon'])
+            except ValueError:
+                continue
+
+            key = dedupe_key(source_key(name, lat, lng, row.get('@type'), row.get('@id')), seen)
+            yield key, name, cat, lat, lng
+
+
+def parse_file(file_path):
+    # Usado pelos processos do ProcessPoolExecutor (ficheiros regionais em paralelo)
+    return list(iter_points(file_path))
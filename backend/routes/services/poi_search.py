@@ -0,0 +1,93 @@
+import bisect
+import threading
+from collections import defaultdict
+
+from .spatial_index import get_poi_index
+from .utils import normalize_text
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PoiNameIndex:
+    """
+    Índice local de nomes de POIs para autocomplete sem rede:
+    prefixos por pesquisa binária numa lista ordenada e trigramas para erros de escrita.
+    """
+
+    def __init__(self, points):
+        by_name = defaultdict(list)
+        for poi in points:
+            by_name[normalize_text(poi['name'])].append(poi)
+        self._by_name = dict(by_name)
+        self._names = sorted(self._by_name)
+        self._trigrams = defaultdict(set)
+        for name in self._names:
+            for gram in trigrams(name):
+                self._trigrams[gram].add(name)
+
+    def prefix(self, query, limit):
+        names = []
+        i = bisect.bisect_left(self._names, query)
+        while i < len(self._names) and len(names) < limit and self._names[i].startswith(query):
+            names.append(self._names[i])
+            i += 1
+        return names
+
+    def fuzzy(self, query, limit, min_score=0.3):
+        grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in grams:
+            for name in self._trigrams.get(gram, ()):
+                shared[name] += 1
+        scored = []
+        for name, count in shared.items():
+            # Coeficiente de Jaccard sobre os trigramas
+            score = count / (len(grams) + len(trigrams(name)) - count)
+            if score >= min_score:
+                scored.append((-score, name))
+        scored.sort()
+        return [name for _, name in scored[:limit]]
+
+    def search(self, query, limit=5):
+        query = normalize_text(query)
+        if not query:
+            return []
+        names = self.prefix(query, limit)
+        if len(names) < limit:
+            names += [n for n in self.fuzzy(query, limit) if n not in names][:limit - len(names)]
+        results = []
+        for name in names:
+            for poi in self._by_name[name]:
+                results.append(poi)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+_name_index = None
+_lock = threading.Lock()
+
+
+def get_name_index():
+    # Reconstruído sempre que o índice espacial (e portanto a tabela) muda
+    global _name_index
+    poi_index = get_poi_index()
+    current = _name_index
+    if current is None or current[0] is not poi_index:
+        with _lock:
+            if _name_index is None or _name_index[0] is not poi_index:
+                _name_index = (poi_index, PoiNameIndex(poi_index.points))
+            current = _name_index
+    return current[1]
+
+
+def autocomplete(query, limit=5):
+    """Sugestões locais no formato do Nominatim (display_name, lat, lon)."""
+    return [
+        {'display_name': poi['name'], 'lat': str(poi['lat']), 'lon': str(poi['lon']),
+         'type': poi['category'], 'source': 'local'}
+        for poi in get_name_index().search(query, limit)
+    ]
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import math
+
+from .cache import TTLCache
+from .config import (
+    POI_TILE_CLUSTER_MAX_ZOOM, POI_TILE_CLUSTER_RADIUS, POI_TILE_CACHE_SIZE, POI_TILE_CACHE_TTL
+)
+from .spatial_index import get_poi_index
+
+TILE_SIZE = 256  # píxeis
+MAX_MERCATOR_LAT = 85.0511287798
+
+# (geração do índice, z, x, y) -> (corpo GeoJSON em bytes, ETag)
+tile_cache = TTLCache('poi_tiles', POI_TILE_CACHE_SIZE, POI_TILE_CACHE_TTL)
+
+
+def tile_bounds(z, x, y):
+    """Caixa (min_lat, min_lng, max_lat, max_lng) do tile XYZ (Web Mercator)."""
+    n = 2 ** z
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def world_pixel(lat, lng, z):
+    # Coordenadas em píxeis no mundo inteiro ao zoom z
+    lat = min(max(lat, -MAX_MERCATOR_LAT), MAX_MERCATOR_LAT)
+    scale = TILE_SIZE * 2 ** z
+    px = (lng + 180.0) / 360.0 * scale
+    sin = math.sin(math.radians(lat))
+    py = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * scale
+    return px, py
+
+
+def point_feature(poi):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [poi['lon'], poi['lat']]},
+        'properties': {'id': poi['id'], 'name': poi['name'], 'category': poi['category']},
+    }
+
+
+def cluster_features(pois, z):
+    """Agrupa os POIs numa grelha de POI_TILE_CLUSTER_RADIUS píxeis; grupos de 1 ficam como ponto."""
+    cells = {}
+    for poi in pois:
+        px, py = world_pixel(poi['lat'], poi['lon'], z)
+        cells.setdefault((int(px // POI_TILE_CLUSTER_RADIUS), int(py // POI_TILE_CLUSTER_RADIUS)), []).append(poi)
+
+    features = []
+    for members in cells.values():
+        if len(members) == 1:
+            features.append(point_feature(members[0]))
+            continue
+        lat = sum(p['lat'] for p in members) / len(members)
+        lng = sum(p['lon'] for p in members) / len(members)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(lng, 6), round(lat, 6)]},
+            'properties': {'cluster': True, 'point_count': len(members)},
+        })
+    return features
+
+
+def build_tile(index, z, x, y):
+    pois = sorted(index.query_bbox(*tile_bounds(z, x, y)), key=lambda p: p['id'])
+    if z <= POI_TILE_CLUSTER_MAX_ZOOM:
+        features = cluster_features(pois, z)
+    else:
+        features = [point_feature(poi) for poi in pois]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_tile(z, x, y):
+    """
+    Devolve (corpo, etag) do tile já serializado. A cache é por geração do índice de POIs,
+    por isso o load_points (que reconstrói o índice) invalida todos os tiles.
+    O ETag é o hash do conteúdo: igual em todos os workers.
+    """
+    index = get_poi_index()
+    key = (index.generation, z, x, y)
+    cached = tile_cache.get(key)
+    if cached is not None:
+        return cached
+
+    body = json.dumps(build_tile(index, z, x, y), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    result = (body, f'"{hashlib.sha1(body).hexdigest()[:32]}"')
+    tile_cache.set(key, result)
+    return result
@@ -0,0 +1,236 @@
+"""
+Resiliência dos pedidos às APIs externas: disjuntor por servidor, prazo (deadline) do
+pedido à nossa API propagado a todos os pedidos externos, e GETs em duplicado (hedging).
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from .config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+from .metrics import Counter
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+breaker_transitions = Counter('bettermaps_breaker_transitions_total', 'Mudanças de estado dos disjuntores',
+                              ['upstream', 'state'])
+breaker_rejections = Counter('bettermaps_breaker_rejections_total', 'Pedidos recusados com o disjuntor aberto',
+                             ['upstream'])
+hedged_requests = Counter('bettermaps_upstream_hedges_total', 'GETs repetidos por a resposta tardar',
+                          ['upstream'])
+
+
+class CircuitOpenError(httpx.TransportError):
+    """O disjuntor do servidor está aberto: o pedido nem chega a ser feito."""
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Já não há tempo no prazo do pedido para mais um pedido externo."""
+
+
+class CircuitBreaker:
+    """
+    Abre ao fim de BREAKER_FAILURE_THRESHOLD falhas seguidas (exceções, 5xx, 429); aberto recusa
+    logo os pedidos. Passados BREAKER_RESET_TIMEOUT segundos deixa passar um pedido de teste
+    (meio-aberto): se correr bem fecha, senão volta a abrir.
+    """
+
+    def __init__(self, host, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            breaker_transitions.inc(self.host, state)
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        breaker_rejections.inc(self.host)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        # Pedido sem veredicto (ex: cortado pelo nosso prazo): liberta a vaga de teste
+        with self._lock:
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_failure(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+# --- PRAZO DO PEDIDO ---
+# Instante (time.monotonic) até ao qual o pedido atual à nossa API tem de responder
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Limita tudo o que corre dentro do bloco a `seconds` (nunca alarga um prazo já definido)."""
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def detached_deadline(seconds):
+    """Prazo próprio de `seconds`, ignorando o do pedido atual: para trabalho partilhado por vários pedidos."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Segundos até ao fim do prazo do pedido atual, ou None se não houver prazo."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def clamp_timeout(timeout):
+    """
+    Devolve (timeout a usar, foi encurtado?) respeitando o prazo do pedido.
+    Lança DeadlineExceeded se o prazo já acabou.
+    """
+    left = remaining_time()
+    if left is None:
+        return timeout, False
+    if left <= 0:
+        raise DeadlineExceeded("Prazo do pedido esgotado")
+    if timeout is None or left < timeout:
+        return left, True
+    return timeout, False
+
+
+# --- PEDIDOS PROTEGIDOS ---
+def allowed_timeout(breaker, timeout):
+    """Passa o disjuntor e devolve clamp_timeout(timeout); o prazo esgotado do cliente não conta como falha."""
+    if not breaker.allow():
+        raise CircuitOpenError(f"Disjuntor aberto para {breaker.host}")
+    try:
+        return clamp_timeout(timeout)
+    except DeadlineExceeded:
+        breaker.release()  # sem pedido feito: liberta a vaga de teste (meio-aberto) sem veredicto
+        raise
+
+
+def guarded_get(host, send, url, kwargs):
+    """Faz o GET síncrono `send(url, **kwargs)` com o disjuntor do servidor e o prazo do pedido."""
+    breaker = get_breaker(host)
+    kwargs['timeout'], clamped = allowed_timeout(breaker, kwargs.get('timeout'))
+    try:
+        response = send(url, **kwargs)
+    except httpx.TimeoutException:
+        # Timeout causado pelo nosso prazo (mais curto que o normal) não é culpa do servidor
+        if clamped: breaker.release()
+        else: breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    if is_failure(response):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def aguarded_get(host, send, url, kwargs, hedge_delay=None):
+    """
+    Versão assíncrona do guarded_get. Com `hedge_delay`, se a resposta tardar mais do que isso
+    faz um segundo GET igual e fica com a primeira resposta boa (só para pedidos idempotentes).
+    """
+    breaker = get_breaker(host)
+    kwargs['timeout'], clamped = allowed_timeout(breaker, kwargs.get('timeout'))
+    try:
+        if hedge_delay is None or (kwargs['timeout'] is not None and kwargs['timeout'] <= hedge_delay):
+            response = await send(url, **kwargs)
+        else:
+            response = await hedged(host, send, url, kwargs, hedge_delay)
+    except httpx.TimeoutException:
+        if clamped: breaker.release()
+        else: breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    if is_failure(response):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def hedged(host, send, url, kwargs, delay):
+    first = asyncio.ensure_future(send(url, **kwargs))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    hedged_requests.inc(host)
+    pending = {first, asyncio.ensure_future(send(url, **kwargs))}
+    last = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and not is_failure(task.result()):
+                    return task.result()
+        # Os dois falharam: devolve/lança o resultado do último
+        return last.result()
+    finally:
+        for task in pending:
+            task.cancel()
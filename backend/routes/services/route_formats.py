@@ -0,0 +1,73 @@
+from .geometry import encode_polyline
+from .osrm_service import segments_tile_geometry
+
+# Formatos de resposta da rota: JSON normal, JSON com polyline6 e MessagePack (polyline6 em binário)
+FORMAT_JSON = 'json'
+FORMAT_POLYLINE6 = 'polyline6'
+FORMAT_MSGPACK = 'msgpack'
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+def negotiate_format(params, accept):
+    """`format` na query tem prioridade; senão o header Accept decide."""
+    requested = params.get('format')
+    if requested:
+        return requested
+    if any(ct in (accept or '') for ct in MSGPACK_CONTENT_TYPES):
+        return FORMAT_MSGPACK
+    return FORMAT_JSON
+
+
+def encode_geometry(geometry):
+    if isinstance(geometry, dict) and 'coordinates' in geometry:
+        return encode_polyline(geometry['coordinates'])
+    return geometry
+
+
+def compact_route(route_data):
+    """
+    Converte a resposta do get_route para polyline6: a geometria principal e a de cada step
+    passam a strings e os weather_segments passam a intervalos de índices [início, fim]
+    na polyline principal em vez de cópias das coordenadas.
+    """
+    if not route_data.get('routes'):
+        return route_data
+
+    main_route = route_data['routes'][0]
+    geometry = main_route['geometry']['coordinates']
+    segments = route_data.get('weather_segments', [])
+
+    compact_segments = []
+    if segments_tile_geometry(segments, geometry):
+        start = 0
+        for seg in segments:
+            end = start + len(seg['coordinates']) - 1
+            compact_segments.append({'range': [start, end], 'color': seg['color'], 'description': seg['description']})
+            start = end
+    else:
+        for seg in segments:
+            compact_segments.append({'geometry': encode_polyline(seg['coordinates']),
+                                     'color': seg['color'], 'description': seg['description']})
+
+    routes = []
+    for route in route_data['routes']:
+        route = {**route, 'geometry': encode_geometry(route['geometry'])}
+        if 'legs' in route:
+            route['legs'] = [
+                {**leg, 'steps': [{**step, 'geometry': encode_geometry(step.get('geometry'))}
+                                  for step in leg.get('steps', [])]}
+                for leg in route['legs']
+            ]
+        routes.append(route)
+
+    return {**route_data, 'routes': routes, 'weather_segments': compact_segments,
+            'geometry_format': FORMAT_POLYLINE6}
+
+
+def pack(data):
+    import msgpack  # dependência opcional: só necessária para respostas binárias
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def pack_route(route_data):
+    return pack(compact_route(route_data))
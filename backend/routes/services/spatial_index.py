@@ -0,0 +1,168 @@
+import itertools
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from .config import POI_INDEX_CELL_SIZE, POI_INDEX_CHECK_INTERVAL, POI_DATASET_STAMP
+from .utils import haversine_distance
+
+METERS_PER_DEG_LAT = 111320.0
+_generations = itertools.count(1)
+
+
+class PoiGridIndex:
+    """
+    Índice espacial em memória (grelha de baldes lat/lng) sobre os pontos turísticos.
+    Cada célula tem POI_INDEX_CELL_SIZE graus; uma pesquisa por raio só visita
+    as células que intersetam a caixa envolvente do círculo.
+    """
+
+    def __init__(self, points, cell_size=POI_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)
+        self.points = list(points)
+        self.size = len(self.points)
+        # Muda a cada reconstrução: chave das caches derivadas do índice (ex: tiles)
+        self.generation = next(_generations)
+        for poi in self.points:
+            self._cells[self._cell(poi['lat'], poi['lon'])].append(poi)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size))
+
+    def query_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        i0, j0 = self._cell(min_lat, min_lng)
+        i1, j1 = self._cell(max_lat, max_lng)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            # Caixa grande (tiles de zoom baixo): percorrer só as células ocupadas
+            cells = (pois for (i, j), pois in self._cells.items() if i0 <= i <= i1 and j0 <= j <= j1)
+        else:
+            cells = (self._cells.get((i, j), ()) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+        for pois in cells:
+            for poi in pois:
+                if min_lat <= poi['lat'] <= max_lat and min_lng <= poi['lon'] <= max_lng:
+                    yield poi
+
+    def query_radius(self, lat, lng, radius):
+        """Devolve [(distância, poi), ...] dentro de `radius` metros, ordenado por distância."""
+        dlat = radius / METERS_PER_DEG_LAT
+        dlng = radius / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        found = []
+        for poi in self.query_bbox(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+            d = haversine_distance((lng, lat), (poi['lon'], poi['lat']))
+            if d <= radius:
+                found.append((d, poi))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def query_corridor(self, polyline, buffer):
+        """
+        Pesquisa num só passo todos os POIs a menos de `buffer` metros da polilinha
+        [[lon, lat], ...]. Devolve [(distância ao longo da rota, afastamento, poi), ...]
+        ordenado pela distância ao longo da rota; cada POI aparece uma vez (por id).
+        """
+        if not polyline:
+            return []
+        if len(polyline) == 1:
+            return [(0.0, d, poi) for d, poi in self.query_radius(polyline[0][1], polyline[0][0], buffer)]
+
+        best = {}
+        along = 0.0
+        dlat = buffer / METERS_PER_DEG_LAT
+        for (lng1, lat1), (lng2, lat2) in zip(polyline, polyline[1:]):
+            # Projeção equirectangular local ao segmento (erro desprezável à escala do buffer)
+            kx = METERS_PER_DEG_LAT * math.cos(math.radians((lat1 + lat2) / 2))
+            ky = METERS_PER_DEG_LAT
+            sx, sy = (lng2 - lng1) * kx, (lat2 - lat1) * ky
+            seg_len2 = sx * sx + sy * sy
+            seg_len = math.sqrt(seg_len2)
+            dlng = buffer / max(kx, 1e-6)
+
+            for poi in self.query_bbox(min(lat1, lat2) - dlat, min(lng1, lng2) - dlng,
+                                       max(lat1, lat2) + dlat, max(lng1, lng2) + dlng):
+                px, py = (poi['lon'] - lng1) * kx, (poi['lat'] - lat1) * ky
+                t = (px * sx + py * sy) / seg_len2 if seg_len2 else 0.0
+                t = min(1.0, max(0.0, t))
+                dx, dy = px - t * sx, py - t * sy
+                offset = math.sqrt(dx * dx + dy * dy)
+                if offset > buffer:
+                    continue
+                prev = best.get(poi['id'])
+                if prev is None or offset < prev[1]:
+                    best[poi['id']] = (along + t * seg_len, offset, poi)
+            along += seg_len
+
+        return sorted(best.values(), key=lambda item: item[0])
+
+
+# --- ÍNDICE DO PROCESSO ---
+_index = None
+_index_version = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def _dataset_version():
+    # O load_points corre noutro processo: toca no ficheiro-carimbo quando muda a tabela
+    try:
+        return os.stat(POI_DATASET_STAMP).st_mtime_ns
+    except OSError:
+        return None
+
+
+def bump_dataset_version():
+    """Marca a tabela de POIs como alterada (invalida os índices de todos os processos)."""
+    with open(POI_DATASET_STAMP, 'a'):
+        os.utime(POI_DATASET_STAMP, None)
+    invalidate_poi_index()
+
+
+def invalidate_poi_index(*args, **kwargs):
+    # Assinatura compatível com receivers de signals (post_save/post_delete)
+    global _index
+    with _lock:
+        _index = None
+
+
+def _load_points():
+    from ..models import SimpleTouristPoint
+    rows = SimpleTouristPoint.objects.values_list('id', 'name', 'category', 'lat', 'lng')
+    return [
+        {'id': pk, 'lat': lat, 'lon': lng, 'name': name, 'category': category}
+        for pk, name, category, lat, lng in rows.iterator(chunk_size=10000)
+    ]
+
+
+def get_poi_index(block=True):
+    """
+    Devolve o índice do processo, reconstruindo-o se a tabela mudou. Com `block=False`, se outro
+    pedido já estiver a reconstruí-lo devolve None em vez de esperar (quem chama vai à BD).
+    """
+    global _index, _index_version, _last_check
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _last_check < POI_INDEX_CHECK_INTERVAL:
+        return index
+
+    version = _dataset_version()
+    if not _lock.acquire(blocking=block):
+        return index if index is not None and version == _index_version else None
+    try:
+        _last_check = now
+        if _index is None or version != _index_version:
+            _index = PoiGridIndex(_load_points())
+            _index_version = version
+        return _index
+    finally:
+        _lock.release()
+
+
+def warm_poi_index():
+    """Constrói o índice no arranque do worker para o primeiro pedido não pagar o custo."""
+    try:
+        index = get_poi_index()
+        print(f"Índice de POIs carregado: {index.size} pontos")
+    except Exception as e:
+        print(f"Erro ao carregar índice de POIs: {e}")
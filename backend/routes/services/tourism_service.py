@@ -1,18 +1,61 @@
-from ..models import SimpleTouristPoint
-from .utils import haversine_distance
+import math
+
+from .config import POI_INDEX_ENABLED
+from .metrics import stage
+from .spatial_index import METERS_PER_DEG_LAT, PoiGridIndex, get_poi_index
+from .utils import chunk_list
+
+# Vértices por caixa envolvente nas pesquisas de corredor feitas na BD
+CORRIDOR_DB_CHUNK = 100
+
+
+def current_poi_index():
+    # Enquanto outro pedido reconstrói o índice (ex: depois de um load_points) as pesquisas
+    # vão à BD pela R*Tree em vez de ficarem todas à espera da leitura da tabela inteira
+    return get_poi_index(block=False) if POI_INDEX_ENABLED else None
 
 
 def find_pois_near_point_local(lat, lng, radius, exclude_names=[]):
-    delta = 0.0015
-    min_lat, max_lat = lat - delta, lat + delta
-    min_lon, max_lon = lng - delta, lng + delta
-    candidates = SimpleTouristPoint.objects.filter(
-        lat__gte=min_lat, lat__lte=max_lat,
-        lng__gte=min_lon, lng__lte=max_lon
-    ).exclude(name__in=exclude_names)
+    # Pesquisa no índice em memória do processo (sem ir à BD), ou na BD se o índice estiver desligado
+    excluded = set(exclude_names)
+    with stage('pois'):
+        index = current_poi_index()
+        if index is not None:
+            candidates = index.query_radius(lat, lng, radius)
+        else:
+            from ..models import SimpleTouristPoint
+            candidates = [(d, poi.as_dict()) for d, poi in SimpleTouristPoint.objects.within_radius(lat, lng, radius)]
+
     found = []
-    for poi in candidates:
-        if haversine_distance((lng, lat), (poi.lng, poi.lat)) <= radius:
-            found.append({'lat': poi.lat, 'lon': poi.lng, 'name': poi.name, 'category': poi.category})
+    for _, poi in candidates:
+        if poi['name'] not in excluded:
+            found.append(dict(poi))
     return found
 
+
+def corridor_index_from_db(geometry, radius):
+    """Índice só com os POIs perto da rota, lidos da BD por caixas de CORRIDOR_DB_CHUNK vértices."""
+    from ..models import SimpleTouristPoint
+    points = {}
+    dlat = radius / METERS_PER_DEG_LAT
+    for chunk in chunk_list(geometry, CORRIDOR_DB_CHUNK):
+        lats = [pt[1] for pt in chunk]
+        lngs = [pt[0] for pt in chunk]
+        dlng = radius / (METERS_PER_DEG_LAT * max(math.cos(math.radians(max(map(abs, lats)))), 1e-6))
+        for poi in SimpleTouristPoint.objects.in_bbox(min(lats) - dlat, min(lngs) - dlng,
+                                                      max(lats) + dlat, max(lngs) + dlng):
+            points[poi.id] = poi.as_dict()
+    return PoiGridIndex(points.values())
+
+
+def find_pois_along_route(geometry, radius):
+    """
+    Todos os POIs no corredor de `radius` metros à volta da geometria [[lon, lat], ...],
+    ordenados pela distância ao longo da rota e sem duplicados (por id).
+    """
+    with stage('pois'):
+        index = current_poi_index() or corridor_index_from_db(geometry, radius)
+        found = []
+        for along, offset, poi in index.query_corridor(geometry, radius):
+            found.append({**poi, 'along_route': round(along), 'offset': round(offset)})
+    return found
@@ -1,4 +1,9 @@
+import functools
 import math
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
 
 
 def haversine_distance(coord1, coord2):
@@ -17,3 +22,29 @@ def chunk_list(lst, n):
     # Divide lista em pedaços de tamanho N
     return [lst[i:i + n] for i in range(0, len(lst), n)]
 
+
+def normalize_text(text):
+    # "  Torre de  BELÉM " -> "torre de belem" (maiúsculas, espaços e acentos ignorados)
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def base_url(server, scheme):
+    # "host/caminho" -> "scheme://host/caminho"; servidores configurados com esquema ficam iguais
+    return server if "://" in server else f"{scheme}://{server}"
+
+
+def db_sync_to_async(fn):
+    """
+    sync_to_async para código que pode usar o ORM, numa thread do executor (em paralelo, sem
+    passar pela thread partilhada). Essas threads não recebem o request_finished: as ligações
+    à BD que abrirem são fechadas aqui, no fim de cada chamada.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
@@ -1,55 +1,205 @@
-import httpx
-from .config import OPEN_METEO_URL
+import asyncio
+import contextvars
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from .config import OPEN_METEO_URL, WEATHER_GRID_SIZE, WEATHER_UPDATE_INTERVAL, WEATHER_CACHE_SIZE
+from .config import WEATHER_MAX_PARALLEL, WEATHER_CACHE_STALE_TTL
+from .http_client import http_get, ahttp_get
+from .cache import TTLCache
+from .coalesce import SingleFlight
 from .utils import chunk_list
+from .metrics import stage
+
+# Aumentado para 150 como pedido (reduz nº de pedidos HTTP)
+BATCH_SIZE = 50
+
+weather_cache = TTLCache('weather', WEATHER_CACHE_SIZE, WEATHER_UPDATE_INTERVAL, WEATHER_CACHE_STALE_TTL,
+                         persistent=True)
+# Rotas iguais pedidas ao mesmo tempo têm as mesmas células em falta e portanto os mesmos lotes
+weather_flight = SingleFlight('weather')
+
+
+def weather_cell(point):
+    # Célula da grelha lat/lon que contém o ponto (lat, lon)
+    return (int(math.floor(point[0] / WEATHER_GRID_SIZE)),
+            int(math.floor(point[1] / WEATHER_GRID_SIZE)))
+
+
+def cell_center(cell):
+    return ((cell[0] + 0.5) * WEATHER_GRID_SIZE, (cell[1] + 0.5) * WEATHER_GRID_SIZE)
+
+
+def seconds_to_next_update():
+    # Expirar no próximo ciclo de atualização do modelo e não N segundos depois do pedido
+    return WEATHER_UPDATE_INTERVAL - (time.time() % WEATHER_UPDATE_INTERVAL)
+
+
+def split_cached_cells(cells, cached):
+    """Devolve (células de cada ponto, {célula: resultado em cache}, células em falta)."""
+    results = {cell: cached.get(cell) for cell in cells}
+    missing = [cell for cell, current in results.items() if current is None]
+    return cells, results, missing
+
+
+def lookup_cached_cells(points):
+    # Todas as células numa só ida à cache (os misses em memória numa só consulta ao SQLite)
+    cells = [weather_cell(p) for p in points]
+    return split_cached_cells(cells, weather_cache.get_many(list(dict.fromkeys(cells))))
+
+
+async def alookup_cached_cells(points):
+    cells = [weather_cell(p) for p in points]
+    return split_cached_cells(cells, await weather_cache.aget_many(list(dict.fromkeys(cells))))
+
+
+def split_batch_results(batches, batches_results):
+    # ({célula: resultado} dos lotes que responderam, células dos lotes falhados)
+    fetched, failed = {}, []
+    for batch, batch_results in zip(batches, batches_results):
+        for cell, current in zip(batch, batch_results):
+            if current is not None:
+                fetched[cell] = current
+            else:
+                failed.append(cell)
+    return fetched, failed
+
+
+def store_batch_results(results, batches, batches_results):
+    fetched, failed = split_batch_results(batches, batches_results)
+    weather_cache.set_many(fetched, ttl=seconds_to_next_update())
+    # Lote falhado (Open-Meteo em baixo, disjuntor aberto): último valor conhecido da célula
+    stale = weather_cache.get_many(failed, stale=True)
+    results.update(fetched)
+    results.update({cell: stale.get(cell) for cell in failed})
+
+
+async def astore_batch_results(results, batches, batches_results):
+    fetched, failed = split_batch_results(batches, batches_results)
+    await weather_cache.aset_many(fetched, ttl=seconds_to_next_update())
+    stale = await weather_cache.aget_many(failed, stale=True)
+    results.update(fetched)
+    results.update({cell: stale.get(cell) for cell in failed})
 
 
 def get_weather_batch(points):
     """
     Recebe uma lista de pontos [(lat, lon), ...].
-    Divide em lotes grandes de 150 para ser super rápido.
+    Agrupa os pontos por célula da grelha e só pede à API as células que não estão em cache.
     """
     if not points: return []
 
-    final_results = []
-    # Aumentado para 150 como pedido (reduz nº de pedidos HTTP)
-    BATCH_SIZE = 50
+    with stage('weather'):
+        cells, results, missing = lookup_cached_cells(points)
+        batches = chunk_list(missing, BATCH_SIZE)
+        store_batch_results(results, batches, fetch_weather_batches(batches))
+    return [results.get(cell) for cell in cells]
+
+
+async def aget_weather_batch(points):
+    """Versão assíncrona: os lotes em falta são pedidos em simultâneo (até WEATHER_MAX_PARALLEL)."""
+    if not points: return []
+
+    final_results = [None] * len(points)
+    with stage('weather'):
+        async for indices, batch_results in aiter_weather_batches(points):
+            for i, current in zip(indices, batch_results):
+                final_results[i] = current
+    return final_results
 
-    batches = chunk_list(points, BATCH_SIZE)
 
-    for batch in batches:
-        # Arredondar coordenadas para 4 casas decimais poupa caracteres no URL
-        lats = [f"{p[0]:.4f}" for p in batch]
-        lons = [f"{p[1]:.4f}" for p in batch]
+async def aiter_weather_batches(points):
+    """
+    Gera (índices dos pontos, resultados) à medida que chegam: primeiro os pontos em cache,
+    depois um item por lote pedido à API (pela ordem de chegada, não pela ordem dos lotes).
+    """
+    cells, results, missing = await alookup_cached_cells(points)
+    points_by_cell = defaultdict(list)
+    for i, cell in enumerate(cells):
+        points_by_cell[cell].append(i)
 
-        params = {
-            'latitude': ",".join(lats),
-            'longitude': ",".join(lons),
-            'current': 'weather_code,temperature_2m',
-            'timezone': 'auto'
-        }
+    cached = [i for i, cell in enumerate(cells) if results[cell] is not None]
+    if cached:
+        yield cached, [results[cells[i]] for i in cached]
 
-        try:
-            # Timeout aumentado para 10s porque o pedido é maior e pode demorar a processar
-            response = httpx.get(OPEN_METEO_URL, params=params, timeout=10.0)
+    semaphore = asyncio.Semaphore(max(1, WEATHER_MAX_PARALLEL))
 
-            if response.status_code == 200:
-                data = response.json()
+    async def fetch(batch):
+        async with semaphore:
+            return batch, await afetch_weather_batch([cell_center(c) for c in batch])
 
-                # A API retorna lista se forem vários, objeto se for um
-                if isinstance(data, list):
-                    final_results.extend([item.get('current', {}) for item in data])
-                else:
-                    final_results.append(data.get('current', {}))
-            else:
-                print(f"Erro Batch API ({len(batch)} pts): {response.status_code}")
-                # Se falhar (ex: URL too long), tentamos recuperar preenchendo com None
-                final_results.extend([None] * len(batch))
+    for next_batch in asyncio.as_completed([fetch(b) for b in chunk_list(missing, BATCH_SIZE)]):
+        batch, batch_results = await next_batch
+        await astore_batch_results(results, [batch], [batch_results])
+        indices = [i for cell in batch for i in points_by_cell[cell]]
+        yield indices, [results.get(cells[i]) for i in indices]
 
-        except Exception as e:
-            print(f"Exceção Batch Weather: {e}")
-            final_results.extend([None] * len(batch))
 
-    return final_results
+def fetch_weather_batches(batches):
+    """Pede os lotes em paralelo (no máximo WEATHER_MAX_PARALLEL); mantém a ordem dos lotes."""
+    points = [[cell_center(c) for c in batch] for batch in batches]
+    if len(points) <= 1 or WEATHER_MAX_PARALLEL <= 1:
+        return [fetch_weather_batch(p) for p in points]
+    with ThreadPoolExecutor(max_workers=min(WEATHER_MAX_PARALLEL, len(points))) as pool:
+        # Cada thread corre numa cópia do contexto atual (prazo do pedido, tempos das etapas)
+        futures = [pool.submit(contextvars.copy_context().run, fetch_weather_batch, p) for p in points]
+        return [f.result() for f in futures]
+
+
+def weather_params(batch):
+    # Arredondar coordenadas para 4 casas decimais poupa caracteres no URL
+    lats = [f"{p[0]:.4f}" for p in batch]
+    lons = [f"{p[1]:.4f}" for p in batch]
+
+    return {
+        'latitude': ",".join(lats),
+        'longitude': ",".join(lons),
+        'current': 'weather_code,temperature_2m',
+        'timezone': 'auto'
+    }
+
+
+def parse_weather_response(response, batch):
+    if response.status_code == 200:
+        data = response.json()
+
+        # A API retorna lista se forem vários, objeto se for um
+        if isinstance(data, list):
+            return [item.get('current', {}) for item in data]
+        return [data.get('current', {})]
+
+    print(f"Erro Batch API ({len(batch)} pts): {response.status_code}")
+    # Se falhar (ex: URL too long), tentamos recuperar preenchendo com None
+    return [None] * len(batch)
+
+
+def fetch_weather_batch(batch):
+    """Um pedido à Open-Meteo para um lote de pontos; falhas preenchem o lote com None."""
+    return weather_flight.do(tuple(batch), lambda: request_weather_batch(batch))
+
+
+def request_weather_batch(batch):
+    try:
+        # Timeout aumentado para 10s porque o pedido é maior e pode demorar a processar
+        response = http_get(OPEN_METEO_URL, params=weather_params(batch), timeout=10.0)
+        return parse_weather_response(response, batch)
+    except Exception as e:
+        print(f"Exceção Batch Weather: {e}")
+        return [None] * len(batch)
+
+
+async def afetch_weather_batch(batch):
+    return await weather_flight.ado(tuple(batch), lambda: arequest_weather_batch(batch))
+
+
+async def arequest_weather_batch(batch):
+    try:
+        response = await ahttp_get(OPEN_METEO_URL, params=weather_params(batch), timeout=10.0)
+        return parse_weather_response(response, batch)
+    except Exception as e:
+        print(f"Exceção Batch Weather: {e}")
+        return [None] * len(batch)
 
 
 def get_weather_color_and_desc(code):
@@ -62,4 +212,3 @@ def get_weather_color_and_desc(code):
     if code <= 82: return '#2563eb', 'Aguaceiros'
     if code >= 95: return '#1e3a8a', 'Trovoada'
     return '#8c03fc', 'Normal'
-
@@ -1,2 +1,12 @@
 # Tests package
+import atexit
+import shutil
+import tempfile
+from pathlib import Path
 
+from ..services.persistent_cache import PersistentStore, use_store
+
+# Os testes esvaziam as caches (clear_caches): cache persistente própria, não a do servidor
+_cache_dir = tempfile.mkdtemp(prefix='bettermaps-test-cache-')
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+use_store(PersistentStore(Path(_cache_dir) / 'cache.sqlite3'))
@@ -0,0 +1,201 @@
+"""
+Testes do pipeline assíncrono (serviços aget_* e views async)
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock, patch
+from django.test import TestCase, AsyncClient
+
+from ..services.cache import clear_caches
+from ..services.osrm_service import aget_route
+
+
+def osrm_response(coords):
+    response = Mock()
+    response.json.return_value = {
+        'code': 'Ok',
+        'routes': [{'distance': 5000, 'duration': 600, 'geometry': {'coordinates': coords}}],
+    }
+    response.raise_for_status = Mock()
+    return response
+
+
+class AsyncRouteTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    async def test_aget_route_climatic(self):
+        """A rota assíncrona tem o mesmo formato normalizado que a síncrona"""
+        coords = [[-9.2066 + i * 0.001, 38.7119 + i * 0.001] for i in range(100)]
+        with patch('routes.services.osrm_service.ahttp_get', AsyncMock(return_value=osrm_response(coords))), \
+             patch('routes.services.osrm_service.aget_weather_batch',
+                   AsyncMock(side_effect=lambda pts: [{'weather_code': 0}] * len(pts))):
+            result = await aget_route('driving', (-9.2066, 38.7119), (-9.15, 38.75), is_climatic=True)
+
+        self.assertEqual(result['tourist_spots'], [])
+        self.assertGreater(len(result['weather_segments']), 1)
+        self.assertEqual({s['description'] for s in result['weather_segments']}, {'Sol'})
+
+    async def test_route_views_run_concurrently(self):
+        """Pedidos em simultâneo à view async não esperam uns pelos outros"""
+        async def slow_get(url, **kwargs):
+            await asyncio.sleep(0.2)
+            return osrm_response([[-9.2066, 38.7119], [-9.15, 38.75]])
+
+        client = AsyncClient()
+        with patch('routes.services.osrm_service.ahttp_get', side_effect=slow_get):
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            responses = await asyncio.gather(*[
+                client.get('/api/osrm/route/', {'origin_lng': -9.2 - i / 100, 'origin_lat': 38.7,
+                                                'dest_lng': -9.15, 'dest_lat': 38.75})
+                for i in range(10)
+            ])
+            elapsed = loop.time() - start
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertLess(elapsed, 1.0)
+        self.assertIn('weather_segments', responses[0].json())
+
+
+class RouteStreamTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    async def test_stream_emits_route_before_weather(self):
+        """NDJSON: a rota sai primeiro; depois a meteorologia por lotes e por fim 'done'"""
+        coords = [[-9.2 + i * 0.002, 38.7 + i * 0.002] for i in range(400)]
+
+        async def weather_get(url, params, timeout):
+            response = Mock(status_code=200)
+            response.json.return_value = [{'current': {'weather_code': 61}} for _ in params['latitude'].split(',')]
+            return response
+
+        with patch('routes.services.osrm_service.ahttp_get', AsyncMock(return_value=osrm_response(coords))), \
+             patch('routes.services.weather_service.ahttp_get', side_effect=weather_get):
+            response = await AsyncClient().get('/api/osrm/route/stream/', {
+                'origin_lng': -9.2, 'origin_lat': 38.7, 'dest_lng': -8.4, 'dest_lat': 39.5, 'climatic': 'true'})
+            body = b''.join([chunk async for chunk in response.streaming_content])
+
+        events = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(events[0]['type'], 'route')
+        self.assertEqual(events[-1]['type'], 'done')
+        segments = events[0]['weather_segments']
+        painted = {s['index']: s['description'] for e in events if e['type'] == 'weather' for s in e['segments']}
+        self.assertEqual(sorted(painted), list(range(len(segments))))
+        self.assertEqual(set(painted.values()), {'Chuva'})
+
+    async def test_stream_body_keeps_request_deadline(self):
+        """O prazo do X-Request-Budget continua a valer enquanto o corpo é gerado (depois da middleware)"""
+        from ..services.resilience import remaining_time
+
+        async def fake_stream(**params):
+            yield {'type': 'done', 'left': remaining_time()}
+
+        with patch('routes.views.osrm_views.astream_route', fake_stream):
+            response = await AsyncClient().get('/api/osrm/route/stream/', {
+                'origin_lng': -9.2, 'origin_lat': 38.7, 'dest_lng': -8.4, 'dest_lat': 39.5},
+                headers={'X-Request-Budget': '2000'})
+            body = b''.join([chunk async for chunk in response.streaming_content])
+
+        left = json.loads(body)['left']
+        self.assertIsNotNone(left)
+        self.assertTrue(0 < left <= 2)
+
+
+class RouteBatchTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    async def test_batch_dedupes_and_shares_weather(self):
+        """Pares repetidos calculados uma vez; meteorologia de todas as rotas num só pedido"""
+        coords = [[-9.2 + i * 0.002, 38.7 + i * 0.002] for i in range(100)]
+        osrm_get = AsyncMock(return_value=osrm_response(coords))
+
+        async def weather_get(url, params, timeout):
+            response = Mock(status_code=200)
+            response.json.return_value = [{'current': {'weather_code': 0}} for _ in params['latitude'].split(',')]
+            return response
+        weather = AsyncMock(side_effect=weather_get)
+
+        route = {'origin_lng': -9.2, 'origin_lat': 38.7, 'dest_lng': -9.0, 'dest_lat': 38.9, 'climatic': True}
+        other = {**route, 'dest_lng': -9.01}
+        with patch('routes.services.osrm_service.ahttp_get', osrm_get), \
+             patch('routes.services.weather_service.ahttp_get', weather):
+            response = await AsyncClient().post('/api/osrm/route/batch/', {
+                'routes': [route, {'origin_lng': 'x'}, route, other]}, content_type='application/json')
+
+        results = response.json()['results']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[1], {'error': 'All coordinates required'})
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(osrm_get.call_count, 2)
+        self.assertEqual(weather.call_count, 1)
+        self.assertTrue(all(s['description'] == 'Sol' for s in results[3]['weather_segments']))
+
+    async def test_batch_negotiates_msgpack(self):
+        import msgpack
+        coords = [[-9.2 + i * 0.002, 38.7 + i * 0.002] for i in range(10)]
+        route = {'origin_lng': -9.2, 'origin_lat': 38.7, 'dest_lng': -9.0, 'dest_lat': 38.9}
+        body = {'routes': [route, {'origin_lng': 'x'}]}
+        client = AsyncClient()
+        with patch('routes.services.osrm_service.ahttp_get', AsyncMock(return_value=osrm_response(coords))):
+            packed = await client.post('/api/osrm/route/batch/', body, content_type='application/json',
+                                       headers={'Accept': 'application/msgpack'})
+            compact = await client.post('/api/osrm/route/batch/?format=polyline6', body,
+                                        content_type='application/json')
+            unknown = await client.post('/api/osrm/route/batch/?format=xml', body, content_type='application/json')
+
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), compact.json())
+        self.assertEqual(compact.json()['results'][0]['geometry_format'], 'polyline6')
+        self.assertEqual(unknown.status_code, 400)
+
+
+class LifespanTests(TestCase):
+
+    async def test_shutdown_closes_async_clients(self):
+        from ..lifespan import with_lifespan
+        from ..services.http_client import _async_clients, get_async_client, get_async_send
+
+        client = get_async_client('osrm.test')
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            message = next(messages)
+            if message['type'] == 'lifespan.shutdown':
+                # Depois do arranque o loop é o do servidor: usa os AsyncClients partilhados
+                self.assertEqual(get_async_send('osrm.test'), client.get)
+            return message
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await with_lifespan(AsyncMock())({'type': 'lifespan'}, receive, send)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(client.is_closed)
+        self.assertNotIn(asyncio.get_running_loop(), _async_clients)
+
+
+class PerRequestLoopTests(TestCase):
+
+    def test_loops_outside_asgi_reuse_the_process_client(self):
+        """Em WSGI cada pedido async tem o seu loop: nada de AsyncClients novos (nunca fechados) por pedido"""
+        from ..services import http_client
+        sync_get = Mock(return_value=Mock(status_code=200))
+
+        async def request():
+            return await http_client.ahttp_get('http://osrm.test/a', timeout=5)
+
+        with patch.object(http_client, 'get_client', return_value=Mock(get=sync_get)), \
+             patch.object(http_client, 'get_async_client') as get_async_client:
+            for _ in range(3):
+                self.assertEqual(asyncio.run(request()).status_code, 200)
+        get_async_client.assert_not_called()
+        self.assertEqual(sync_get.call_count, 3)
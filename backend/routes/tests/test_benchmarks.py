@@ -0,0 +1,43 @@
+"""
+Testes do harness de benchmarks (gravações das APIs externas e relatório)
+"""
+import tempfile
+import httpx
+from django.test import TestCase
+
+from ..benchmarks.fixtures import FixtureStore, replay_upstreams
+from ..benchmarks.suite import compare_reports, run_suite
+from ..services.osrm_service import FINAL_ROUTE_OPTIONS, get_route, osrm_url
+
+
+class FixtureTests(TestCase):
+
+    def test_recorded_response_wins_over_synthetic(self):
+        """Uma resposta gravada é servida tal como foi gravada; sem gravação, uma sintética"""
+        with tempfile.TemporaryDirectory() as tmp:
+            url = osrm_url('route', 'v1', 'driving', '-9.2,38.7;-9.1,38.8', FINAL_ROUTE_OPTIONS)
+            request = httpx.Request('GET', url)
+            FixtureStore(tmp).save(request, 200, {'code': 'NoRoute'})
+            with replay_upstreams(tmp) as store:
+                self.assertEqual(get_route('driving', (-9.2, 38.7), (-9.1, 38.8))['code'], 'NoRoute')
+                result = get_route('driving', (-9.2, 38.7), (-9.0, 38.9), is_climatic=True)
+            self.assertEqual((store.recorded, store.synthetic), (1, 2))  # rota + 1 lote de meteorologia
+            self.assertGreater(len(result['weather_segments']), 1)
+
+
+class SuiteTests(TestCase):
+
+    def test_report_and_comparison(self):
+        report = run_suite('quick', only=['segments', 'poi'], sizes={
+            'repeat': 1, 'poi_density': (50,), 'geometry_length': (200,)})
+        names = {item['name'] for item in report['results']}
+        self.assertEqual(names, {'build_climatic_segments', 'find_pois_near_point_local', 'poi_index_build'})
+        self.assertTrue(all(item['median_ms'] >= 0 for item in report['results']))
+        self.assertFalse(report['meta']['synthetic_only'])  # estes grupos não fazem pedidos externos
+
+        geocode = run_suite('quick', only=['geocode'], sizes={'repeat': 1})
+        self.assertTrue(geocode['meta']['synthetic_only'])  # sem gravações: o bench avisa
+
+        slower = {'results': [{**item, 'median_ms': item['median_ms'] * 3 + 1} for item in report['results']]}
+        self.assertEqual(compare_reports(report, report), [])
+        self.assertEqual(len(compare_reports(report, slower)), len(report['results']))
@@ -0,0 +1,100 @@
+"""
+Testes da cache LRU+TTL das respostas OSRM
+"""
+from unittest.mock import Mock, patch
+from django.test import TestCase
+
+from ..services.cache import TTLCache, clear_caches
+from ..services.osrm_service import get_route, osrm_cache
+from ..services.weather_service import get_weather_batch
+
+
+class TTLCacheTests(TestCase):
+
+    def test_lru_eviction_and_counters(self):
+        cache = TTLCache('test-lru', maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'a' passa a mais recente
+        cache.set('c', 3)                    # expulsa 'b'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entries_are_misses(self):
+        cache = TTLCache('test-ttl', maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=0)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class OsrmCacheTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    @patch('routes.services.osrm_service.http_get')
+    def test_repeated_route_is_served_from_cache(self, mock_get):
+        """Pedidos repetidos (coordenadas a menos de 1m) não voltam ao OSRM"""
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            'routes': [{'distance': 5000, 'duration': 600,
+                        'geometry': {'coordinates': [[-9.2066, 38.7119], [-9.15, 38.75]]}}]
+        }
+        mock_response.raise_for_status = Mock()
+        mock_get.return_value = mock_response
+
+        first = get_route('driving', (-9.2066, 38.7119), (-9.15, 38.75))
+        second = get_route('driving', (-9.206600001, 38.7119), (-9.15, 38.75))
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(first['weather_segments'], second['weather_segments'])
+        self.assertEqual(osrm_cache.stats()['hits'], 1)
+
+
+class WeatherCacheTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    @patch('routes.services.weather_service.http_get')
+    def test_only_uncached_cells_are_fetched(self, mock_get):
+        """Pontos na mesma célula partilham um pedido; rotas repetidas não vão à API"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.side_effect = lambda: [
+            {'current': {'weather_code': 3}} for _ in mock_get.call_args.kwargs['params']['latitude'].split(',')
+        ]
+        mock_get.return_value = mock_response
+
+        points = [(38.7101, -9.1401), (38.7102, -9.1402), (39.5, -8.0)]
+        first = get_weather_batch(points)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(mock_get.call_args.kwargs['params']['latitude'].count(',') + 1, 2)
+
+        second = get_weather_batch(points + [(40.2, -8.4)])
+        self.assertEqual(second[:3], first)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs['params']['latitude'].count(','), 0)
+
+    @patch('routes.services.weather_service.http_get')
+    def test_parallel_batches_keep_point_order(self, mock_get):
+        """Lotes pedidos em paralelo mantêm a ordem; um lote falhado fica a None"""
+        def fake_get(url, params, timeout):
+            lats = params['latitude'].split(',')
+            response = Mock()
+            response.status_code = 500 if float(lats[0]) > 45 else 200
+            response.json.return_value = [{'current': {'lat': float(lat)}} for lat in lats]
+            return response
+        mock_get.side_effect = fake_get
+
+        # 120 células distintas -> 3 lotes; o terceiro (lat > 45) falha
+        points = [(36.0 + i * 0.1, -8.0) for i in range(120)]
+        result = get_weather_batch(points)
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(result), 120)
+        self.assertTrue(all(r is None for r in result[100:]))
+        lats = [r['lat'] for r in result[:100]]
+        self.assertEqual(lats, sorted(lats))
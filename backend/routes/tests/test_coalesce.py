@@ -0,0 +1,177 @@
+"""
+Testes da junção de pedidos iguais em curso (single-flight)
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, patch
+
+from django.test import SimpleTestCase, TestCase
+
+from ..services.cache import clear_caches
+from ..services.coalesce import SingleFlight, coalesced_calls
+from ..services.osrm_service import aget_osrm_request, get_osrm_request
+from ..services.resilience import DeadlineExceeded, deadline, remaining_time
+from .test_async_pipeline import osrm_response
+
+ROUTE_ARGS = ('route', 'v1', 'driving', '-9.1,38.7;-9.2,38.8', ['overview=full'])
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_threads_share_one_call_and_its_error(self):
+        flight = SingleFlight('test-threads')
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            raise ValueError('falhou')
+
+        def call():
+            try:
+                flight.do('k', slow)
+            except ValueError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(4) as pool:
+            first = pool.submit(call)
+            started.wait(1)
+            others = [pool.submit(call) for _ in range(3)]
+            time.sleep(0.05)
+            release.set()
+            results = [first.result()] + [f.result() for f in others]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['falhou'] * 4)
+        self.assertEqual(coalesced_calls.value('test-threads'), 3)
+        # Terminado o pedido, a chave volta a estar livre
+        self.assertEqual(flight.do('k', lambda: 42), 42)
+
+    def test_waiter_respects_its_own_deadline(self):
+        flight = SingleFlight('test-deadline')
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('k', lambda: release.wait(1)))
+        leader.start()
+        time.sleep(0.02)
+        try:
+            with deadline(0.05):
+                with self.assertRaises(DeadlineExceeded):
+                    flight.do('k', lambda: None)
+        finally:
+            release.set()
+            leader.join()
+
+    def test_short_leader_deadline_does_not_fail_waiters(self):
+        """O prazo de quem chegou primeiro só limita a sua espera, não o pedido partilhado"""
+        flight = SingleFlight('test-leader-deadline')
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return remaining_time()
+
+        async def leader():
+            with deadline(0.02):
+                return await flight.ado('k', slow)
+
+        async def run():
+            first = asyncio.ensure_future(leader())
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(flight.ado('k', slow))
+            return await asyncio.gather(first, second, return_exceptions=True)
+
+        first, second = asyncio.run(run())
+        self.assertIsInstance(first, DeadlineExceeded)
+        self.assertGreater(second, 1)
+        with deadline(0.02):
+            self.assertGreater(flight.do('k', remaining_time), 1)
+
+    def test_separate_event_loops_share_one_call(self):
+        """Em WSGI cada pedido async corre no seu loop: os pedidos iguais juntam-se na mesma"""
+        flight = SingleFlight('test-loops')
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'ok'
+
+        with ThreadPoolExecutor(3) as pool:
+            results = list(pool.map(lambda _: asyncio.run(flight.ado('k', slow)), range(3)))
+        self.assertEqual(results, ['ok'] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiter_survives_end_of_leader_loop(self):
+        """Se o loop de quem começou termina (prazo curto) e cancela a tarefa, quem espera refaz o pedido"""
+        flight = SingleFlight('test-leader-loop')
+        started = threading.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.1)
+            return 'ok'
+
+        async def leader():
+            with deadline(0.02):
+                return await flight.ado('k', slow)
+
+        with ThreadPoolExecutor(2) as pool:
+            first = pool.submit(asyncio.run, leader())
+            started.wait(1)
+            second = pool.submit(asyncio.run, flight.ado('k', slow))
+            with self.assertRaises(DeadlineExceeded):
+                first.result(1)
+            self.assertEqual(second.result(1), 'ok')
+
+    def test_cancelled_waiter_does_not_cancel_shared_task(self):
+        flight = SingleFlight('test-async')
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        async def run():
+            first = asyncio.ensure_future(flight.ado('k', slow))
+            second = asyncio.ensure_future(flight.ado('k', slow))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), 'ok')
+
+
+class OsrmCoalescingTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    def test_concurrent_threads_make_one_osrm_request(self):
+        def slow_get(url, **kwargs):
+            time.sleep(0.1)
+            return osrm_response([[-9.1, 38.7], [-9.2, 38.8]])
+
+        with patch('routes.services.osrm_service.http_get', side_effect=slow_get) as mock_get:
+            with ThreadPoolExecutor(6) as pool:
+                results = list(pool.map(lambda _: get_osrm_request(*ROUTE_ARGS), range(6)))
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(all(r == results[0] for r in results))
+        results[0]['extra'] = True  # cada um recebe a sua cópia
+        self.assertNotIn('extra', results[1])
+
+    async def test_concurrent_coroutines_make_one_osrm_request(self):
+        response = osrm_response([[-9.1, 38.7], [-9.2, 38.8]])
+
+        async def slow_get(url, **kwargs):
+            await asyncio.sleep(0.05)
+            return response
+
+        with patch('routes.services.osrm_service.ahttp_get', AsyncMock(side_effect=slow_get)) as mock_get:
+            results = await asyncio.gather(*[aget_osrm_request(*ROUTE_ARGS) for _ in range(5)])
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(len({id(r) for r in results}), 5)
@@ -0,0 +1,54 @@
+"""
+Testes da cache de geocoding e do autocomplete local
+"""
+from unittest.mock import Mock, patch
+from django.test import TestCase
+
+from ..models import SimpleTouristPoint
+from ..services.cache import clear_caches
+from ..services.geocoding_service import get_geocode, get_reverse_geocode
+from ..services.poi_search import autocomplete
+from .test_nominatim_dispatcher import lift_nominatim_rate_limit
+
+
+class GeocodeCacheTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        lift_nominatim_rate_limit(self)
+
+    @patch('routes.services.geocoding_service.http_get')
+    def test_normalized_queries_share_cache_entry(self, mock_get):
+        """Maiúsculas, espaços e acentos não geram novos pedidos ao Nominatim"""
+        mock_get.return_value = Mock(json=Mock(return_value=[{'display_name': 'Belém', 'lat': '38.69', 'lon': '-9.21'}]))
+        get_geocode('Torre de Belém')
+        get_geocode('  torre DE   belem ')
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('routes.services.geocoding_service.http_get')
+    def test_reverse_geocode_quantized(self, mock_get):
+        mock_get.return_value = Mock(json=Mock(return_value={'display_name': 'Lisboa'}))
+        get_reverse_geocode('38.71190', '-9.20660')
+        get_reverse_geocode('38.711901', '-9.206601')
+        self.assertEqual(mock_get.call_count, 1)
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        for name in ['Torre de Belém', 'Torre Vasco da Gama', 'Mosteiro dos Jerónimos']:
+            SimpleTouristPoint.objects.create(name=name, category='monument', lat=38.7, lng=-9.2)
+
+    @patch('routes.services.geocoding_service.http_get')
+    def test_prefix_and_typo_lookups_are_local(self, mock_get):
+        self.assertEqual({r['display_name'] for r in autocomplete('torre')},
+                         {'Torre de Belém', 'Torre Vasco da Gama'})
+        self.assertEqual(autocomplete('mosteiro dos jeronimso')[0]['display_name'], 'Mosteiro dos Jerónimos')
+        mock_get.assert_not_called()
+
+    def test_view_rejects_non_positive_limit(self):
+        autocomplete('torre')  # índice construído nesta thread (a view corre noutra, com a BD bloqueada)
+        for limit in ('0', '-3'):
+            response = self.client.get('/api/autocomplete/', {'q': 'torre', 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.client.get('/api/autocomplete/', {'q': 'torre', 'limit': '1'}).json()), 1)
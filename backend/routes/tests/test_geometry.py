@@ -0,0 +1,105 @@
+"""
+Testes do módulo de geometria vetorizada (segmentação climática)
+"""
+import random
+from django.test import TestCase
+
+from ..services.osrm_service import build_climatic_segments
+from ..services.utils import haversine_distance
+
+
+def legacy_segments(geometry, resolution):
+    # Implementação original (ciclo em Python), usada como referência
+    segments, current, acc, last_pt = [], [], 0, None
+    for i, pt in enumerate(geometry):
+        current.append(pt)
+        if last_pt: acc += haversine_distance(last_pt, pt)
+        if acc >= resolution or i == len(geometry) - 1:
+            mid_pt = current[len(current) // 2]
+            segments.append({'coords': current, 'midpoint': (mid_pt[1], mid_pt[0])})
+            current, acc = [pt], 0
+        last_pt = pt
+    return segments
+
+
+class ClimaticSegmentationTests(TestCase):
+
+    def random_route(self, n, seed):
+        rng = random.Random(seed)
+        lon, lat = -9.14, 38.71
+        geometry = []
+        for _ in range(n):
+            lon += rng.uniform(-0.002, 0.004)
+            lat += rng.uniform(-0.002, 0.004)
+            geometry.append([round(lon, 6), round(lat, 6)])
+        return geometry
+
+    def test_segments_identical_to_legacy_loop(self):
+        for n, total in [(1, 0), (2, 5000), (500, 50000), (5000, 200000), (20000, 900000)]:
+            geometry = self.random_route(n, seed=n)
+            resolution = 10000 if total > 500000 else (5000 if total > 100000 else 2000)
+            self.assertEqual(build_climatic_segments(geometry, total), legacy_segments(geometry, resolution))
+
+    def test_repeated_vertices(self):
+        geometry = [[-9.1, 38.7]] * 3 + [[-9.0, 38.8]] * 3
+        self.assertEqual(build_climatic_segments(geometry, 5000), legacy_segments(geometry, 2000))
+
+    def test_empty_geometry(self):
+        self.assertEqual(build_climatic_segments([], 0), [])
+
+
+class SimplificationTests(TestCase):
+
+    def test_douglas_peucker_keeps_endpoints_and_corners(self):
+        from ..services.geometry import simplify
+        # Linha reta com ruído de ~1m e uma esquina a meio
+        line = [[-9.1 + i * 0.0001, 38.7 + (0.000005 if i % 2 else 0)] for i in range(50)]
+        line += [[line[-1][0], 38.7 + i * 0.0001] for i in range(1, 50)]
+        result = simplify(line, tolerance=5)
+        self.assertEqual(result[0], line[0])
+        self.assertEqual(result[-1], line[-1])
+        self.assertIn(line[49], result)
+        self.assertLessEqual(len(result), 4)
+
+    def test_segment_boundaries_survive_simplification(self):
+        from unittest.mock import Mock, patch
+        from ..services.cache import clear_caches
+        from ..services.osrm_service import get_route
+        clear_caches()
+        coords = [[-9.2 + i * 0.0005, 38.7 + i * 0.0001] for i in range(400)]
+        response = Mock()
+        response.json.return_value = {'routes': [{'distance': 20000, 'geometry': {'coordinates': coords}}]}
+        with patch('routes.services.osrm_service.http_get', return_value=response), \
+             patch('routes.services.osrm_service.get_weather_batch', side_effect=lambda pts: [None] * len(pts)):
+            full = get_route('driving', (-9.2, 38.7), (-9.0, 38.74), is_climatic=True)
+            simple = get_route('driving', (-9.2, 38.7), (-9.0, 38.74), is_climatic=True, tolerance=10)
+
+        self.assertEqual(len(full['routes'][0]['geometry']['coordinates']), 400)
+        self.assertLess(len(simple['routes'][0]['geometry']['coordinates']), 400)
+        self.assertEqual(len(full['weather_segments']), len(simple['weather_segments']))
+        for a, b in zip(full['weather_segments'], simple['weather_segments']):
+            self.assertEqual((a['coordinates'][0], a['coordinates'][-1]), (b['coordinates'][0], b['coordinates'][-1]))
+
+    def test_step_geometries_are_simplified(self):
+        """Com steps=true a geometria de cada step também é simplificada (sem tocar na cache OSRM)"""
+        from unittest.mock import Mock, patch
+        from ..services.cache import clear_caches
+        from ..services.osrm_service import get_route
+        clear_caches()
+        coords = [[-9.2 + i * 0.0005, 38.7 + i * 0.0001] for i in range(400)]
+        steps = [{'name': 'a', 'geometry': {'type': 'LineString', 'coordinates': coords[:200]}},
+                 {'name': 'b', 'geometry': {'type': 'LineString', 'coordinates': coords[199:]}}]
+        response = Mock()
+        response.json.return_value = {'routes': [{'distance': 20000, 'geometry': {'coordinates': coords},
+                                                  'legs': [{'steps': steps}]}]}
+        with patch('routes.services.osrm_service.http_get', return_value=response):
+            simple = get_route('driving', (-9.2, 38.7), (-9.0, 38.74), tolerance=10)
+            full = get_route('driving', (-9.2, 38.7), (-9.0, 38.74))
+
+        for step, original in zip(simple['routes'][0]['legs'][0]['steps'], steps):
+            simplified = step['geometry']['coordinates']
+            self.assertLess(len(simplified), len(original['geometry']['coordinates']))
+            self.assertEqual((simplified[0], simplified[-1]),
+                             (original['geometry']['coordinates'][0], original['geometry']['coordinates'][-1]))
+        self.assertEqual(step['name'], 'b')
+        self.assertEqual(len(full['routes'][0]['legs'][0]['steps'][0]['geometry']['coordinates']), 200)
@@ -0,0 +1,61 @@
+"""
+Testes da importação incremental de POIs (load_points --incremental)
+"""
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import SimpleTouristPoint
+
+HEADER = "@type\t@id\t@lat\t@lon\tname\ttourism\thistoric\n"
+
+
+@patch('routes.management.commands.load_points.bump_dataset_version')
+class LoadPointsTests(TestCase):
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.base_dir, 'data'))
+
+    def write(self, filename, rows):
+        with open(os.path.join(self.base_dir, 'data', filename), 'w', encoding='utf-8') as f:
+            f.write(HEADER + "".join("\t".join(row) + "\n" for row in rows))
+
+    def load(self, *args):
+        out = StringIO()
+        with override_settings(BASE_DIR=self.base_dir):
+            call_command('load_points', *args, stdout=out)
+        return out.getvalue()
+
+    def test_incremental_only_touches_changed_rows(self, bump):
+        self.write('a.csv', [
+            ('node', '1', '38.70', '-9.14', 'Torre', 'attraction', ''),
+            ('node', '2', '38.71', '-9.15', 'Castelo', '', 'castle'),
+        ])
+        self.load('a.csv')
+        castelo_id = SimpleTouristPoint.objects.get(source_key='node/2').id
+
+        self.write('a.csv', [
+            ('node', '1', '38.70', '-9.14', 'Torre de Belém', 'attraction', ''),
+            ('node', '2', '38.71', '-9.15', 'Castelo', '', 'castle'),
+            ('way', '3', '38.72', '-9.16', 'Museu', 'museum', ''),
+        ])
+        output = self.load('a.csv', '--incremental')
+
+        self.assertIn('1 novos, 1 atualizados, 1 sem alterações', output)
+        self.assertEqual(SimpleTouristPoint.objects.get(source_key='node/1').name, 'Torre de Belém')
+        self.assertEqual(SimpleTouristPoint.objects.get(source_key='node/2').id, castelo_id)
+        self.assertEqual(bump.call_count, 2)
+
+    def test_several_files_and_prune(self, bump):
+        self.write('norte.csv', [('node', '1', '41.15', '-8.61', 'Ribeira', 'attraction', '')])
+        self.write('sul.csv', [('node', '2', '37.01', '-7.93', 'Sé', '', 'church')])
+        self.load('norte.csv', 'sul.csv', '--incremental', '--workers', '2')
+        self.assertEqual(SimpleTouristPoint.objects.count(), 2)
+
+        output = self.load('norte.csv', '--incremental', '--prune')
+        self.assertIn('1 apagados', output)
+        self.assertEqual(list(SimpleTouristPoint.objects.values_list('name', flat=True)), ['Ribeira'])
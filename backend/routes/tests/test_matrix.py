@@ -0,0 +1,76 @@
+"""
+Testes da matriz distância/duração (serviço table do OSRM em tiles)
+"""
+from unittest.mock import Mock, patch
+from urllib.parse import urlsplit, parse_qs
+from django.test import TestCase
+
+from ..services.cache import clear_caches
+from ..services.osrm_service import aget_table
+
+
+def fake_duration(src, dst):
+    return round(abs(src[0] - dst[0]) * 1000 + abs(src[1] - dst[1]) * 100, 3)
+
+
+async def fake_table(url, **kwargs):
+    # Responde como o OSRM: coordenadas no caminho, índices em sources/destinations
+    parts = urlsplit(url)
+    coords = [tuple(map(float, c.split(','))) for c in parts.path.split('/')[-1][:-5].split(';')]
+    query = parse_qs(parts.query)
+    sources = [coords[int(i)] for i in query['sources'][0].split(';')]
+    destinations = [coords[int(i)] for i in query['destinations'][0].split(';')]
+    response = Mock()
+    response.json.return_value = {
+        'code': 'Ok',
+        'durations': [[fake_duration(s, d) for d in destinations] for s in sources],
+        'distances': [[fake_duration(s, d) * 10 for d in destinations] for s in sources],
+    }
+    return response
+
+
+class MatrixTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    async def test_tiles_are_stitched_and_cached(self):
+        sources = [(-9.1 - i * 0.01, 38.7) for i in range(7)]
+        destinations = [(-8.6, 41.1 + j * 0.01) for j in range(5)]
+        with patch('routes.services.osrm_service.MATRIX_TILE_SIZE', 3), \
+             patch('routes.services.osrm_service.ahttp_get', side_effect=fake_table) as mock_get:
+            result = await aget_table('driving', sources, destinations)
+            self.assertEqual(mock_get.call_count, 3 * 2)  # 7 origens x 5 destinos em tiles de 3x3
+
+            # Nova matriz com origens repetidas: só a origem nova vai ao OSRM
+            extra = (-9.5, 38.8)
+            second = await aget_table('driving', [sources[2], extra], destinations)
+            self.assertEqual(mock_get.call_count, 6 + 2)
+
+        self.assertEqual(result['durations'], [[fake_duration(s, d) for d in destinations] for s in sources])
+        self.assertEqual(second['durations'][0], result['durations'][2])
+        self.assertEqual(second['distances'][1], [fake_duration(extra, d) * 10 for d in destinations])
+
+    async def test_new_source_and_destination_fetch_only_row_and_column(self):
+        """Uma origem e um destino novos numa matriz em cache: só a linha e a coluna novas"""
+        sources = [(-9.1 - i * 0.01, 38.7) for i in range(4)]
+        destinations = [(-8.6, 41.1 + j * 0.01) for j in range(4)]
+        requested = []
+
+        async def recording_table(url, **kwargs):
+            response = await fake_table(url, **kwargs)
+            requested.extend((s, d) for s in range(len(response.json.return_value['durations']))
+                             for d in range(len(response.json.return_value['durations'][0])))
+            return response
+
+        with patch('routes.services.osrm_service.ahttp_get', side_effect=recording_table) as mock_get:
+            await aget_table('driving', sources, destinations)
+            requested.clear()
+            new_src, new_dst = (-9.5, 38.8), (-8.7, 41.3)
+            result = await aget_table('driving', sources + [new_src], destinations + [new_dst])
+
+        self.assertEqual(mock_get.call_count, 1 + 2)
+        self.assertEqual(len(requested), 5 + 4)  # linha 1x5 + coluna 4x1, não 5x5
+        everything = sources + [new_src]
+        self.assertEqual(result['durations'],
+                         [[fake_duration(s, d) for d in destinations + [new_dst]] for s in everything])
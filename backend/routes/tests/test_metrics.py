@@ -0,0 +1,63 @@
+"""
+Testes das métricas (Prometheus) e do cabeçalho Server-Timing
+"""
+from unittest.mock import AsyncMock, Mock, patch
+from django.test import TestCase
+
+from ..services.cache import clear_caches
+from ..services.metrics import (
+    Histogram, clear_metrics, server_timing_header, stage, stage_errors, stage_seconds, upstream_requests
+)
+from .test_async_pipeline import osrm_response
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        clear_metrics()
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram('test_latency_seconds', 'Teste', ['stage'], buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 5.0):
+            histogram.observe(seconds, 'a')
+        lines = histogram.render()
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{stage="a",le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_count{stage="a"} 3', lines)
+
+    def test_stage_counts_errors(self):
+        with self.assertRaises(ValueError):
+            with stage('falha'):
+                raise ValueError()
+        self.assertEqual(stage_errors.value('falha'), 1)
+        self.assertEqual(stage_seconds.count('falha'), 1)
+
+    def test_server_timing_header_merges_repeated_stages(self):
+        header = server_timing_header([('osrm_final', 0.010), ('weather', 0.002), ('weather', 0.003)], 0.02)
+        self.assertEqual(header, 'osrm_final;dur=10.0, weather;dur=5.0;desc="x2", total;dur=20.0')
+
+    def test_route_view_reports_stages_and_metrics(self):
+        """A rota devolve Server-Timing por etapa e alimenta /api/metrics/"""
+        coords = [[-9.2066 + i * 0.001, 38.7119 + i * 0.001] for i in range(100)]
+        # Cliente de teste (WSGI): fora do loop do servidor ASGI os GETs usam o httpx.Client do processo
+        with patch('routes.services.http_client.get_client') as get_client, \
+             patch('routes.services.osrm_service.aget_weather_batch',
+                   AsyncMock(side_effect=lambda pts: [{'weather_code': 0}] * len(pts))):
+            get_client.return_value.get = Mock(return_value=Mock(wraps=osrm_response(coords), status_code=200))
+            response = self.client.get('/api/osrm/route/', {
+                'origin_lng': -9.2066, 'origin_lat': 38.7119, 'dest_lng': -9.15, 'dest_lat': 38.75,
+                'climatic': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['osrm_final', 'segmentation', 'finish', 'total'])
+        self.assertEqual(upstream_requests.value('server_driving', '200'), 1)
+
+        metrics = self.client.get('/api/metrics/')
+        self.assertTrue(metrics['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = metrics.content.decode()
+        self.assertIn('bettermaps_stage_seconds_count{stage="segmentation"} 1', body)
+        self.assertIn('bettermaps_cache_misses_total{cache="osrm"} 1', body)
+        self.assertIn('bettermaps_http_responses_total{route="api/osrm/route/",status="200"} 1', body)
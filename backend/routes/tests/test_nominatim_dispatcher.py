@@ -0,0 +1,149 @@
+"""
+Testes do despachante do Nominatim (ritmo, prioridades, pedidos iguais e prazo)
+"""
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import AsyncClient, SimpleTestCase, TestCase
+
+from ..models import SimpleTouristPoint
+from ..services.cache import clear_caches
+from ..services.geocoding_service import geocode_cache, geocode_key, get_geocode
+from ..services.nominatim_dispatcher import (
+    PRIORITY_BACKGROUND, PRIORITY_REVERSE, PRIORITY_SEARCH, NominatimBusy, NominatimDispatcher, SharedTokenBucket,
+    TokenBucket, nominatim_dispatcher
+)
+from ..services.persistent_cache import PersistentStore, get_store, use_store
+from ..services.resilience import deadline
+
+
+def lift_nominatim_rate_limit(test):
+    """Nos testes com o Nominatim simulado o limite de 1 pedido/s só atrasaria (e tornaria instáveis) os testes."""
+    patcher = patch.object(nominatim_dispatcher.bucket, 'rate', None)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_wait_time(self):
+        bucket = TokenBucket(rate=2, burst=1)
+        now = bucket.updated
+        self.assertEqual(bucket.wait_time(now), 0)
+        bucket.take(now)
+        self.assertAlmostEqual(bucket.wait_time(now), 0.5)
+        self.assertAlmostEqual(bucket.wait_time(now, ahead=2), 1.5)
+        self.assertAlmostEqual(bucket.wait_time(now + 0.25), 0.25)
+        self.assertEqual(TokenBucket(rate=0, burst=1).wait_time(now, ahead=10), 0)
+
+    def test_shared_bucket_spans_processes(self):
+        """Dois despachantes (como dois workers) com o mesmo ficheiro gastam as mesmas fichas"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(use_store, get_store())
+        use_store(PersistentStore(Path(tmp.name) / 'cache.sqlite3'))
+        worker_a = SharedTokenBucket('test', rate=2, burst=1)
+        worker_b = SharedTokenBucket('test', rate=2, burst=1)
+        now = time.monotonic()
+
+        self.assertEqual(worker_a.try_take(now), 0)
+        self.assertAlmostEqual(worker_b.try_take(now), 0.5, places=1)
+        self.assertAlmostEqual(worker_b.wait_time(now, ahead=1), 1.0, places=1)
+
+        use_store(None)  # sem cache persistente: balde local, a partir do último nível lido
+        self.assertGreater(worker_b.try_take(now), 0)
+        self.assertEqual(worker_b.try_take(now + 0.5), 0)
+        self.assertGreater(worker_b.try_take(now + 0.5), 0)
+
+    def test_shared_bucket_estimates_without_sqlite(self):
+        """A estimativa do submit() (com o lock do despachante, no loop) não vai ao SQLite"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(use_store, get_store())
+        store = PersistentStore(Path(tmp.name) / 'cache.sqlite3')
+        use_store(store)
+        dispatcher = NominatimDispatcher(bucket=SharedTokenBucket('test', rate=1, burst=1))
+        locked_while_taking = []
+        take_token = store.take_token
+
+        def checked_take_token(*args):
+            locked_while_taking.append(dispatcher._cond._is_owned())
+            return take_token(*args)
+
+        dispatcher.bucket.tokens = 0.0  # último nível lido: balde vazio, próxima ficha daqui a ~1 s
+        with patch.object(store, 'connection', side_effect=AssertionError("SQLite no submit")):
+            with deadline(0.5), self.assertRaises(NominatimBusy):
+                dispatcher.submit('late', lambda: 'late')
+        with patch.object(store, 'take_token', side_effect=checked_take_token):
+            self.assertEqual(dispatcher.submit('a', lambda: 'a').result(timeout=1), 'a')
+        self.assertEqual(locked_while_taking, [False])
+
+
+class DispatcherTests(SimpleTestCase):
+
+    def test_priorities_and_duplicates(self):
+        """Reverse interativo antes de pesquisas e trabalho de fundo; pedidos iguais em fila juntam-se"""
+        dispatcher = NominatimDispatcher(rate=50, burst=1)
+        release = threading.Event()
+        order = []
+
+        def job(name):
+            def run():
+                if name == 'first':
+                    release.wait(1)
+                order.append(name)
+                return name
+            return run
+
+        first = dispatcher.submit('first', job('first'))
+        time.sleep(0.02)  # 'first' já está a correr; os seguintes ficam em fila
+        background = dispatcher.submit('bg', job('bg'), PRIORITY_BACKGROUND)
+        search = dispatcher.submit('search', job('search'), PRIORITY_SEARCH)
+        duplicate = dispatcher.submit('search', job('search-2'), PRIORITY_SEARCH)
+        reverse = dispatcher.submit('reverse', job('reverse'), PRIORITY_REVERSE)
+        self.assertIs(search, duplicate)
+        release.set()
+
+        self.assertEqual([f.result(2) for f in (first, background, search, reverse)],
+                         ['first', 'bg', 'search', 'reverse'])
+        self.assertEqual(order, ['first', 'reverse', 'search', 'bg'])
+
+    def test_rejects_when_wait_exceeds_deadline(self):
+        dispatcher = NominatimDispatcher(rate=1, burst=1)
+        self.assertEqual(dispatcher.call('a', lambda: 'a'), 'a')  # gasta a ficha
+        with deadline(0.2):
+            with self.assertRaises(NominatimBusy):
+                dispatcher.call('b', lambda: 'b')
+        self.assertEqual(dispatcher.queued(), 0)
+
+
+class GeocodeFallbackTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+
+    @patch('routes.services.geocoding_service.nominatim_dispatcher.call', side_effect=NominatimBusy('cheia'))
+    def test_busy_queue_serves_stale_then_local_answer(self, mock_call):
+        geocode_cache.set(geocode_key('Lisboa'), [{'display_name': 'Lisboa'}], ttl=0)
+        self.assertEqual(get_geocode('Lisboa'), [{'display_name': 'Lisboa'}])
+
+        SimpleTouristPoint.objects.create(name='Torre de Belém', category='monument', lat=38.69, lng=-9.21)
+        result = get_geocode('torre de belem')
+        self.assertEqual(result[0]['display_name'], 'Torre de Belém')
+        self.assertEqual(result[0]['source'], 'local')
+
+    async def test_busy_queue_and_short_budget_serve_stale_answer(self):
+        """A fila é avaliada com o prazo do cliente (X-Request-Budget), não com o do trabalho partilhado"""
+        await geocode_cache.aset(geocode_key('Porto'), [{'display_name': 'Porto'}], ttl=0)
+        with patch.object(nominatim_dispatcher, 'expected_wait', return_value=5.0), \
+             patch('routes.services.geocoding_service.get_nominatim_request') as upstream:
+            start = time.monotonic()
+            response = await AsyncClient().get('/api/geocode/', {'address': 'Porto'},
+                                               headers={'X-Request-Budget': '500'})
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'display_name': 'Porto'}])
+        upstream.assert_not_called()
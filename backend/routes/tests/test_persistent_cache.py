@@ -0,0 +1,137 @@
+"""
+Testes da cache persistente (SQLite) por trás das caches em memória
+"""
+import asyncio
+import io
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from ..services.cache import TTLCache
+from ..services.persistent_cache import PersistentStore, use_store, get_store
+
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+from routes.services.persistent_cache import PersistentStore
+store = PersistentStore({path!r}, busy_timeout=5)
+for i in range(200):
+    store.set('ns', ({worker}, i), {{'i': i}}, ttl=60)
+"""
+
+
+class PersistentStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / 'cache.sqlite3'
+
+    def test_ttl_and_stale_window(self):
+        store = PersistentStore(self.path)
+        store.set('ns', ('a', 1), {'v': 1}, ttl=60)
+        store.set('ns', ('b', 2), [1, 2], ttl=-1, stale_ttl=60)
+        value, ttl_left = store.get('ns', ('a', 1))
+        self.assertEqual(value, {'v': 1})
+        self.assertTrue(59 < ttl_left <= 60)
+        self.assertIsNone(store.get('ns', ('b', 2)))
+        self.assertEqual(store.get('ns', ('b', 2), stale=True)[0], [1, 2])
+        self.assertIsNone(store.get('other', ('a', 1)))
+
+    def test_get_many_in_one_query(self):
+        store = PersistentStore(self.path)
+        store.set_many('ns', {('c', i): i for i in range(3)}, ttl=60)
+        found = store.get_many('ns', [('c', 0), ('c', 2), ('c', 9)])
+        self.assertEqual({key: value for key, (value, _) in found.items()}, {('c', 0): 0, ('c', 2): 2})
+
+    def test_size_eviction_keeps_latest_expiring(self):
+        store = PersistentStore(self.path, max_bytes={'ns': 100})
+        for i in range(10):
+            store.set('ns', i, 'x' * 20, ttl=60 + i)  # 22 bytes cada
+        self.assertEqual(store.stats('ns')['entries'], 10)  # as escritas não limpam
+        store.evict('ns')
+        self.assertEqual(store.stats('ns'), {'entries': 4, 'bytes': 88})
+        self.assertIsNotNone(store.get('ns', 9))
+        self.assertIsNone(store.get('ns', 5))
+
+    def test_concurrent_processes(self):
+        """Vários processos a escrever ao mesmo tempo (WAL): nenhuma escrita se perde"""
+        root = str(Path(__file__).resolve().parents[2])
+        workers = [subprocess.Popen([sys.executable, '-c', WRITER.format(root=root, path=str(self.path), worker=w)])
+                   for w in range(4)]
+        self.assertEqual([w.wait(60) for w in workers], [0] * 4)
+        self.assertEqual(PersistentStore(self.path).stats('ns')['entries'], 800)
+
+    def test_background_eviction(self):
+        """A limpeza corre na thread do store, não nas escritas dos pedidos"""
+        store = PersistentStore(self.path, evict_interval=0.05)
+        self.addCleanup(store.close)
+        store.set('ns', 'old', 1, ttl=-1)
+        store.set('ns', 'new', 2, ttl=60)
+        for _ in range(100):
+            if store.stats('ns')['entries'] == 1:
+                break
+            time.sleep(0.02)
+        self.assertEqual(store.stats('ns')['entries'], 1)
+        self.assertIsNotNone(store.get('ns', 'new'))
+
+    def test_errors_count_as_misses(self):
+        store = PersistentStore(Path(self.path).parent, evict_interval=0)  # uma pasta não é uma base de dados
+        output = io.StringIO()
+        with redirect_stdout(output):
+            store.set('ns', 'a', 1, ttl=60)
+            self.assertIsNone(store.get('ns', 'a'))
+        self.assertEqual(store.errors, 2)
+        self.assertIn('Erro na cache persistente', output.getvalue())
+
+
+class WarmStartTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        previous = get_store()
+        self.addCleanup(use_store, previous)
+        use_store(PersistentStore(Path(tmp.name) / 'cache.sqlite3'))
+
+    def test_memory_miss_is_served_from_store(self):
+        """Um worker novo (memória vazia) encontra as respostas guardadas pelos outros"""
+        cache = TTLCache('test-persistent', maxsize=10, ttl=60, persistent=True)
+        cache.set(('route', 1.5), {'code': 'Ok'})
+        cache._data.clear()  # como num processo acabado de arrancar
+
+        self.assertEqual(cache.get(('route', 1.5)), {'code': 'Ok'})
+        self.assertEqual(cache.stats()['persistent_hits'], 1)
+        self.assertEqual(len(cache), 1)  # promovida para a memória
+        cache.clear()
+        cache._data.clear()
+        self.assertIsNone(cache.get(('route', 1.5)))
+
+    def test_async_access_runs_off_the_event_loop(self):
+        cache = TTLCache('test-persistent-async', maxsize=10, ttl=60, persistent=True)
+        threads = []
+        get_many = get_store().get_many
+
+        def tracked_get_many(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return get_many(*args, **kwargs)
+
+        async def run():
+            await cache.aset_many({('cell', i): i for i in range(3)})
+            cache._data.clear()
+            with patch.object(get_store(), 'get_many', tracked_get_many):
+                return await cache.aget_many([('cell', 0), ('cell', 2), ('cell', 5)]), threading.get_ident()
+
+        found, loop_thread = asyncio.run(run())
+        self.assertEqual(found, {('cell', 0): 0, ('cell', 2): 2})
+        self.assertEqual(len(threads), 1)  # uma só consulta para as três chaves
+        self.assertNotEqual(threads[0], loop_thread)
+        self.assertEqual(cache.stats()['persistent_hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
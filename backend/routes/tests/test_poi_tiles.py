@@ -0,0 +1,61 @@
+"""
+Testes dos tiles GeoJSON de POIs (/api/pois/tiles/{z}/{x}/{y}/)
+"""
+from django.test import TestCase
+
+from ..models import SimpleTouristPoint
+from ..services.cache import clear_caches
+from ..services.poi_tiles import tile_bounds
+from ..services.spatial_index import get_poi_index, invalidate_poi_index
+
+# Tile de Lisboa ao zoom 15 (contém 38.7, -9.14)
+LISBON_TILE = '/api/pois/tiles/15/15552/12558/'
+
+
+class PoiTileTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        invalidate_poi_index()
+        for i in range(5):
+            SimpleTouristPoint.objects.create(name=f'P{i}', category='museum', lat=38.7 + i * 0.0001, lng=-9.14)
+        # A view lê a BD noutra thread, que não vê a transação do teste: construir o índice aqui
+        get_poi_index()
+
+    def tearDown(self):
+        # O rollback do teste não dispara post_delete
+        invalidate_poi_index()
+
+    def test_tile_bounds(self):
+        min_lat, min_lng, max_lat, max_lng = tile_bounds(15, 15552, 12558)
+        self.assertTrue(min_lat <= 38.7 <= max_lat and min_lng <= -9.14 <= max_lng)
+        self.assertAlmostEqual(tile_bounds(0, 0, 0)[2], 85.0511, places=3)
+
+    def test_points_at_high_zoom_and_clusters_at_low_zoom(self):
+        """Zoom alto devolve os pontos; zoom baixo agrupa-os"""
+        features = self.client.get(LISBON_TILE).json()['features']
+        self.assertEqual(sorted(f['properties']['name'] for f in features), [f'P{i}' for i in range(5)])
+
+        features = self.client.get('/api/pois/tiles/0/0/0/').json()['features']
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['properties'], {'cluster': True, 'point_count': 5})
+
+    def test_etag_revalidation_and_invalidation(self):
+        """If-None-Match dá 304; uma alteração na tabela muda o ETag"""
+        response = self.client.get(LISBON_TILE)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        etag = response['ETag']
+
+        response = self.client.get(LISBON_TILE, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        SimpleTouristPoint.objects.create(name='Nova', category='museum', lat=38.7, lng=-9.1401)
+        get_poi_index()
+        response = self.client.get(LISBON_TILE, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['features']), 6)
+
+    def test_invalid_tile(self):
+        self.assertEqual(self.client.get('/api/pois/tiles/2/4/0/').status_code, 404)
@@ -12,6 +12,8 @@ import json
 from ..services.osrm_service import get_route
 from ..services.weather_service import get_weather_batch, get_weather_color_and_desc
 from ..services.geocoding_service import get_geocode, get_reverse_geocode
+from ..services.cache import clear_caches
+from .test_nominatim_dispatcher import lift_nominatim_rate_limit
 
 
 class A_InteroperabilityTests(TestCase):
@@ -23,8 +25,10 @@ class A_InteroperabilityTests(TestCase):
     
     def setUp(self):
         self.client = APIClient()
+        clear_caches()
+        lift_nominatim_rate_limit(self)
     
-    @patch('routes.services.osrm_service.httpx.get')
+    @patch('routes.services.osrm_service.http_get')
     def test_osrm_response_normalization(self, mock_get):
         """Testa se a resposta OSRM é normalizada com weather_segments e tourist_spots"""
         # Mock da resposta OSRM (formato real)
@@ -64,7 +68,7 @@ class A_InteroperabilityTests(TestCase):
                 self.assertIn('color', segment)
                 self.assertIn('description', segment)
     
-    @patch('routes.services.weather_service.httpx.get')
+    @patch('routes.services.weather_service.http_get')
     def test_weather_api_response_normalization(self, mock_get):
         """Testa se a resposta Open-Meteo é normalizada para formato padrão"""
         # Mock da resposta Open-Meteo (formato real)
@@ -88,7 +92,7 @@ class A_InteroperabilityTests(TestCase):
             self.assertIn('weather_code', result[0])
             self.assertIn('temperature_2m', result[0])
     
-    @patch('routes.services.geocoding_service.httpx.get')
+    @patch('routes.services.geocoding_service.http_get')
     def test_nominatim_response_normalization(self, mock_get):
         """Testa se a resposta Nominatim mantém formato consistente"""
         # Mock da resposta Nominatim (formato real)
@@ -115,7 +119,7 @@ class A_InteroperabilityTests(TestCase):
     def test_unified_response_structure(self):
         """Testa se todas as APIs retornam estruturas que o frontend pode consumir"""
         # Testa endpoint de rota que combina múltiplas APIs
-        with patch('routes.services.osrm_service.httpx.get') as mock_osrm, \
+        with patch('routes.services.osrm_service.http_get') as mock_osrm, \
              patch('routes.services.osrm_service.get_weather_batch') as mock_weather:
             
             mock_osrm_response = Mock()
@@ -149,8 +153,10 @@ class B_UsabilityTests(TestCase):
     
     def setUp(self):
         self.client = APIClient()
+        clear_caches()
+        lift_nominatim_rate_limit(self)
     
-    @patch('routes.services.osrm_service.httpx.get')
+    @patch('routes.services.osrm_service.http_get')
     def test_route_response_time_acceptable(self, mock_get):
         """Testa se o tempo de resposta da rota é aceitável (< 2 segundos)"""
         mock_response = Mock()
@@ -175,7 +181,7 @@ class B_UsabilityTests(TestCase):
         self.assertLess(response_time, 2.0, 
                        f"Tempo de resposta muito lento: {response_time:.2f}s")
     
-    @patch('routes.services.geocoding_service.httpx.get')
+    @patch('routes.services.geocoding_service.http_get')
     def test_geocode_response_time_acceptable(self, mock_get):
         """Testa se o geocoding responde rápido (< 1 segundo)"""
         mock_response = Mock()
@@ -284,8 +290,11 @@ class D_PerformanceTests(TestCase):
     D. Performance (Time Behaviour)
     Testa se o tempo de resposta entre pedido de rota e visualização é otimizado.
     """
+
+    def setUp(self):
+        clear_caches()
     
-    @patch('routes.services.osrm_service.httpx.get')
+    @patch('routes.services.osrm_service.http_get')
     def test_route_calculation_performance(self, mock_get):
         """Testa performance do cálculo de rotas"""
         mock_response = Mock()
@@ -311,7 +320,7 @@ class D_PerformanceTests(TestCase):
                        f"Cálculo de rota muito lento: {elapsed:.3f}s")
         self.assertIsNotNone(result)
     
-    @patch('routes.services.weather_service.httpx.get')
+    @patch('routes.services.weather_service.http_get')
     def test_weather_batch_performance(self, mock_get):
         """Testa performance do batch request de weather"""
         # Simula 50 pontos (tamanho do batch)
@@ -337,7 +346,7 @@ class D_PerformanceTests(TestCase):
                        f"Batch weather muito lento: {elapsed:.3f}s para {len(points)} pontos")
         self.assertEqual(len(result), len(points))
     
-    @patch('routes.services.osrm_service.httpx.get')
+    @patch('routes.services.osrm_service.http_get')
     def test_route_with_climatic_performance(self, mock_get):
         """Testa performance de rota com segmentos climáticos"""
         # Mock de rota com muitos pontos
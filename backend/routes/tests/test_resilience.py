@@ -0,0 +1,196 @@
+"""
+Testes do disjuntor, do prazo do pedido e dos GETs em duplicado (hedging)
+"""
+import asyncio
+import time
+from unittest.mock import patch
+
+import httpx
+from django.test import SimpleTestCase, TestCase
+
+from ..services import resilience
+from ..services.cache import TTLCache, clear_caches
+from ..services.http_client import ahttp_get, http_get, upstream_name
+from ..services.osrm_service import get_osrm_request, osrm_cache, osrm_cache_key, osrm_url
+from ..services.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded,
+    clamp_timeout, deadline, get_breaker, reset_breakers
+)
+
+
+def fake_client(handler):
+    """Cliente httpx com MockTransport no lugar do cliente partilhado do servidor."""
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_failures_and_probes_once(self):
+        breaker = CircuitBreaker('osrm.test', failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())   # pedido de teste
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())  # só um de cada vez
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_deadline_clamps_timeout(self):
+        self.assertEqual(clamp_timeout(30), (30, False))
+        with deadline(5):
+            timeout, clamped = clamp_timeout(30)
+            self.assertTrue(clamped)
+            self.assertLessEqual(timeout, 5)
+            with deadline(60):  # um prazo interior nunca alarga o exterior
+                self.assertLessEqual(clamp_timeout(30)[0], 5)
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                clamp_timeout(30)
+
+
+class GuardedRequestTests(TestCase):
+
+    def setUp(self):
+        reset_breakers()
+        clear_caches()
+
+    def tearDown(self):
+        reset_breakers()
+
+    def test_5xx_opens_breaker_and_skips_upstream(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(503)
+
+        with patch('routes.services.http_client.get_client', return_value=fake_client(handler)), \
+             patch.object(get_breaker('osrm.test'), 'failure_threshold', 2):
+            http_get('http://osrm.test/a')
+            http_get('http://osrm.test/a')
+            with self.assertRaises(CircuitOpenError):
+                http_get('http://osrm.test/a')
+        self.assertEqual(len(calls), 2)
+
+    def test_deadline_timeout_is_not_a_breaker_failure(self):
+        def handler(request):
+            raise httpx.ReadTimeout("lento", request=request)
+
+        with patch('routes.services.http_client.get_client', return_value=fake_client(handler)):
+            with deadline(5):
+                with self.assertRaises(httpx.ReadTimeout):
+                    http_get('http://osrm.test/a', timeout=30)
+        self.assertEqual(get_breaker('osrm.test').failures, 0)
+
+    def test_expired_deadline_is_not_a_breaker_failure(self):
+        """Um cliente sem prazo não faz o pedido e não abre (nem prende meio-aberto) o disjuntor"""
+        breaker = get_breaker('osrm.test')
+        with patch('routes.services.http_client.get_client') as get_client, deadline(0):
+            for _ in range(breaker.failure_threshold + 1):
+                with self.assertRaises(DeadlineExceeded):
+                    http_get('http://osrm.test/a', timeout=30)
+        get_client.return_value.get.assert_not_called()
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+        async def send(url, **kwargs):
+            return httpx.Response(200)
+
+        async def run():
+            with deadline(0):
+                for _ in range(breaker.failure_threshold + 1):
+                    with self.assertRaises(DeadlineExceeded):
+                        await resilience.aguarded_get('osrm.test', send, 'http://osrm.test/a', {'timeout': 30})
+        asyncio.run(run())
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+        breaker.state, breaker.opened_at = OPEN, 0.0  # reset_timeout já passou: próximo pedido é o de teste
+        with deadline(0), self.assertRaises(DeadlineExceeded):
+            http_get('http://osrm.test/a', timeout=30)
+        self.assertTrue(breaker.allow())  # a vaga de teste foi libertada
+
+    def test_open_breaker_serves_stale_osrm_response(self):
+        """Com o OSRM indisponível a última rota boa (já expirada) continua a ser servida"""
+        args = ('route', 'v1', 'driving', '-9.1,38.7;-9.2,38.8', [])
+        osrm_cache.set(osrm_cache_key(*args), {'code': 'Ok', 'routes': []}, ttl=0)
+        breaker = get_breaker('server_driving')
+        breaker.state, breaker.opened_at = OPEN, time.monotonic()
+
+        with patch('routes.services.http_client.get_client') as get_client:
+            self.assertEqual(get_osrm_request(*args)['code'], 'Ok')
+        get_client.return_value.get.assert_not_called()
+        self.assertEqual(osrm_cache.stats()['stale_hits'], 1)
+
+
+class UpstreamNameTests(SimpleTestCase):
+
+    def test_breakers_are_per_configured_upstream(self):
+        """Com o servidor de substituição todos partilham host:porta; cada serviço tem o seu disjuntor"""
+        standin = {'SERVER_DRIVING': 'http://127.0.0.1:8090/osrm/driving',
+                   'SERVER_BIKE': 'http://127.0.0.1:8090/osrm/bike',
+                   'OPEN_METEO_URL': 'http://127.0.0.1:8090/open-meteo/v1/forecast'}
+        with patch.dict('routes.services.http_client.UPSTREAMS', standin, clear=True):
+            self.assertEqual(upstream_name('http://127.0.0.1:8090/osrm/driving/route/v1/driving/1,2;3,4'),
+                             'server_driving')
+            self.assertEqual(upstream_name('http://127.0.0.1:8090/osrm/bike/route/v1/bike/1,2;3,4'), 'server_bike')
+            self.assertEqual(upstream_name('http://127.0.0.1:8090/open-meteo/v1/forecast?latitude=1'),
+                             'open_meteo_url')
+            self.assertEqual(upstream_name('http://osrm.test/a'), 'osrm.test')
+        self.assertEqual(upstream_name(osrm_url('route', 'v1', 'driving', '1,2;3,4', [])), 'server_driving')
+
+
+class StaleCacheTests(SimpleTestCase):
+
+    def test_stale_values_outlive_ttl(self):
+        cache = TTLCache('test-stale', maxsize=4, ttl=60, stale_ttl=60)
+        cache.set('a', 1, ttl=0)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get_stale('a'), 1)
+        self.assertIsNone(TTLCache('test-no-stale', maxsize=4, ttl=60).get_stale('a'))
+
+
+class HedgeTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_breakers()
+
+    def test_slow_request_is_hedged(self):
+        calls = []
+
+        async def send(url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return httpx.Response(200, json={'n': len(calls)})
+
+        async def run():
+            return await resilience.aguarded_get('osrm.test', send, 'http://osrm.test/a', {'timeout': 10},
+                                                 hedge_delay=0.02)
+
+        start = time.perf_counter()
+        response = asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(response.json(), {'n': 2})
+        self.assertEqual(resilience.hedged_requests.value('osrm.test'), 1)
+
+    def test_hedge_is_off_without_delay(self):
+        def handler(request):
+            return httpx.Response(200)
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with patch('routes.services.http_client.get_async_send', return_value=client.get):
+                return await ahttp_get('http://osrm.test/a')
+
+        before = resilience.hedged_requests.value('osrm.test')
+        self.assertEqual(asyncio.run(run()).status_code, 200)
+        self.assertEqual(resilience.hedged_requests.value('osrm.test'), before)
@@ -0,0 +1,52 @@
+"""
+Testes dos formatos compactos da resposta de rota (polyline6 e MessagePack)
+"""
+import json
+from unittest.mock import AsyncMock, patch
+from django.test import TestCase, AsyncClient
+
+from ..services.geometry import decode_polyline, encode_polyline
+from ..services.route_formats import compact_route
+
+
+def climatic_route():
+    geometry = [[round(-9.2 + i * 0.001, 6), round(38.7 + i * 0.0003, 6)] for i in range(300)]
+    return {
+        'routes': [{'distance': 30000, 'geometry': {'type': 'LineString', 'coordinates': geometry},
+                    'legs': [{'steps': [{'geometry': {'type': 'LineString', 'coordinates': geometry[:10]}}]}]}],
+        'weather_segments': [
+            {'coordinates': geometry[0:120], 'color': '#f59e0b', 'description': 'Sol'},
+            {'coordinates': geometry[119:300], 'color': '#3b82f6', 'description': 'Chuva'},
+        ],
+        'tourist_spots': [],
+    }
+
+
+class CompactRouteTests(TestCase):
+
+    def test_polyline6_roundtrip(self):
+        geometry = [[-9.123456, 38.654321], [-9.2, 38.7], [-8.0, 41.15]]
+        self.assertEqual(decode_polyline(encode_polyline(geometry)), geometry)
+
+    def test_segments_become_index_ranges(self):
+        route = climatic_route()
+        compact = compact_route(route)
+        geometry = decode_polyline(compact['routes'][0]['geometry'])
+        for seg, original in zip(compact['weather_segments'], route['weather_segments']):
+            start, end = seg['range']
+            self.assertEqual(geometry[start:end + 1], original['coordinates'])
+        self.assertIsInstance(compact['routes'][0]['legs'][0]['steps'][0]['geometry'], str)
+        # A resposta original (e a cache OSRM) não é alterada
+        self.assertIsInstance(route['routes'][0]['geometry'], dict)
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(route)) / 3)
+
+    async def test_view_negotiates_msgpack(self):
+        import msgpack
+        with patch('routes.views.osrm_views.aget_route', AsyncMock(return_value=climatic_route())):
+            client = AsyncClient()
+            params = {'origin_lng': -9.2, 'origin_lat': 38.7, 'dest_lng': -8.9, 'dest_lat': 38.79}
+            packed = await client.get('/api/osrm/route/', params, headers={'Accept': 'application/msgpack'})
+            compact = await client.get('/api/osrm/route/', {**params, 'format': 'polyline6'})
+
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), compact.json())
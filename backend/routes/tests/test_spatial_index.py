@@ -0,0 +1,100 @@
+"""
+Testes do índice espacial de POIs em memória
+"""
+from django.test import TestCase
+
+from ..models import SimpleTouristPoint
+from ..services.spatial_index import PoiGridIndex, get_poi_index
+from ..services.tourism_service import find_pois_near_point_local
+
+
+class PoiGridIndexTests(TestCase):
+
+    def test_radius_query_matches_haversine(self):
+        """Só devolve pontos dentro do raio, ordenados por distância"""
+        points = [
+            {'id': 1, 'lat': 38.7000, 'lon': -9.1400, 'name': 'A', 'category': 'museum'},
+            {'id': 2, 'lat': 38.7020, 'lon': -9.1400, 'name': 'B', 'category': 'museum'},  # ~222m
+            {'id': 3, 'lat': 38.7100, 'lon': -9.1400, 'name': 'C', 'category': 'museum'},  # ~1.1km
+        ]
+        index = PoiGridIndex(points)
+        found = index.query_radius(38.7, -9.14, 500)
+        self.assertEqual([p['name'] for _, p in found], ['A', 'B'])
+        self.assertLess(found[0][0], found[1][0])
+
+    def test_query_across_cell_boundaries(self):
+        """Pontos em células vizinhas são encontrados"""
+        points = [{'id': 1, 'lat': 38.69999, 'lon': -9.10001, 'name': 'A', 'category': 'x'}]
+        index = PoiGridIndex(points, cell_size=0.01)
+        self.assertEqual(len(index.query_radius(38.70001, -9.09999, 50)), 1)
+
+    def test_index_rebuilt_after_db_change(self):
+        """Gravações no modelo invalidam o índice do processo"""
+        self.assertEqual(find_pois_near_point_local(38.7, -9.14, 100), [])
+        SimpleTouristPoint.objects.create(name='Torre', category='castle', lat=38.7, lng=-9.14)
+        found = find_pois_near_point_local(38.7, -9.14, 100)
+        self.assertEqual([p['name'] for p in found], ['Torre'])
+        self.assertEqual(find_pois_near_point_local(38.7, -9.14, 100, ['Torre']), [])
+        self.assertEqual(get_poi_index().size, 1)
+
+    def test_corridor_query_sorted_along_route(self):
+        """O corredor devolve cada POI uma vez, ordenado ao longo da rota"""
+        points = [
+            {'id': 1, 'lat': 38.7010, 'lon': -9.1300, 'name': 'Igreja', 'category': 'x'},
+            {'id': 2, 'lat': 38.7010, 'lon': -9.1600, 'name': 'Igreja', 'category': 'x'},
+            {'id': 3, 'lat': 38.7100, 'lon': -9.1450, 'name': 'Longe', 'category': 'x'},
+        ]
+        index = PoiGridIndex(points)
+        polyline = [[-9.17, 38.70], [-9.15, 38.70], [-9.12, 38.70]]
+        found = index.query_corridor(polyline, 200)
+        self.assertEqual([p['id'] for _, _, p in found], [2, 1])
+        self.assertTrue(all(offset <= 200 for _, offset, _ in found))
+
+
+class RtreeQueryTests(TestCase):
+    """Pesquisas na BD (R*Tree em SQLite, sincronizada por triggers)"""
+
+    def setUp(self):
+        self.torre = SimpleTouristPoint.objects.create(name='Torre', category='x', lat=38.6916, lng=-9.2160)
+        SimpleTouristPoint.objects.create(name='Porto', category='x', lat=41.14, lng=-8.61)
+
+    def test_bbox_and_radius_follow_inserts_updates_and_deletes(self):
+        in_lisbon = SimpleTouristPoint.objects.in_bbox(38.6, -9.3, 38.8, -9.1)
+        self.assertEqual([p.name for p in in_lisbon], ['Torre'])
+
+        self.torre.lat, self.torre.lng = 41.15, -8.62
+        self.torre.save()
+        self.assertFalse(SimpleTouristPoint.objects.in_bbox(38.6, -9.3, 38.8, -9.1).exists())
+        self.assertEqual(len(SimpleTouristPoint.objects.within_radius(41.14, -8.61, 2000)), 2)
+
+        self.torre.delete()
+        self.assertEqual([p.name for _, p in SimpleTouristPoint.objects.within_radius(41.14, -8.61, 2000)], ['Porto'])
+
+    def test_tourism_service_db_fallback(self):
+        from unittest.mock import patch
+        from ..services.tourism_service import find_pois_along_route
+        with patch('routes.services.tourism_service.POI_INDEX_ENABLED', False):
+            found = find_pois_along_route([[-9.22, 38.69], [-9.21, 38.69]], 200)
+            near = find_pois_near_point_local(38.6916, -9.2160, 50)
+        self.assertEqual([p['name'] for p in found], ['Torre'])
+        self.assertEqual([p['name'] for p in near], ['Torre'])
+
+    def test_lookups_use_db_while_index_is_rebuilding(self):
+        """Com o índice inválido e outro pedido a reconstruí-lo (lock ocupado) não se espera: vai-se à BD"""
+        from ..services import spatial_index
+        from ..services.tourism_service import find_pois_along_route
+        spatial_index.invalidate_poi_index()
+        with spatial_index._lock:
+            found = find_pois_along_route([[-9.22, 38.69], [-9.21, 38.69]], 200)
+            near = find_pois_near_point_local(38.6916, -9.2160, 50)
+            self.assertIsNone(spatial_index._index)
+        self.assertEqual([p['name'] for p in found], ['Torre'])
+        self.assertEqual([p['name'] for p in near], ['Torre'])
+
+
+class FastDeleteTests(TestCase):
+
+    def test_queryset_delete_stays_fast(self):
+        """Sem receivers de delete o queryset.delete() do load_points é um só DELETE"""
+        from django.db.models.deletion import Collector
+        self.assertTrue(Collector(using='default').can_fast_delete(SimpleTouristPoint.objects.all()))
@@ -0,0 +1,86 @@
+"""
+Testes da escolha e ordenação dos waypoints turísticos
+"""
+from unittest.mock import Mock, patch
+from django.test import TestCase
+
+from ..models import SimpleTouristPoint
+from ..services.cache import clear_caches
+from ..services.osrm_service import get_route, select_tourist_waypoints, tourist_radius
+from ..services.spatial_index import get_poi_index, invalidate_poi_index
+
+
+def marker(pk, along, offset):
+    return {'id': pk, 'lat': 38.7, 'lon': -9.1, 'name': f'P{pk}', 'category': 'x',
+            'along_route': along, 'offset': offset}
+
+
+def osrm_response(data):
+    response = Mock()
+    response.json.return_value = data
+    response.raise_for_status = Mock()
+    return response
+
+
+class SelectWaypointsTests(TestCase):
+
+    def test_ordered_by_projection_within_budget(self):
+        """Os mais próximos da rota primeiro, dentro do orçamento, devolvidos pela ordem na rota"""
+        radius = tourist_radius('walking')
+        markers = [marker(1, 3000, 10), marker(2, 1000, 20), marker(3, 2000, radius),
+                   marker(4, 1010, 5)]  # 4 fica a menos de um raio do 2 e é mais próximo da rota
+        with patch('routes.services.osrm_service.TOURIST_DETOUR_BUDGET', 2):
+            chosen, ambiguous = select_tourist_waypoints(markers, 'walking')
+        # Orçamento 2 raios: 4 (10m) + 1 (20m) cabem; 3 (100m de ida e volta) já não
+        self.assertEqual([p['id'] for p in chosen], [4, 1])
+        self.assertFalse(ambiguous)
+
+    def test_ambiguous_when_projections_overlap(self):
+        radius = tourist_radius('driving')
+        chosen, ambiguous = select_tourist_waypoints(
+            [marker(1, 1000, radius * 0.8), marker(2, 1000 + radius * 1.2, radius * 0.8)], 'driving')
+        self.assertEqual(len(chosen), 2)
+        self.assertTrue(ambiguous)
+
+
+class TouristRouteTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        invalidate_poi_index()
+
+    def tearDown(self):
+        invalidate_poi_index()
+
+    def route_with_pois(self, pois):
+        for name, lat, lng in pois:
+            SimpleTouristPoint.objects.create(name=name, category='museum', lat=lat, lng=lng)
+        get_poi_index()
+        base = {'code': 'Ok', 'routes': [{'distance': 2000, 'duration': 300,
+                                          'geometry': {'coordinates': [[-9.2, 38.7], [-9.18, 38.7]]}}]}
+        trip = {'code': 'Ok', 'trips': base['routes']}
+        urls = []
+
+        def fake_get(url, **kwargs):
+            urls.append(url)
+            return osrm_response(trip if '/trip/' in url else base)
+
+        with patch('routes.services.osrm_service.http_get', side_effect=fake_get):
+            result = get_route('driving', (-9.2, 38.7), (-9.18, 38.7), is_tourist=True)
+        return result, urls
+
+    def test_no_detour_reuses_base_route(self):
+        """Sem POIs no corredor a rota base é a final: um só pedido ao OSRM"""
+        result, urls = self.route_with_pois([])
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(result['tourist_spots'], [])
+
+    def test_ambiguous_order_uses_trip_service(self):
+        """POIs em lados opostos e à mesma altura da rota: o trip decide a ordem"""
+        result, urls = self.route_with_pois([('Norte', 38.7035, -9.19), ('Sul', 38.6965, -9.1838)])
+        self.assertEqual(len(urls), 2)
+        self.assertIn('/trip/v1/', urls[1])
+        self.assertIn('source=first', urls[1])
+        self.assertIn('roundtrip=false', urls[1])
+        self.assertEqual(len(result['routes']), 1)
+        self.assertNotIn('trips', result)
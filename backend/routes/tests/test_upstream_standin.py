@@ -0,0 +1,88 @@
+"""
+Testes do servidor local de substituição das APIs externas e do gerador de carga
+"""
+import asyncio
+import os
+import threading
+from importlib import reload
+from unittest.mock import patch
+
+import httpx
+from django.test import SimpleTestCase
+
+from ..benchmarks.loadgen import parse_mix, percentile, run_load
+from ..benchmarks.upstream_server import Faults, UpstreamStandIn, parse_service_faults, resolve
+from ..services import config
+
+
+class UpstreamConfigTests(SimpleTestCase):
+
+    def tearDown(self):
+        reload(config)
+
+    def test_env_overrides(self):
+        """Variável própria > BETTERMAPS_UPSTREAM_URL > servidor público"""
+        env = {'BETTERMAPS_UPSTREAM_URL': 'http://127.0.0.1:8090/',
+               'BETTERMAPS_NOMINATIM_SERVER': 'http://geo.local'}
+        with patch.dict(os.environ, env):
+            reload(config)
+            self.assertEqual(config.SERVER_DRIVING, 'http://127.0.0.1:8090/osrm/driving')
+            self.assertEqual(config.OPEN_METEO_URL, 'http://127.0.0.1:8090/open-meteo/v1/forecast')
+            self.assertEqual(config.NOMINATIM_SERVER, 'http://geo.local')
+        with patch.dict(os.environ, {}, clear=True):
+            reload(config)
+            self.assertEqual(config.SERVER_DRIVING, 'router.project-osrm.org')
+
+
+class StandInServerTests(SimpleTestCase):
+
+    def start(self, **kwargs):
+        server = UpstreamStandIn(('127.0.0.1', 0), **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_resolve_maps_to_public_urls(self):
+        self.assertEqual(resolve('/osrm/foot/route/v1/driving/1,2;3,4.json'),
+                         ('osrm', 'https://routing.openstreetmap.de/routed-foot/route/v1/driving/1,2;3,4.json'))
+        self.assertEqual(resolve('/nominatim/search')[1], 'https://nominatim.openstreetmap.org/search')
+        self.assertIsNone(resolve('/other'))
+
+    def test_replays_and_injects_errors(self):
+        server = self.start(service_faults={'open-meteo': Faults(error_rate=1.0, error_status=500)})
+        route = httpx.get(f"{server.url}/osrm/driving/route/v1/driving/-9.2,38.7;-9.1,38.8.json?overview=full")
+        self.assertEqual(route.status_code, 200)
+        self.assertEqual(route.json()['code'], 'Ok')
+
+        weather = httpx.get(f"{server.url}/open-meteo/v1/forecast", params={'latitude': '38.7', 'longitude': '-9.1'})
+        self.assertEqual(weather.status_code, 500)
+        self.assertEqual(server.counters['open-meteo'], {'requests': 1, 'injected_errors': 1})
+
+    def test_parse_service_faults(self):
+        faults = parse_service_faults(['osrm:latency_ms=80,error_status=502'], Faults(jitter_ms=5))
+        self.assertEqual(faults['osrm'], Faults(latency_ms=80, jitter_ms=5, error_status=502))
+        with self.assertRaises(ValueError):
+            parse_service_faults(['redis:latency_ms=1'], Faults())
+
+
+class LoadGeneratorTests(SimpleTestCase):
+
+    def test_percentiles_and_mix(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (50, 95, 99))
+        self.assertEqual(parse_mix('normal=3,climatic=1'), {'normal': 3.0, 'climatic': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('fast=1')
+
+    def test_run_load_report(self):
+        def app(request):
+            params = request.url.params
+            return httpx.Response(503 if params.get('climatic') == 'true' else 200, json={})
+
+        report = asyncio.run(run_load('http://app', duration=5, concurrency=4, max_requests=40,
+                                      mix={'normal': 1, 'climatic': 1}, transport=httpx.MockTransport(app)))
+        self.assertEqual(report['total']['requests'], 40)
+        self.assertEqual(report['by_kind']['climatic']['error_rate'], 1.0)
+        self.assertEqual(report['by_kind']['normal']['errors'], 0)
+        self.assertIsNotNone(report['total']['p99_ms'])
@@ -1,5 +1,9 @@
 from django.urls import path
-from .views import OsrmNearestView, OsrmRouteView, GeocodeView, ReverseGeocodeView
+from .views import (
+    OsrmNearestView, OsrmRouteView, OsrmRouteStreamView, OsrmRouteBatchView, OsrmTableView,
+    GeocodeView, ReverseGeocodeView, AutocompleteView,
+    PoiTileView, MetricsView,
+)
 
 app_name = 'routes'
 
@@ -7,8 +11,18 @@ urlpatterns = [
     # Rotas OSRM
     path('osrm/nearest/', OsrmNearestView.as_view()),
     path('osrm/route/', OsrmRouteView.as_view()),
+    path('osrm/route/stream/', OsrmRouteStreamView.as_view()),
+    path('osrm/route/batch/', OsrmRouteBatchView.as_view()),
+    path('osrm/table/', OsrmTableView.as_view()),
 
     # Rotas Nominatim (Geocoding)
     path('geocode/', GeocodeView.as_view()),
     path('reverse-geocode/', ReverseGeocodeView.as_view()),
+    path('autocomplete/', AutocompleteView.as_view()),
+
+    # Tiles GeoJSON de pontos turísticos
+    path('pois/tiles/<int:z>/<int:x>/<int:y>/', PoiTileView.as_view()),
+
+    # Métricas Prometheus
+    path('metrics/', MetricsView.as_view()),
 ]
\ No newline at end of file
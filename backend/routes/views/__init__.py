@@ -1,5 +1,10 @@
-from .osrm_views import OsrmNearestView, OsrmRouteView
-from .geocoding_views import GeocodeView, ReverseGeocodeView
-
-__all__ = ['OsrmNearestView', 'OsrmRouteView', 'GeocodeView', 'ReverseGeocodeView']
+from .osrm_views import OsrmNearestView, OsrmRouteView, OsrmRouteStreamView, OsrmRouteBatchView, OsrmTableView
+from .geocoding_views import GeocodeView, ReverseGeocodeView, AutocompleteView
+from .poi_views import PoiTileView
+from .metrics_views import MetricsView
 
+__all__ = [
+    'OsrmNearestView', 'OsrmRouteView', 'OsrmRouteStreamView', 'OsrmRouteBatchView', 'OsrmTableView',
+    'GeocodeView', 'ReverseGeocodeView', 'AutocompleteView',
+    'PoiTileView', 'MetricsView',
+]
@@ -1,30 +1,53 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from ..services.geocoding_service import get_geocode, get_reverse_geocode
+from django.http import JsonResponse
+from django.views import View
+from ..services.geocoding_service import aget_geocode, aget_reverse_geocode
+from ..services.resilience import DeadlineExceeded
+from ..services.poi_search import autocomplete
+from ..services.utils import db_sync_to_async
 
 
-class GeocodeView(APIView):
-    def get(self, request):
-        address = request.query_params.get('address')
+class GeocodeView(View):
+    async def get(self, request):
+        address = request.GET.get('address')
         if not address:
-            return Response({'error': 'Address parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Address parameter is required'}, status=400)
         try:
-            result = get_geocode(address)
-            return Response(result)
+            result = await aget_geocode(address)
+            return JsonResponse(result, safe=False)
+        except DeadlineExceeded as e:
+            # Fila do Nominatim cheia (ou prazo esgotado) e sem resposta guardada: o cliente pode tentar mais tarde
+            return JsonResponse({'error': str(e)}, status=503, headers={'Retry-After': '1'})
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({'error': str(e)}, status=500)
 
 
-class ReverseGeocodeView(APIView):
-    def get(self, request):
-        lat = request.query_params.get('lat')
-        lng = request.query_params.get('lng')
+class ReverseGeocodeView(View):
+    async def get(self, request):
+        lat = request.GET.get('lat')
+        lng = request.GET.get('lng')
         if not lat or not lng:
-            return Response({'error': 'Lat and Lng parameters are required'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Lat and Lng parameters are required'}, status=400)
         try:
-            result = get_reverse_geocode(lat, lng)
-            return Response(result)
+            result = await aget_reverse_geocode(lat, lng)
+            return JsonResponse(result, safe=False)
+        except DeadlineExceeded as e:
+            # Fila do Nominatim cheia (ou prazo esgotado) e sem resposta guardada: o cliente pode tentar mais tarde
+            return JsonResponse({'error': str(e)}, status=503, headers={'Retry-After': '1'})
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({'error': str(e)}, status=500)
 
+
+class AutocompleteView(View):
+    async def get(self, request):
+        query = request.GET.get('q')
+        if not query:
+            return JsonResponse({'error': 'q parameter is required'}, status=400)
+        try:
+            limit = min(int(request.GET.get('limit', 5)), 20)
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'limit must be at least 1'}, status=400)
+        # Índice local de POIs: sem pedidos ao Nominatim (pode ler a BD se o índice mudou)
+        result = await db_sync_to_async(autocomplete)(query, limit)
+        return JsonResponse(result, safe=False)
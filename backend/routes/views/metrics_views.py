@@ -0,0 +1,11 @@
+from django.http import HttpResponse
+from django.views import View
+from ..services.metrics import render_metrics
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsView(View):
+    # Métricas deste processo (com vários workers, cada um é recolhido em separado)
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,49 +1,264 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from ..services.osrm_service import get_nearest_service, get_route
+import json
+from contextlib import nullcontext
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from ..services.config import ROUTE_BATCH_MAX_ITEMS, MATRIX_MAX_CELLS
+from ..services.osrm_service import (
+    aget_nearest_service, aget_route, astream_route, aget_routes_batch, aget_table
+)
+from ..services.geometry import zoom_to_tolerance
+from ..services.resilience import deadline, remaining_time
+from ..services.route_formats import (
+    FORMAT_JSON, FORMAT_POLYLINE6, FORMAT_MSGPACK, negotiate_format, compact_route, pack, pack_route
+)
 
 
-class OsrmNearestView(APIView):
-    def get(self, request):
-        lng = request.query_params.get('lng')
-        lat = request.query_params.get('lat')
-        profile = request.query_params.get('profile', 'driving')
+def parse_tolerance(params, lat):
+    """`tolerance` em metros ou `zoom` do mapa (tolerância de ~1 pixel); None = sem simplificação."""
+    if params.get('tolerance'):
+        return max(0.0, float(params['tolerance']))
+    if params.get('zoom'):
+        return float(zoom_to_tolerance(min(max(float(params['zoom']), 0), 22), float(lat)))
+    return None
+
+
+# JSON sem espaços depois de ',' e ':' (as coordenadas são a maior parte da resposta)
+COMPACT_JSON = {'separators': (',', ':')}
+
+
+def render_route(result, fmt):
+    """Serializa o resultado do get_route no formato negociado."""
+    if fmt == FORMAT_MSGPACK:
+        try:
+            response = HttpResponse(pack_route(result), content_type='application/msgpack')
+        except ImportError:
+            return JsonResponse({'error': 'msgpack not available'}, status=406)
+    elif fmt == FORMAT_POLYLINE6:
+        response = JsonResponse(compact_route(result), json_dumps_params=COMPACT_JSON)
+    else:
+        response = JsonResponse(result, json_dumps_params=COMPACT_JSON)
+    response['Vary'] = 'Accept'
+    return response
+
+
+def render_batch(results, fmt):
+    """Como o render_route, para a lista de resultados já compactados (polyline6/msgpack) do batch."""
+    if fmt == FORMAT_MSGPACK:
+        try:
+            response = HttpResponse(pack({'results': results}), content_type='application/msgpack')
+        except ImportError:
+            return JsonResponse({'error': 'msgpack not available'}, status=406)
+    else:
+        response = JsonResponse({'results': results}, json_dumps_params=COMPACT_JSON)
+    response['Vary'] = 'Accept'
+    return response
+
+
+class OsrmNearestView(View):
+    async def get(self, request):
+        lng = request.GET.get('lng')
+        lat = request.GET.get('lat')
+        profile = request.GET.get('profile', 'driving')
 
         if not lng or not lat:
-            return Response({'error': 'lng and lat required'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'lng and lat required'}, status=400)
 
         try:
-            result = get_nearest_service(profile, f"{lng},{lat}", 1)
-            return Response(result)
+            result = await aget_nearest_service(profile, f"{lng},{lat}", 1)
+            return JsonResponse(result)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({'error': str(e)}, status=500)
+
+
+def parse_route_params(request):
+    """Devolve (kwargs para aget_route/astream_route, None) ou (None, resposta de erro)."""
+    origin_lng = request.GET.get('origin_lng')
+    origin_lat = request.GET.get('origin_lat')
+    dest_lng = request.GET.get('dest_lng')
+    dest_lat = request.GET.get('dest_lat')
+    profile = request.GET.get('profile', 'driving')
 
+    # Receber parâmetros Booleanos
+    # "true" string -> True boolean
+    is_tourist = request.GET.get('tourist') == 'true'
+    is_climatic = request.GET.get('climatic') == 'true'
 
-class OsrmRouteView(APIView):
-    def get(self, request):
-        origin_lng = request.query_params.get('origin_lng')
-        origin_lat = request.query_params.get('origin_lat')
-        dest_lng = request.query_params.get('dest_lng')
-        dest_lat = request.query_params.get('dest_lat')
-        profile = request.query_params.get('profile', 'driving')
+    if not all([origin_lng, origin_lat, dest_lng, dest_lat]):
+        return None, JsonResponse({'error': 'All coordinates required'}, status=400)
 
-        # Receber parâmetros Booleanos
-        # "true" string -> True boolean
-        is_tourist = request.query_params.get('tourist') == 'true'
-        is_climatic = request.query_params.get('climatic') == 'true'
+    try:
+        tolerance = parse_tolerance(request.GET, origin_lat)
+    except ValueError:
+        return None, JsonResponse({'error': 'tolerance and zoom must be numbers'}, status=400)
 
-        if not all([origin_lng, origin_lat, dest_lng, dest_lat]):
-            return Response({'error': 'All coordinates required'}, status=status.HTTP_400_BAD_REQUEST)
+    return {
+        'profile': profile,
+        'origin': (origin_lng, origin_lat),
+        'dest': (dest_lng, dest_lat),
+        'is_tourist': is_tourist,
+        'is_climatic': is_climatic,
+        'tolerance': tolerance,
+    }, None
 
-        origin = (origin_lng, origin_lat)
-        dest = (dest_lng, dest_lat)
+
+class OsrmRouteView(View):
+    async def get(self, request):
+        params, error = parse_route_params(request)
+        if error:
+            return error
+
+        fmt = negotiate_format(request.GET, request.headers.get('Accept'))
+        if fmt not in (FORMAT_JSON, FORMAT_POLYLINE6, FORMAT_MSGPACK):
+            return JsonResponse({'error': f'Unknown format: {fmt}'}, status=400)
 
         try:
             # Passar os flags para o serviço
-            result = get_route(profile, origin, dest, is_tourist, is_climatic)
-            return Response(result)
+            result = await aget_route(**params)
+            return render_route(result, fmt)
+        except Exception as e:
+            print(f"Erro na View: {e}")
+            return JsonResponse({'error': str(e)}, status=500)
+
+
+class OsrmRouteStreamView(View):
+    """
+    Rota em streaming: NDJSON (um evento JSON por linha) ou Server-Sent Events
+    se o cliente pedir `Accept: text/event-stream`.
+    """
+
+    async def get(self, request):
+        params, error = parse_route_params(request)
+        if error:
+            return error
+
+        sse = 'text/event-stream' in request.headers.get('Accept', '')
+
+        def encode(event):
+            data = json.dumps(event, separators=(',', ':'))
+            if sse:
+                return f"event: {event['type']}\ndata: {data}\n\n"
+            return data + "\n"
+
+        # O corpo só é iterado depois de o DeadlineMiddleware sair: o prazo do pedido é reposto no gerador
+        left = remaining_time()
+
+        async def events():
+            with deadline(max(left, 0.0)) if left is not None else nullcontext():
+                try:
+                    async for event in astream_route(**params):
+                        yield encode(event)
+                except Exception as e:
+                    print(f"Erro no streaming: {e}")
+                    yield encode({'type': 'error', 'error': str(e)})
+
+        response = StreamingHttpResponse(
+            events(), content_type='text/event-stream' if sse else 'application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: não acumular a resposta
+        return response
+
+
+def parse_batch_item(item):
+    """Valida um item do lote; devolve (kwargs para aget_route, None) ou (None, mensagem de erro)."""
+    if not isinstance(item, dict):
+        return None, 'Each route must be an object'
+    try:
+        origin = (float(item['origin_lng']), float(item['origin_lat']))
+        dest = (float(item['dest_lng']), float(item['dest_lat']))
+        tolerance = float(item['tolerance']) if item.get('tolerance') else None
+    except (KeyError, TypeError, ValueError):
+        return None, 'All coordinates required'
+    return {
+        'profile': item.get('profile', 'driving'),
+        'origin': origin,
+        'dest': dest,
+        'is_tourist': item.get('tourist') in (True, 'true'),
+        'is_climatic': item.get('climatic') in (True, 'true'),
+        'tolerance': tolerance,
+    }, None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OsrmRouteBatchView(View):
+    """
+    POST {"routes": [{"origin_lng", "origin_lat", "dest_lng", "dest_lat", "profile", "tourist", "climatic"}, ...]}
+    -> {"results": [...]} pela mesma ordem, com {"error": ...} nos itens inválidos ou que falharam.
+    """
+
+    async def post(self, request):
+        try:
+            items = json.loads(request.body).get('routes')
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'error': 'routes must be a non-empty list'}, status=400)
+        if len(items) > ROUTE_BATCH_MAX_ITEMS:
+            return JsonResponse({'error': f'At most {ROUTE_BATCH_MAX_ITEMS} routes per batch'}, status=400)
+
+        fmt = negotiate_format(request.GET, request.headers.get('Accept'))
+        if fmt not in (FORMAT_JSON, FORMAT_POLYLINE6, FORMAT_MSGPACK):
+            return JsonResponse({'error': f'Unknown format: {fmt}'}, status=400)
+        parsed = [parse_batch_item(item) for item in items]
+        valid = [params for params, error in parsed if not error]
+
+        try:
+            computed = iter(await aget_routes_batch(valid))
         except Exception as e:
             print(f"Erro na View: {e}")
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({'error': str(e)}, status=500)
+
+        results = []
+        for params, error in parsed:
+            result = {'error': error} if error else next(computed)
+            results.append(result if fmt == FORMAT_JSON else compact_route(result))
+        return render_batch(results, fmt)
+
 
+def parse_coords_list(value):
+    """Aceita "lng,lat;lng,lat" (query) ou [[lng, lat], ...] (JSON)."""
+    if isinstance(value, str):
+        value = [pair.split(',') for pair in value.split(';') if pair]
+    coords = [(float(lng), float(lat)) for lng, lat in value]
+    if not coords:
+        raise ValueError
+    return coords
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OsrmTableView(View):
+    """
+    Matriz de durações/distâncias. GET ?sources=lng,lat;...&destinations=...&profile=
+    ou POST com {"sources": [[lng, lat], ...], "destinations": [...], "profile": ...} para matrizes grandes.
+    Sem destinations, a matriz é quadrada (como no OSRM).
+    """
+
+    async def get(self, request):
+        return await self.table(request.GET)
+
+    async def post(self, request):
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        return await self.table(body)
+
+    async def table(self, params):
+        try:
+            sources = parse_coords_list(params.get('sources'))
+            destinations = parse_coords_list(params.get('destinations') or params.get('sources'))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'sources (and optional destinations) required as lng,lat pairs'},
+                                status=400)
+        if len(sources) * len(destinations) > MATRIX_MAX_CELLS:
+            return JsonResponse({'error': f'At most {MATRIX_MAX_CELLS} cells per matrix'}, status=400)
+
+        try:
+            result = await aget_table(params.get('profile', 'driving'), sources, destinations)
+            return JsonResponse(result, json_dumps_params=COMPACT_JSON)
+        except Exception as e:
+            print(f"Erro na View: {e}")
+            return JsonResponse({'error': str(e)}, status=500)
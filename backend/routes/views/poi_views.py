@@ -0,0 +1,30 @@
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views import View
+from ..services.config import POI_TILE_MAX_ZOOM, POI_TILE_MAX_AGE
+from ..services.poi_tiles import get_tile
+from ..services.utils import db_sync_to_async
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match pode trazer vários ETags, fracos (W/) ou '*'
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+class PoiTileView(View):
+    async def get(self, request, z, x, y):
+        if z > POI_TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return JsonResponse({'error': 'Invalid tile coordinates'}, status=404)
+        try:
+            # Pode ler a BD se o índice de POIs mudou
+            body, etag = await db_sync_to_async(get_tile)(z, x, y)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/geo+json')
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={POI_TILE_MAX_AGE}'
+        return response